@@ -17,6 +17,23 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+from modules import config
+
+if config.server.worker_class == "gevent":
+    # Patch before anything else is imported. The server imports redis, threading and SQLAlchemy and starts
+    # the multiprocessing manager in the master, and the sockets and locks made before patching would block
+    # every greenlet of the forked workers. Only config and loguru are loaded at this point; loguru's handler
+    # lock is never held across a switch. The judge threads of the master become greenlets too, which is
+    # fine since they wait on the sandbox over HTTP.
+    import greenlet
+
+    if not getattr(greenlet, "GREENLET_USE_CONTEXT_VARS", False):
+        # datas.SessionContext, judge.lazy_queue and flask itself keep per-request state in ContextVars
+        raise RuntimeError("gevent workers need a greenlet version with contextvars support")
+    from gevent import monkey
+
+    monkey.patch_all()
+
 import os
 import subprocess
 import sys
@@ -25,10 +42,11 @@ import traceback
 from gunicorn.app.base import BaseApplication
 
 from modules import contests, constants, datas, executing, locks, login, problemsetting, server, tasks, tools, config, \
-    judge
+    judge, search
 import modules.routers
 
 app = server.app
+worker_classes = ("sync", "gevent")
 
 
 class StandaloneApplication(BaseApplication):
@@ -55,16 +73,20 @@ def main():
         judge.init()
         executing.init()
         constants.init()
+        locks.init()
         # following do nothing
         config.init()
-        locks.init()
         tools.init()
         modules.routers.init()
+        if config.server.worker_class not in worker_classes:
+            raise config.ConfigError(f"Unknown worker class {config.server.worker_class!r}")
         redis_host = os.environ.get("REDIS_HOST", "localhost")
         if not server.check_port(redis_host, 6379):
             subprocess.Popen("redis-server")
         with app.app_context():  # following need sqlalchemy
             datas.init()
+            problemsetting.migrate_legacy_versions()  # before tasks.init starts judging
+            search.init()
             login.init()
             tasks.init()
             contests.init()
@@ -77,6 +99,8 @@ def main():
         'bind': '%s:%s' % ('[::]', str(config.server.port)),
         'workers': config.server.workers,
         'timeout': config.server.timeout,
+        'worker_class': config.server.worker_class,
+        'worker_connections': config.server.worker_connections,
     }
     StandaloneApplication(app, options).run()
 
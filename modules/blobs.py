@@ -0,0 +1,224 @@
+"""
+OrangeJudge, a competitive programming platform
+
+Copyright (C) 2024-2025 LittleOrange666 (orangeminecraft123@gmail.com)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import hashlib
+import io
+import os
+import shutil
+from pathlib import Path
+from typing import BinaryIO
+
+from loguru import logger
+
+from . import tools
+from .constants import blob_path
+
+
+def blob_of(digest: str) -> Path:
+    """
+    Get the path of the blob with the given digest.
+
+    Args:
+        digest (str): The SHA-256 hex digest of the content.
+
+    Returns:
+        Path: The path of the blob.
+    """
+    return blob_path / digest[:2] / digest
+
+
+def exists(digest: str) -> bool:
+    """
+    Check whether a blob is stored.
+
+    Args:
+        digest (str): The SHA-256 hex digest of the content.
+
+    Returns:
+        bool: Whether the blob exists.
+    """
+    return blob_of(digest).is_file()
+
+
+def incoming() -> Path:
+    """
+    Get a fresh temporary path on the same filesystem as the blob store.
+
+    Returns:
+        Path: The temporary path, which does not exist yet.
+    """
+    return blob_path / f".incoming-{tools.random_string()}"
+
+
+def adopt(source: Path, digest: str | None = None) -> str:
+    """
+    Move a file into the blob store.
+
+    The file is renamed into place, so a blob is either complete or absent. If the content is
+    already stored, the file is deleted instead.
+
+    Args:
+        source (Path): The file to move; it no longer exists afterwards.
+        digest (str | None, optional): The digest of the file, if already known. Defaults to None.
+
+    Returns:
+        str: The SHA-256 hex digest of the content.
+    """
+    if digest is None:
+        digest = tools.file_hash(source)
+    target = blob_of(digest)
+    if target.is_file():
+        source.unlink()
+    else:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if source.parent != blob_path:
+            tmp = incoming()
+            shutil.move(source, tmp)
+            source = tmp
+        os.replace(source, target)
+        logger.debug(f"stored blob {digest}")
+    return digest
+
+
+def put(source: Path) -> str:
+    """
+    Store a copy of the content of a file in the blob store.
+
+    Args:
+        source (Path): The file to store, which is left untouched.
+
+    Returns:
+        str: The SHA-256 hex digest of the content.
+    """
+    digest = tools.file_hash(source)
+    if not exists(digest):
+        tmp = incoming()
+        shutil.copyfile(source, tmp)
+        adopt(tmp, digest)
+    return digest
+
+
+def link(digest: str, target: Path) -> None:
+    """
+    Make a file share the content of a blob.
+
+    The blob is hardlinked when possible and copied otherwise. An existing target is replaced
+    atomically rather than written to, so the content of other references never changes.
+
+    Args:
+        digest (str): The SHA-256 hex digest of the content.
+        target (Path): The path to create.
+    """
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f".{target.name}.{tools.random_string()}")
+    try:
+        os.link(blob_of(digest), tmp)
+    except OSError:
+        shutil.copyfile(blob_of(digest), tmp)
+    os.replace(tmp, target)
+
+
+def store(source: Path, target: Path) -> str:
+    """
+    Move a file into the blob store and place a reference to it at the target.
+
+    Args:
+        source (Path): The file to move; it no longer exists afterwards.
+        target (Path): The path of the reference.
+
+    Returns:
+        str: The SHA-256 hex digest of the content.
+    """
+    digest = adopt(source)
+    link(digest, target)
+    return digest
+
+
+def write_from(src: BinaryIO, target: Path) -> str:
+    """
+    Stream content into the blob store, hashing it on the way, and reference it at the target.
+
+    Args:
+        src (BinaryIO): The stream to read.
+        target (Path): The path of the reference.
+
+    Returns:
+        str: The SHA-256 hex digest of the content.
+    """
+    h = hashlib.sha256()
+    tmp = incoming()
+    with tmp.open("wb") as f:
+        for chunk in iter(lambda: src.read(1 << 20), b""):
+            h.update(chunk)
+            f.write(chunk)
+    digest = adopt(tmp, h.hexdigest())
+    link(digest, target)
+    return digest
+
+
+def write(content: bytes, target: Path) -> str:
+    """
+    Store content in the blob store and reference it at the target.
+
+    Args:
+        content (bytes): The content.
+        target (Path): The path of the reference.
+
+    Returns:
+        str: The SHA-256 hex digest of the content.
+    """
+    return write_from(io.BytesIO(content), target)
+
+
+def refcount(digest: str) -> int:
+    """
+    Count the references to a blob.
+
+    Every reference is a hardlink of the blob, so this is its link count minus the store's own.
+
+    Args:
+        digest (str): The SHA-256 hex digest of the content.
+
+    Returns:
+        int: The number of references, or 0 if the blob is not stored.
+    """
+    if not exists(digest):
+        return 0
+    return blob_of(digest).stat().st_nlink - 1
+
+
+def collect() -> int:
+    """
+    Delete the blobs that are no longer referenced, along with leftover temporary files.
+
+    This must only run while nothing is writing to the store, e.g. at startup.
+
+    Returns:
+        int: The number of files deleted.
+    """
+    removed = 0
+    for file in blob_path.glob(".incoming-*"):
+        file.unlink(missing_ok=True)
+        removed += 1
+    for file in blob_path.glob("*/*"):
+        if file.stat().st_nlink <= 1:
+            file.unlink(missing_ok=True)
+            removed += 1
+    if removed:
+        logger.info(f"removed {removed} unreferenced blobs")
+    return removed
@@ -97,16 +97,36 @@ class ServerConfig(metaclass=DataMeta):
         port (int): The port number for the server.
         workers (int): The number of WSGI workers.
         timeout (int): The WSGI timeout duration.
+        worker_class (str): The WSGI worker type, "sync" or "gevent".
+        worker_connections (int): The number of concurrent connections of a gevent worker.
         limits (list[str]): The list of request rate limits.
         file_limit (str): The rate limit for file downloads.
+        admin_fast (bool): Whether admins ignore the request rate limits.
+        server_name (str): The name of the server.
+        file_offload (str): How files are sent: "none" sends them from Python, "nginx" emits
+            X-Accel-Redirect and "apache" emits X-Sendfile for the front proxy to send them.
+        file_offload_prefix (str): The internal nginx location that maps to the server directory.
+        search_submissions (bool): Whether the source code of submissions is indexed for search.
+        api_orjson (bool): Whether API responses are serialized with orjson, if it is installed.
+        api_compress_size (int): The size in bytes from which API responses are compressed, 0 to disable.
+        wait_timeout (int): The longest time in seconds a request may wait for a submission to change.
+            Every waiting request would hold a sync worker, so requests only wait in gevent mode.
     """
     port: int = ConfigProperty("此伺服器的連接埠", int, 8080)
     workers: int = ConfigProperty("WSGI並行數量", int, 4)
     timeout: int = ConfigProperty("WSGI超時時間", int, 120)
+    worker_class: str = ConfigProperty("WSGI工作模式(sync/gevent)", str, "sync")
+    worker_connections: int = ConfigProperty("gevent模式下每個WSGI工作程序的並行連線數", int, 1000)
     limits: list[str] = ConfigProperty("請求頻率限制列表", list, ("30 per 30 second", "3 per 1 second"), "limits")
     file_limit: str = ConfigProperty("檔案下載頻率限制", str, "30 per 5 second", "limit")
     admin_fast: bool = ConfigProperty("管理員可無視請求頻率限制", bool, False)
     server_name: str = ConfigProperty("伺服器名稱", str, "OrangeJudge")
+    file_offload: str = ConfigProperty("檔案傳送交由前端代理(none/nginx/apache)", str, "none")
+    file_offload_prefix: str = ConfigProperty("nginx內部檔案路徑前綴", str, "/internal_files/")
+    search_submissions: bool = ConfigProperty("是否索引提交原始碼以供搜尋", bool, False)
+    api_orjson: bool = ConfigProperty("API使用orjson序列化", bool, False)
+    api_compress_size: int = ConfigProperty("API回應壓縮門檻(bytes, 0為停用)", int, 0)
+    wait_timeout: int = ConfigProperty("等待提交結果的最長時間(s)", int, 25)
 
 
 @my_dataclass
@@ -122,6 +142,14 @@ class JudgeConfig(metaclass=DataMeta):
         file_size (int): The file size limit in KB.
         save_period (int): The save period for the judge system.
         test_langs (bool): Whether to check language environments.
+        contest_reserved (int): The percentage of workers reserved for running contest submissions.
+        practice_reserved (int): The percentage of workers reserved for practice submissions.
+        test_reserved (int): The percentage of workers reserved for custom tests.
+        rejudge_reserved (int): The percentage of workers reserved for rejudges.
+        build_workers (int): The number of concurrent workers for problem background actions.
+        gen_workers (int): The number of testcases generated concurrently by one background action.
+        zip_max_size (int): The limit of the total uncompressed size of an uploaded zip file in MB.
+        zip_max_ratio (int): The limit of the compression ratio of a member of an uploaded zip file.
     """
     workers: int = ConfigProperty("評測系統並行數量", int, 1)
     period: int = ConfigProperty("評測系統掃描週期(s)", int, 3)
@@ -130,6 +158,14 @@ class JudgeConfig(metaclass=DataMeta):
     file_size: int = ConfigProperty("檔案大小限制(KB)", int, 100)
     save_period: int = ConfigProperty("評測系統儲存週期(每完成幾筆測資更新狀態)", int, 3)
     test_langs: bool = ConfigProperty("是否檢查各語言環境", bool, True)
+    contest_reserved: int = ConfigProperty("比賽中提交保留的評測並行比例(%)", int, 50)
+    practice_reserved: int = ConfigProperty("練習提交保留的評測並行比例(%)", int, 25)
+    test_reserved: int = ConfigProperty("自訂測試保留的評測並行比例(%)", int, 0)
+    rejudge_reserved: int = ConfigProperty("重新評測保留的評測並行比例(%)", int, 0)
+    build_workers: int = ConfigProperty("題目背景工作並行數量", int, 2)
+    gen_workers: int = ConfigProperty("單一題目測資生成並行數量", int, 4)
+    zip_max_size: int = ConfigProperty("上傳壓縮檔解壓後大小限制(MB)", int, 4096)
+    zip_max_ratio: int = ConfigProperty("上傳壓縮檔壓縮比限制", int, 200)
 
 
 @my_dataclass
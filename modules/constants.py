@@ -107,10 +107,16 @@ data_path = Path("data").absolute()
 
 problem_path = data_path / "problems"
 
+problem_versions_path = data_path / "problem_versions"
+
+blob_path = data_path / "blobs"
+
 preparing_problem_path = data_path / "preparing_problems"
 
 tmp_path = Path("tmp").absolute()
 
+lock_path = tmp_path / "locks"
+
 contest_path = data_path / "contests"
 
 lang_path = Path("langs").absolute()
@@ -134,7 +140,10 @@ error_filename = "stderr.txt"
 
 def init():
     problem_path.mkdir(exist_ok=True, parents=True)
+    problem_versions_path.mkdir(exist_ok=True, parents=True)
+    blob_path.mkdir(exist_ok=True, parents=True)
     preparing_problem_path.mkdir(exist_ok=True, parents=True)
     tmp_path.mkdir(exist_ok=True, parents=True)
+    lock_path.mkdir(exist_ok=True, parents=True)
     contest_path.mkdir(exist_ok=True, parents=True)
     log_path.mkdir(exist_ok=True, parents=True)
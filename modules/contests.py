@@ -17,19 +17,21 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 import csv
+import json
+import math
 import multiprocessing
 import time
 import traceback
 from datetime import datetime, timedelta
-from io import BytesIO, TextIOWrapper
+from io import BytesIO, TextIOWrapper, StringIO
 from multiprocessing import Process
 from time import sleep
 
 from cachetools import TTLCache, cached
-from flask import request
+from flask import request, Response, stream_with_context
 from flask_login import current_user
 from loguru import logger
-from openpyxl.reader.excel import load_workbook
+from sqlalchemy.orm.attributes import flag_modified
 from werkzeug.datastructures import ImmutableMultiDict
 
 from . import tools, datas, tasks, objs, server, login
@@ -37,6 +39,16 @@ from .objs import Permission, ContestStatus
 
 actions = tools.Switcher()
 
+bulk_chunk_size = 500
+
+standing_batch_size = 500
+
+export_formats: dict[str, tuple[str, str]] = {
+    "csv": ("csv", "text/csv"),
+    "xlsx": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "ndjson": ("ndjson", "application/x-ndjson"),
+}
+
 
 def create_contest(name: str, user: datas.User) -> str:
     if len(name) > 120:
@@ -101,12 +113,31 @@ def remove_problem(form: ImmutableMultiDict[str, str], cdat: datas.Contest, dat:
 @actions.bind
 def add_participant(form: ImmutableMultiDict[str, str], cdat: datas.Contest, dat: objs.ContestData) -> str:
     user: datas.User = datas.first_or_404(datas.User, username=form["username"].lower())
-    if user.username in dat.participants:
+    if (cdat.has_participant(user.id) or
+            not datas.add_unique(datas.ContestParticipant(contest_id=cdat.id, user_id=user.id, is_virtual=False))):
         server.custom_abort(409, "User is already a participant")
-    dat.participants.append(user.username)
     return "participants"
 
 
+def bulk_user_ids(usernames: list[str]) -> dict[str, int]:
+    """
+    Resolve usernames to user IDs with one query per chunk instead of one query per user.
+
+    Args:
+        usernames (list[str]): The usernames to resolve.
+
+    Returns:
+        dict[str, int]: A dictionary mapping the existing usernames to their user IDs.
+    """
+    ret = {}
+    for i in range(0, len(usernames), bulk_chunk_size):
+        chunk = usernames[i:i + bulk_chunk_size]
+        rows = datas.do_filter(datas.User, datas.User.username.in_(chunk)).with_entities(datas.User.username,
+                                                                                         datas.User.id).all()
+        ret.update({username: user_id for username, user_id in rows})
+    return ret
+
+
 @actions.bind
 def add_participants(form: ImmutableMultiDict[str, str], cdat: datas.Contest, dat: objs.ContestData) -> str:
     file = request.files["file"]
@@ -117,7 +148,8 @@ def add_participants(form: ImmutableMultiDict[str, str], cdat: datas.Contest, da
         server.custom_abort(400, "Unsupported file type")
     try:
         in_memory_file = BytesIO(file.stream.read())
-        if ext == ".xlsx":
+        if ext == "xlsx":
+            from openpyxl.reader.excel import load_workbook
             wb = load_workbook(in_memory_file, data_only=True)
             ws = wb.active
             arr = [[str(cell.value) for cell in row] for row in ws.iter_rows()]
@@ -134,34 +166,29 @@ def add_participants(form: ImmutableMultiDict[str, str], cdat: datas.Contest, da
         out = [line[0].strip() for line in arr if len(line) > 0 and line[0].strip() != ""]
     else:
         i0 = arr[0].index("username")
-        out = [line[i0].strip() for line in arr if len(line) > i0 and line[i0].strip() != ""]
+        out = [line[i0].strip() for line in arr[1:] if len(line) > i0 and line[i0].strip() != ""]
     if len(out) < 1:
         server.custom_abort(400, "No valid usernames found in file")
-    bad_usernames = []
-    for username in out:
-        username = username.lower()
-        if username in dat.participants:
-            continue
-        user: datas.User = datas.first(datas.User, username=username)
-        if user is None:
-            bad_usernames.append(username)
+    usernames = list(dict.fromkeys(username.lower() for username in out))
+    user_ids = bulk_user_ids(usernames)
+    bad_usernames = [username for username in usernames if username not in user_ids]
     if len(bad_usernames) > 0:
         server.custom_abort(400, "The following usernames do not exist: " + ", ".join(bad_usernames))
         return "participants"
-    for username in out:
-        username = username.lower()
-        if username in dat.participants:
-            continue
-        dat.participants.append(username)
+    existing = {row[0] for row in cdat.participations.filter_by(is_virtual=False)
+                .with_entities(datas.ContestParticipant.user_id).all()}
+    datas.add(*(datas.ContestParticipant(contest_id=cdat.id, user_id=user_ids[username], is_virtual=False)
+                for username in usernames if user_ids[username] not in existing))
     return "participants"
 
 
 @actions.bind
 def remove_participant(form: ImmutableMultiDict[str, str], cdat: datas.Contest, dat: objs.ContestData) -> str:
     user: datas.User = datas.first_or_404(datas.User, username=form["username"].lower())
-    if user.username not in dat.participants:
+    obj = cdat.participations.filter_by(user_id=user.id, is_virtual=False).first()
+    if obj is None:
         server.custom_abort(409, "User is not a participant")
-    dat.participants.remove(user.username)
+    datas.delete(obj)
     return "participants"
 
 
@@ -291,13 +318,62 @@ def action(form: ImmutableMultiDict[str, str], cdat: datas.Contest):
     cdat.datas = dat
     datas.add(cdat)
     if form["action"] == "change_settings":
-        for the_per in cdat.periods:
-            the_per: datas.Period
-            the_per.end_time = the_per.start_time + timedelta(minutes=dat.elapsed)
-        datas.add(*cdat.periods)
+        datas.flush()
+        cdat.set_period_duration(dat.elapsed)
     return f"/contest/{cid}#{tp}"
 
 
+def add_virtual_participant(cdat: datas.Contest, user_id: int, start_time: datetime) -> int:
+    """
+    Register a user as a virtual participant starting at the given time.
+
+    Virtual participants starting at the same time share one virtual period.
+
+    Args:
+        cdat (datas.Contest): The contest.
+        user_id (int): The ID of the user.
+        start_time (datetime): The start time of the virtual participation.
+
+    Returns:
+        int: The ID of the virtual period.
+    """
+    per = cdat.periods.filter_by(is_virtual=True, start_time=start_time).first()
+    created = per is None
+    if created:
+        per = datas.Period(start_time=start_time,
+                           end_time=start_time + timedelta(minutes=cdat.datas.elapsed),
+                           contest=cdat,
+                           is_virtual=True)
+        datas.add(per)
+        datas.flush()
+    if not datas.add_unique(datas.ContestParticipant(contest_id=cdat.id, user_id=user_id, is_virtual=True,
+                                                     period_id=per.id)):
+        if created:
+            datas.delete(per)
+        server.custom_abort(409, "User is already a virtual participant")
+    return per.id
+
+
+def problem_statuses(info: objs.ContestData, user: datas.User) -> dict[str, datas.UserProblemStatus]:
+    """
+    Get the statuses of a user on the problems of a contest.
+
+    Args:
+        info (objs.ContestData): The contest data.
+        user (datas.User): The user.
+
+    Returns:
+        dict[str, datas.UserProblemStatus]: A dictionary mapping contest problem indexes to statuses.
+    """
+    indexes = {v.pid: k for k, v in info.problems.items()}
+    if not indexes:
+        return {}
+    rows = (datas.do_filter(datas.Problem, datas.Problem.pid.in_(list(indexes)))
+            .with_entities(datas.Problem.id, datas.Problem.pid).all())
+    statuses = user.problem_status_map([row[0] for row in rows])
+    return {indexes[pid]: statuses[idx] for idx, pid in rows if idx in statuses}
+
+
 def check_super_access(dat: datas.Contest, user: login.User = None) -> bool:
     if user is None:
         user = current_user
@@ -317,7 +393,7 @@ def check_access(dat: datas.Contest, user: login.User = None):
     if dat.hidden:
         server.custom_abort(404, "Contest not found")
     if user.is_authenticated:
-        if user.id in info.participants:
+        if dat.has_participant(user.data.id):
             if per.is_running():
                 return
             if per.is_over() and info.practice != objs.PracticeType.no:
@@ -354,15 +430,16 @@ def check_status(dat: datas.Contest, user: login.User = None) -> tuple[ContestSt
     if user is None:
         user = current_user
     if user.is_authenticated:
-        if user.id in info.virtual_participants:
-            vir_per: datas.Period = datas.get_by_id(datas.Period, info.virtual_participants[user.id])
+        vir_per_id = dat.virtual_period_of(user.data.id)
+        if vir_per_id is not None:
+            vir_per: datas.Period = datas.get_by_id(datas.Period, vir_per_id)
             if vir_per is None:
                 server.custom_abort(409, "Virtual period not found for user")
             if not vir_per.is_started():
                 return ContestStatus.waiting_virtual, vir_per.start_time.timestamp(), False
             if vir_per.is_running():
                 return ContestStatus.running_virtual, vir_per.end_time.timestamp(), True
-        if user.id in info.participants:
+        if dat.has_participant(user.data.id):
             if not per.is_started():
                 return ContestStatus.waiting, per.start_time.timestamp(), False
             if per.is_running():
@@ -382,11 +459,10 @@ def check_period(dat: datas.Contest, user: login.User = None) -> int:
     if user is None:
         user = current_user
     main_per = datas.get_or_404(datas.Period, dat.main_period_id)
-    info = dat.datas
-    if user.id in info.participants and main_per.is_running():
+    if main_per.is_running() and dat.has_participant(user.data.id):
         return dat.main_period_id
-    if user.id in info.virtual_participants:
-        per_id = info.virtual_participants[user.id]
+    per_id = dat.virtual_period_of(user.data.id)
+    if per_id is not None:
         cur_per = datas.get_or_404(datas.Period, per_id)
         if cur_per.is_running():
             return per_id
@@ -414,7 +490,7 @@ def get_standing(cid: str):
         ret.append({"user": mp[dat.user_id],
                     "pid": rmp[dat.pid],
                     "scores": scores,
-                    "total_score": res.total_score,
+                    "total_score": float(res.total_score),
                     "time": dat.time.timestamp(),
                     "pretest": dat.just_pretest,
                     "per": dat.period_id})
@@ -430,8 +506,215 @@ def get_standing(cid: str):
             "penalty": info.penalty,
             "pers": pers,
             "main_per": cdat.main_period_id,
-            "participants": info.participants,
-            "virtual_participants": info.virtual_participants}
+            "participants": cdat.participant_names(),
+            "virtual_participants": cdat.virtual_participant_map()}
+
+
+def can_see_standing(cdat: datas.Contest, user: login.User = None) -> bool:
+    """
+    Check if the standings of a contest are visible to the given user.
+
+    Args:
+        cdat (datas.Contest): The contest.
+        user (login.User, optional): The user. Defaults to the current user.
+
+    Returns:
+        bool: True if the user can see the standings, False otherwise.
+    """
+    info = cdat.datas
+    dt = time.time() - info.start
+    dt = dt / 60 - info.elapsed
+    can_see = (info.standing.public and
+               (dt <= -info.standing.start_freeze or dt >= info.standing.end_freeze))
+    return can_see or check_super_access(cdat, user)
+
+
+def iter_standing_submissions(cdat: datas.Contest):
+    """
+    Iterate over the completed submissions of a contest in submission order.
+
+    Only the columns needed for ranking are loaded, in batches of `standing_batch_size` rows,
+    so the memory usage does not grow with the number of submissions.
+
+    Args:
+        cdat (datas.Contest): The contest.
+
+    Yields:
+        tuple: (username, display_name, pid, result, time, period_id) of each submission.
+    """
+    query = (cdat.submissions.filter_by(completed=True)
+             .join(datas.User, datas.User.id == datas.Submission.user_id)
+             .order_by(datas.Submission.time, datas.Submission.id)
+             .with_entities(datas.User.username, datas.User.display_name, datas.Submission.pid,
+                            datas.Submission.result, datas.Submission.time, datas.Submission.period_id)
+             .yield_per(standing_batch_size))
+    yield from query
+
+
+def compute_standing(cdat: datas.Contest, official_only: bool = False) -> tuple[list[str], list[dict]]:
+    """
+    Compute the ranked standings of a contest on the server side.
+
+    The ranking follows the same rules as the scoreboard in the contest page. Memory usage is
+    bounded by the number of (user, period) rows, not by the number of submissions.
+
+    Args:
+        cdat (datas.Contest): The contest.
+        official_only (bool, optional): Only keep rows of the main period. Defaults to False.
+
+    Returns:
+        tuple[list[str], list[dict]]: The problem indices and the ranked rows.
+    """
+    info = cdat.datas
+    pids = list(info.problems.keys())
+    rmp = {v.pid: k for k, v in info.problems.items()}
+    main_per = cdat.main_period_id
+    starts = {per.id: per.start_time.timestamp() for per in cdat.periods}
+    is_icpc = info.type is objs.ContestType.icpc
+    rows: dict[tuple[str, int | None], dict] = {}
+
+    def get_row(username: str, display_name: str, per: int | None) -> dict:
+        key = (username, per)
+        if key not in rows:
+            rows[key] = {"user": username, "display_name": display_name, "period": per,
+                         "is_main": per == main_per, "is_practice": per is None,
+                         "total_score": 0, "penalty": 0, "last_update": 0,
+                         "cells": {pid: {"score": 0, "tries": 0, "time": 0, "cnt": 0, "groups": {}}
+                                   for pid in pids}}
+        return rows[key]
+
+    participants = (cdat.participations.join(datas.User, datas.User.id == datas.ContestParticipant.user_id)
+                    .order_by(datas.ContestParticipant.id)
+                    .with_entities(datas.User.username, datas.User.display_name,
+                                   datas.ContestParticipant.is_virtual, datas.ContestParticipant.period_id))
+    for username, display_name, is_virtual, period_id in participants:
+        get_row(username, display_name, period_id if is_virtual else main_per)
+    for username, display_name, pid, result, sub_time, per in iter_standing_submissions(cdat):
+        if pid not in rmp:
+            continue
+        result = result or {}
+        row = get_row(username, display_name, per)
+        cell = row["cells"][rmp[pid]]
+        sub_time = sub_time.timestamp()
+        if is_icpc:
+            start_time = starts.get(per if per else main_per, sub_time)
+            cur_time = math.floor((sub_time - start_time) / 60)
+            score = result.get("total_score", 0)
+            if score > cell["score"]:
+                cell["score"] = score
+                cell["tries"] = cell["cnt"]
+                cell["time"] = cur_time
+            cell["cnt"] += 1
+            row["total_score"] = sum(o["score"] for o in row["cells"].values())
+            row["penalty"] = sum(o["time"] + o["tries"] * info.penalty
+                                 for o in row["cells"].values() if o["score"] > 0)
+        else:
+            for k, v in result.get("group_results", {}).items():
+                cell["groups"][k] = max(cell["groups"].get(k, 0), v.get("gained_score", 0))
+            cell["score"] = sum(cell["groups"].values())
+            total = sum(o["score"] for o in row["cells"].values())
+            if total != row["total_score"]:
+                row["total_score"] = total
+                row["last_update"] = sub_time - (starts.get(per, sub_time) if per else 0)
+    out = sorted(rows.values(), key=lambda o: (o["is_practice"], -o["total_score"],
+                                               o["penalty"] if is_icpc else o["last_update"]))
+    if official_only:
+        out = [o for o in out if o["is_main"]]
+    cur_rank = 1
+    for row in out:
+        row["rank"] = ""
+        if row["is_main"]:
+            row["rank"] = str(cur_rank)
+            cur_rank += 1
+        elif row["is_practice"]:
+            row["rank"] = "*"
+    return pids, out
+
+
+def iter_standing_table(cdat: datas.Contest, official_only: bool = False):
+    """
+    Iterate over the standings of a contest as flat table rows, starting with the header.
+
+    Args:
+        cdat (datas.Contest): The contest.
+        official_only (bool, optional): Only keep rows of the main period. Defaults to False.
+
+    Yields:
+        list: The header, then one list of cells per ranked row.
+    """
+    is_icpc = cdat.datas.type is objs.ContestType.icpc
+    pids, rows = compute_standing(cdat, official_only)
+    yield ["rank", "username", "display_name", "score", "penalty" if is_icpc else "time"] + pids
+    for row in rows:
+        line = [row["rank"], row["user"], row["display_name"], row["total_score"]]
+        if is_icpc:
+            line.append("" if row["is_practice"] else row["penalty"])
+        else:
+            line.append("" if row["is_practice"] else math.floor(row["last_update"] / 60))
+        for pid in pids:
+            cell = row["cells"][pid]
+            if is_icpc and not row["is_practice"]:
+                line.append(f"{cell['score']}/{cell['time']}+{cell['tries']}")
+            else:
+                line.append(cell["score"])
+        yield line
+
+
+def iter_standing_csv(cdat: datas.Contest, official_only: bool = False):
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    for line in iter_standing_table(cdat, official_only):
+        writer.writerow(line)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def iter_standing_ndjson(cdat: datas.Contest, official_only: bool = False):
+    pids, rows = compute_standing(cdat, official_only)
+    for row in rows:
+        row["cells"] = {pid: {k: v for k, v in cell.items() if k not in ("cnt", "groups")}
+                        for pid, cell in row["cells"].items()}
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+def iter_standing_xlsx(cdat: datas.Contest, official_only: bool = False):
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("standing")
+    for line in iter_standing_table(cdat, official_only):
+        ws.append(line)
+    with tools.TempFile(".xlsx") as tmp:
+        wb.save(tmp.path)
+        with tmp.path.open("rb") as f:
+            while chunk := f.read(65536):
+                yield chunk
+
+
+def export_standing(cdat: datas.Contest, fmt: str, official_only: bool = False) -> Response:
+    """
+    Stream the standings of a contest as a downloadable file.
+
+    Args:
+        cdat (datas.Contest): The contest.
+        fmt (str): The export format, one of `export_formats`.
+        official_only (bool, optional): Only keep rows of the main period. Defaults to False.
+
+    Returns:
+        Response: A streaming response of the exported standings.
+    """
+    if fmt not in export_formats:
+        server.custom_abort(400, "Unsupported export format")
+    ext, mimetype = export_formats[fmt]
+    match fmt:
+        case "csv":
+            gen = iter_standing_csv(cdat, official_only)
+        case "xlsx":
+            gen = iter_standing_xlsx(cdat, official_only)
+        case _:
+            gen = iter_standing_ndjson(cdat, official_only)
+    return Response(stream_with_context(gen), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename=standing_{cdat.cid}.{ext}"})
 
 
 def reject(dat: datas.Submission):
@@ -448,39 +731,41 @@ def contest_worker():
     while True:
         try:
             with datas.SessionContext():
-                for dat in datas.get_all(datas.Period, running=True):
-                    if dat.is_over():
-                        dat.running = False
-                        dat.ended = True
-                        cdat: datas.Contest = dat.contest
-                        pretest = cdat.datas.pretest
-                        if pretest != objs.PretestType.no:
-                            submissions = dat.submissions.filter_by(just_pretest=True).all()
-                            dic: dict[tuple[int, str], datas.Submission] = {}
-                            datas.add(*submissions)
-                            for submission in submissions:
-                                submission: datas.Submission
-                                submission.just_pretest = False
-                                key = (submission.user_id, submission.pid)
-                                if submission.simple_result.lower() not in ("je", "ce"):
-                                    reject(submission)
-                                    if pretest == objs.PretestType.all:
-                                        tasks.rejudge(submission)
-                                    else:
-                                        dic[key] = submission
-                            if pretest == objs.PretestType.last:
-                                for v in dic.values():
-                                    tasks.rejudge(v)
-                            datas.add(*submissions)
+                for dat in datas.do_filter(datas.Period, datas.Period.running.is_(True),
+                                           datas.Period.end_time < datetime.now()).all():
+                    dat.running = False
+                    dat.ended = True
+                    cdat: datas.Contest = dat.contest
+                    pretest = cdat.datas.pretest
+                    if pretest != objs.PretestType.no:
+                        submissions = dat.submissions.filter_by(just_pretest=True).all()
+                        dic: dict[tuple[int, str], datas.Submission] = {}
+                        datas.add(*submissions)
+                        for submission in submissions:
+                            submission: datas.Submission
+                            submission.just_pretest = False
+                            key = (submission.user_id, submission.pid)
+                            if submission.simple_result.lower() not in ("je", "ce"):
+                                reject(submission)
+                                if pretest == objs.PretestType.all:
+                                    tasks.rejudge(submission)
+                                else:
+                                    dic[key] = submission
+                        if pretest == objs.PretestType.last:
+                            for v in dic.values():
+                                tasks.rejudge(v)
+                        datas.add(*submissions)
                     datas.add(dat)
             sleep(5)
             with datas.SessionContext():
-                for dat in datas.get_all(datas.Period, running=False, ended=False):
+                now = datetime.now()
+                for dat in datas.do_filter(datas.Period, datas.Period.running.is_(False),
+                                           datas.Period.ended.is_(False), datas.Period.start_time <= now,
+                                           datas.Period.end_time >= now).all():
                     dat: datas.Period
-                    if dat.is_running():
-                        dat.running = True
-                        dat.judging = True
-                        datas.add(dat)
+                    dat.running = True
+                    dat.judging = True
+                    datas.add(dat)
             sleep(5)
             with datas.SessionContext():
                 for dat in datas.get_all(datas.Period, running=False, ended=True, judging=True):
@@ -490,11 +775,12 @@ def contest_worker():
                         datas.add(dat)
             sleep(5)
             with datas.SessionContext():
-                for dat in datas.get_all(datas.Period, running=False, ended=True, judging=False):
+                for dat in datas.do_filter(datas.Period, datas.Period.running.is_(False),
+                                           datas.Period.ended.is_(True), datas.Period.judging.is_(False),
+                                           datas.Period.start_time > datetime.now()).all():
                     dat: datas.Period
-                    if not dat.is_started():
-                        dat.ended = False
-                        datas.add(dat)
+                    dat.ended = False
+                    datas.add(dat)
             sleep(5)
         except Exception as e:
             logger.error(f"Error in contest worker: {e}")
@@ -502,5 +788,37 @@ def contest_worker():
             time.sleep(60)
 
 
+def migrate_participants():
+    """
+    Move participants stored in the legacy contest JSON into the contest_participants table.
+    """
+    with datas.SessionContext():
+        for cdat in datas.get_all(datas.Contest):
+            cdat: datas.Contest
+            raw = dict(cdat.data)
+            names: list[str] = raw.pop("participants", None) or []
+            virtuals: dict[str, int] = raw.pop("virtual_participants", None) or {}
+            if "participants" not in cdat.data and "virtual_participants" not in cdat.data:
+                continue
+            user_ids = bulk_user_ids(list(set(names) | set(virtuals.keys())))
+            existing = {(user_id, bool(is_virtual)) for user_id, is_virtual in cdat.participations.with_entities(
+                datas.ContestParticipant.user_id, datas.ContestParticipant.is_virtual).all()}
+            for username in dict.fromkeys(names):
+                if username in user_ids and (user_ids[username], False) not in existing:
+                    datas.add(datas.ContestParticipant(contest_id=cdat.id, user_id=user_ids[username],
+                                                       is_virtual=False))
+            for username, period_id in virtuals.items():
+                if username in user_ids and (user_ids[username], True) not in existing:
+                    datas.add(datas.ContestParticipant(contest_id=cdat.id, user_id=user_ids[username],
+                                                       is_virtual=True, period_id=period_id))
+            cdat.data = raw
+            flag_modified(cdat, "data")
+            datas.add(cdat)
+            datas.flush()
+            logger.info(f"migrated {len(names)} participants and {len(virtuals)} virtual participants "
+                        f"of contest {cdat.cid}")
+
+
 def init():
+    migrate_participants()
     Process(target=contest_worker).start()
@@ -17,6 +17,7 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import functools
 import os
 import re
 import shutil
@@ -24,20 +25,53 @@ from html.parser import HTMLParser
 from pathlib import Path
 from typing import Callable
 
-import markdown
-import mdx_math
 from pygments import highlight, lexers
 from pygments.formatters import HtmlFormatter
+from pygments.lexer import Lexer
+from pygments.util import ClassNotFound
 
 from . import tools, constants
 from .constants import preparing_problem_path
 from .constants import tmp_path
 
-prepares = {"language-" + k: lexers.get_lexer_by_name(k) for lexer in lexers.get_all_lexers() for k in lexer[1]}
+# bump this whenever a change to the renderer changes its output, to invalidate cached statements
+renderer_version = "1"
 the_headers = ("h1", "h2", "h3")
 the_contents = ("h1", "h2", "h3", "h4", "h5", "h6", "p", "pre", "ol", "ul")
 
 
+@functools.cache
+def get_lexer(alias: str) -> Lexer | None:
+    """
+    Get the pygments lexer of an alias, creating it on first use.
+
+    Args:
+        alias (str): The alias of the language, e.g. "cpp".
+
+    Returns:
+        Lexer | None: The lexer, or None if no lexer has this alias.
+    """
+    try:
+        return lexers.get_lexer_by_name(alias)
+    except ClassNotFound:
+        return None
+
+
+@functools.lru_cache(maxsize=1024)
+def highlight_code(code: str, alias: str) -> str:
+    """
+    Highlight a code block, reusing the result for identical blocks.
+
+    Args:
+        code (str): The code.
+        alias (str): The alias of the language; unknown aliases are rendered as plain text.
+
+    Returns:
+        str: The highlighted HTML.
+    """
+    return highlight(code, get_lexer(alias) or get_lexer("text"), HtmlFormatter())
+
+
 def addattr(attrs: dict[str, str], name: str, new: str):
     if name in attrs:
         attrs[name] += " " + new
@@ -62,7 +96,7 @@ class Codehightlighter(HTMLParser):
         attrs = {k: v for k, v in attrs}
         if tag == "code":
             for k, v in attrs.items():
-                if k == "class" and v in prepares:
+                if k == "class" and v.startswith("language-") and get_lexer(v[9:]) is not None:
                     self.prepare = v
                     break
             else:
@@ -100,7 +134,7 @@ class Codehightlighter(HTMLParser):
             self.text.append(data)
         else:
             # print(data)
-            self.text.append(highlight(data, prepares[self.prepare], HtmlFormatter()))
+            self.text.append(highlight_code(data, self.prepare[9:]))
 
     def solve(self, text: str):
         self.text = []
@@ -133,6 +167,8 @@ def run_markdown(source: str) -> str:
         source = f"{source[:get.span(1)[0]]}{get.group(1).replace(' ', '&nbsp;')}{source[get.span(1)[1]:]}"
         get = reg1.search(source)
     # 主要部分
+    import markdown
+    import mdx_math
     html = markdown.markdown(source, extensions=['tables', 'md_in_html', 'fenced_code', 'attr_list', 'def_list', 'toc',
                                                  'nl2br', mdx_math.makeExtension(enable_dollar_delimiter=True)])
     # spoiler轉成details
@@ -27,10 +27,11 @@ from mistune.plugins import footnotes, \
     task_lists, def_list, abbr, spoiler, formatting
 from pygments import highlight
 from pygments.formatters import HtmlFormatter
-from pygments.lexers import get_lexer_by_name, guess_lexer
+from pygments.lexers import guess_lexer
 from pygments.util import ClassNotFound
 
 from . import tools, constants
+from .createhtml import get_lexer
 from .constants import preparing_problem_path
 from .constants import tmp_path
 
@@ -40,16 +41,12 @@ the_contents = ("h1", "h2", "h3", "h4", "h5", "h6", "p", "pre", "ol", "ul")
 
 class HighlightRenderer(mistune.HTMLRenderer):
     def block_code(self, code, info=None):
-        if info:
-            try:
-                lexer = get_lexer_by_name(info.strip())
-            except ClassNotFound:
-                lexer = guess_lexer(code)
-        else:
+        lexer = get_lexer(info.strip()) if info else None
+        if lexer is None:
             try:
                 lexer = guess_lexer(code)
             except ClassNotFound:
-                lexer = get_lexer_by_name("text")
+                lexer = get_lexer("text")
 
         formatter = HtmlFormatter()
         return highlight(code, lexer, formatter)
@@ -20,20 +20,21 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 import os
 from contextlib import contextmanager
 from contextvars import ContextVar
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import TypeVar, Type
+from typing import TypeVar, Type, Callable
 
 from flask import has_request_context
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 from flask_sqlalchemy.query import Query
 from flask_sqlalchemy.session import Session
-from sqlalchemy.exc import PendingRollbackError
+from sqlalchemy import update
+from sqlalchemy.exc import PendingRollbackError, IntegrityError
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm.attributes import flag_modified
 
-from . import server, objs
+from . import server, objs, config
 from .constants import problem_path, contest_path, submission_path
 from .objs import ContestData, ProblemInfo, SubmissionData, SubmissionResult
 
@@ -58,6 +59,10 @@ elif all(k in os.environ for k in ("POSTGRES_DB", "POSTGRES_USER", "POSTGRES_PAS
     PASSWORD = os.environ["POSTGRES_PASSWORD"]
     HOST = os.environ["POSTGRES_HOST"]
     postgres_url = f"postgresql+psycopg2://{USER}:{PASSWORD}@{HOST}/{DB}"
+    if config.server.worker_class == "gevent":
+        # psycopg2 waits inside its C extension, which monkey-patching cannot reach
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SQLALCHEMY_DATABASE_URI'] = postgres_url
     app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
@@ -108,6 +113,7 @@ class User(db.Model):
         contests (relationship): The contests created by the user.
         announcements (relationship): The announcements made by the user.
         api_key (str): The API key for the user, if applicable.
+        problem_statuses (relationship): The materialized statuses of the user on problems.
     """
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -122,6 +128,7 @@ class User(db.Model):
     contests = db.relationship('Contest', backref='user', lazy='dynamic')
     announcements = db.relationship('Announcement', backref='user', lazy='dynamic')
     api_key = db.Column(db.String(64), nullable=True)
+    problem_statuses = db.relationship('UserProblemStatus', backref='user', lazy='dynamic')
 
     def __init__(self, **kwargs):
         """
@@ -141,6 +148,39 @@ class User(db.Model):
         """
         return self.permissions.split(";")
 
+    def problem_status_map(self, problem_ids: list[int]) -> dict[int, 'UserProblemStatus']:
+        """
+        Get the statuses of the user on the given problems.
+
+        Args:
+            problem_ids (list[int]): The IDs of the problems.
+
+        Returns:
+            dict[int, UserProblemStatus]: A dictionary mapping problem IDs to statuses, problems the user
+            never submitted to are omitted.
+        """
+        if not problem_ids:
+            return {}
+        rows = self.problem_statuses.filter(UserProblemStatus.problem_id.in_(problem_ids)).all()
+        return {row.problem_id: row for row in rows}
+
+    def public_problem_pids(self, accepted: bool) -> list[str]:
+        """
+        Get the public problems the user has solved or only attempted.
+
+        Args:
+            accepted (bool): True for solved problems, False for attempted but unsolved problems.
+
+        Returns:
+            list[str]: The pids of the problems, sorted.
+        """
+        rows = (self.problem_statuses.filter_by(accepted=accepted)
+                .join(Problem, Problem.id == UserProblemStatus.problem_id)
+                .filter(Problem.is_public.is_(True))
+                .order_by(Problem.pid)
+                .with_entities(Problem.pid).all())
+        return [row[0] for row in rows]
+
 
 class Submission(db.Model):
     """
@@ -164,8 +204,11 @@ class Submission(db.Model):
         just_pretest (bool): Whether the submission is just a pretest.
         simple_result (str): A simplified result of the submission.
         queue_position (int): The position of the submission in the queue.
+        priority (int): The value of the JudgeClass the submission is scheduled as.
+        queued_at (datetime): The time the submission was last put into the judge queue.
     """
     __tablename__ = 'submissions'
+    __table_args__ = (db.Index('ix_submissions_pending', 'completed', 'running', 'priority', 'queued_at'),)
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     source = db.Column(db.String(20), nullable=False)
     time = db.Column(db.DateTime, nullable=False)
@@ -184,6 +227,8 @@ class Submission(db.Model):
     simple_result = db.Column(db.String(300), nullable=True)
     simple_result_flag = db.Column(db.String(20), nullable=False)
     queue_position = db.Column(db.Integer, nullable=False)
+    priority = db.Column(db.Integer, nullable=False, default=1)
+    queued_at = db.Column(db.DateTime, nullable=True)
 
     def __init__(self, **kwargs):
         """
@@ -262,7 +307,6 @@ class Problem(db.Model):
         is_public (bool): Whether the problem is public.
         submissions (relationship): The submissions related to the problem.
         user_id (int): The ID of the user who created the problem.
-        editing (bool): Whether the problem is currently being edited.
         edit_time (datetime): The time when the problem was last edited.
     """
     __tablename__ = 'problems'
@@ -274,7 +318,6 @@ class Problem(db.Model):
     is_public = db.Column(db.Boolean, default=False)
     submissions = db.relationship('Submission', backref='problem', lazy='dynamic')
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    editing = db.Column(db.Boolean, default=False)
     edit_time = db.Column(db.DateTime)
 
     def __init__(self, **kwargs):
@@ -378,6 +421,73 @@ class Contest(db.Model):
     main_period_id = db.Column(db.Integer, nullable=True)
     announcements = db.relationship('Announcement', backref='contest', lazy='dynamic')
     hidden = db.Column(db.Boolean, default=False, nullable=False)
+    participations = db.relationship('ContestParticipant', backref='contest', lazy='dynamic')
+
+    def has_participant(self, user_id: int) -> bool:
+        """
+        Check if the given user is a (non-virtual) participant of the contest.
+
+        Args:
+            user_id (int): The ID of the user.
+
+        Returns:
+            bool: True if the user is a participant, False otherwise.
+        """
+        return self.participations.filter_by(user_id=user_id, is_virtual=False).first() is not None
+
+    def virtual_period_of(self, user_id: int) -> int | None:
+        """
+        Get the virtual period of the given user.
+
+        Args:
+            user_id (int): The ID of the user.
+
+        Returns:
+            int | None: The ID of the virtual period, or None if the user is not a virtual participant.
+        """
+        obj = self.participations.filter_by(user_id=user_id, is_virtual=True).first()
+        return None if obj is None else obj.period_id
+
+    def participant_names(self) -> list[str]:
+        """
+        Get the usernames of all (non-virtual) participants of the contest.
+
+        Returns:
+            list[str]: The usernames ordered by registration.
+        """
+        rows = (self.participations.filter_by(is_virtual=False)
+                .join(User, User.id == ContestParticipant.user_id)
+                .order_by(ContestParticipant.id)
+                .with_entities(User.username).all())
+        return [row[0] for row in rows]
+
+    def virtual_participant_map(self) -> dict[str, int]:
+        """
+        Get the virtual periods of all virtual participants of the contest.
+
+        Returns:
+            dict[str, int]: A dictionary mapping usernames to virtual period IDs.
+        """
+        rows = (self.participations.filter_by(is_virtual=True)
+                .join(User, User.id == ContestParticipant.user_id)
+                .with_entities(User.username, ContestParticipant.period_id).all())
+        return {username: period_id for username, period_id in rows}
+
+    def set_period_duration(self, minutes: int):
+        """
+        Set the end time of every period of the contest to its start time plus the given duration.
+
+        The end times are written with one bulk UPDATE keyed by period ID, without loading
+        the periods as ORM objects.
+
+        Args:
+            minutes (int): The duration of each period in minutes.
+        """
+        rows = self.periods.with_entities(Period.id, Period.start_time).all()
+        if rows:
+            duration = timedelta(minutes=minutes)
+            get_session().bulk_update_mappings(Period, [{"id": idx, "end_time": start_time + duration}
+                                                        for idx, start_time in rows])
 
     def can_virtual(self) -> bool:
         """
@@ -441,6 +551,11 @@ class Period(db.Model):
         submissions (relationship): The submissions related to the period.
     """
     __tablename__ = 'periods'
+    __table_args__ = (
+        db.Index('ix_periods_schedule', 'running', 'ended', 'start_time'),
+        db.Index('ix_periods_running_end', 'running', 'end_time'),
+        db.Index('ix_periods_contest_virtual', 'contest_id', 'is_virtual', 'start_time'),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     start_time = db.Column(db.DateTime, nullable=False)
     end_time = db.Column(db.DateTime, nullable=False)
@@ -482,6 +597,224 @@ class Period(db.Model):
         return now >= self.start_time
 
 
+class ContestParticipant(db.Model):
+    """
+    Represents the participation of a user in a contest.
+
+    Attributes:
+        id (int): The primary key for the participation.
+        contest_id (int): The ID of the contest.
+        user_id (int): The ID of the participating user.
+        is_virtual (bool): Whether the participation is virtual.
+        period_id (int): The ID of the virtual period, if applicable.
+    """
+    __tablename__ = 'contest_participants'
+    __table_args__ = (
+        db.UniqueConstraint('contest_id', 'user_id', 'is_virtual', name='uq_contest_participant'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    contest_id = db.Column(db.Integer, db.ForeignKey('contests.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    is_virtual = db.Column(db.Boolean, default=False, nullable=False)
+    period_id = db.Column(db.Integer, db.ForeignKey('periods.id'), nullable=True)
+
+
+class UserProblemStatus(db.Model):
+    """
+    Represents the materialized status of a user on a problem.
+
+    Attributes:
+        id (int): The primary key for the status.
+        user_id (int): The ID of the user.
+        problem_id (int): The ID of the problem.
+        best_score (float): The best total score among the user's judged submissions.
+        accepted (bool): Whether the user has an accepted submission.
+        attempts (int): The number of judged submissions.
+        first_ac_time (datetime): The time of the first accepted submission, if any.
+    """
+    __tablename__ = 'user_problem_status'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'problem_id', name='uq_user_problem_status'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    problem_id = db.Column(db.Integer, db.ForeignKey('problems.id'), nullable=False, index=True)
+    best_score = db.Column(db.Float, default=0, nullable=False)
+    accepted = db.Column(db.Boolean, default=False, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    first_ac_time = db.Column(db.DateTime, nullable=True)
+
+    def reset(self):
+        """
+        Clear the status before it is recomputed.
+        """
+        self.best_score = 0
+        self.accepted = False
+        self.attempts = 0
+        self.first_ac_time = None
+
+    def record(self, flag: str, just_pretest: bool, total_score: float, time: datetime):
+        """
+        Fold a judged submission into the status.
+
+        Submissions only judged on pretests count as attempts but not as scores.
+
+        Args:
+            flag (str): The simple result flag of the submission.
+            just_pretest (bool): Whether the submission was only judged on pretests.
+            total_score (float): The total score of the submission.
+            time (datetime): The time of the submission.
+        """
+        self.attempts = (self.attempts or 0) + 1
+        if just_pretest:
+            return
+        self.best_score = max(self.best_score or 0, total_score)
+        if flag == objs.TaskResult.OK.name:
+            self.accepted = True
+            if self.first_ac_time is None or time < self.first_ac_time:
+                self.first_ac_time = time
+
+    @property
+    def mark(self) -> str:
+        """
+        Returns a short mark describing the status.
+
+        Returns:
+            str: "solved" if accepted, "attempted" otherwise.
+        """
+        return "solved" if self.accepted else "attempted"
+
+
+class ProblemSummary(db.Model):
+    """
+    Represents the materialized summary of a problem shown in problem lists.
+
+    It is updated when a version is published, when the problem is made public or protected, and when
+    a submission is completed, so lists never deserialize the large JSON columns of problems.
+
+    Attributes:
+        problem_id (int): The ID of the problem, also the primary key.
+        pid (str): The problem identifier.
+        name (str): The name of the published version.
+        is_public (bool): Whether the problem is public.
+        timelimit (int): The time limit of the published version (ms).
+        memorylimit (int): The memory limit of the published version (MB).
+        ac_count (int): The number of users with an accepted submission.
+        attempt_count (int): The number of users with a judged submission.
+    """
+    __tablename__ = 'problem_summaries'
+    __table_args__ = (
+        db.Index('ix_problem_summaries_public_ac', 'is_public', 'ac_count'),
+        db.Index('ix_problem_summaries_public_attempts', 'is_public', 'attempt_count'),
+    )
+    problem_id = db.Column(db.Integer, db.ForeignKey('problems.id'), primary_key=True, autoincrement=False)
+    pid = db.Column(db.String(20), unique=True, nullable=False)
+    name = db.Column(db.String(120), nullable=False, default="")
+    is_public = db.Column(db.Boolean, default=False, nullable=False)
+    timelimit = db.Column(db.Integer, default=0, nullable=False)
+    memorylimit = db.Column(db.Integer, default=0, nullable=False)
+    ac_count = db.Column(db.Integer, default=0, nullable=False)
+    attempt_count = db.Column(db.Integer, default=0, nullable=False)
+
+    @staticmethod
+    def of(problem: 'Problem') -> 'ProblemSummary':
+        """
+        Get the summary of a problem, locked for update, creating it if it does not exist yet.
+
+        Args:
+            problem (Problem): The problem.
+
+        Returns:
+            ProblemSummary: The summary, added to the session.
+        """
+        def create():
+            summary = ProblemSummary(problem_id=problem.id, pid=problem.pid, ac_count=0, attempt_count=0)
+            summary.update_info(problem)
+            return summary
+
+        return lock_or_create(ProblemSummary, create, problem_id=problem.id)
+
+    @staticmethod
+    def public(sort: str = "id") -> Query['ProblemSummary']:
+        """
+        Query the summaries of public problems.
+
+        Args:
+            sort (str, optional): "id" for creation order, "ac" for the most solved first, or "attempts"
+                for the most attempted first. Defaults to "id".
+
+        Returns:
+            Query[ProblemSummary]: The query.
+        """
+        query = filter_by(ProblemSummary, is_public=True)
+        match sort:
+            case "ac":
+                return query.order_by(ProblemSummary.ac_count.desc(), ProblemSummary.problem_id)
+            case "attempts":
+                return query.order_by(ProblemSummary.attempt_count.desc(), ProblemSummary.problem_id)
+        return query.order_by(ProblemSummary.problem_id)
+
+    def update_info(self, problem: 'Problem') -> None:
+        """
+        Copy the published information of a problem.
+
+        Args:
+            problem (Problem): The problem.
+        """
+        info = problem.datas
+        self.pid = problem.pid
+        self.name = info.name
+        self.is_public = bool(problem.is_public)
+        self.timelimit = int(float(info.timelimit or 0))
+        self.memorylimit = int(float(info.memorylimit or 0))
+
+    def update_counts(self) -> None:
+        """
+        Count the users who solved and attempted the problem from their materialized statuses.
+
+        This scans all statuses of the problem, so it is only used after a rejudge and at startup;
+        judging a submission applies its change with ``add_counts`` instead.
+        """
+        self.ac_count = count(UserProblemStatus, problem_id=self.problem_id, accepted=True)
+        self.attempt_count = count(UserProblemStatus, problem_id=self.problem_id)
+
+    @staticmethod
+    def add_counts(problem_id: int, ac: int, attempts: int) -> bool:
+        """
+        Change the counts of a problem in place with a single UPDATE, without reading its summary.
+
+        Args:
+            problem_id (int): The ID of the problem.
+            ac (int): The change of the number of users with an accepted submission.
+            attempts (int): The change of the number of users with a judged submission.
+
+        Returns:
+            bool: False if the problem has no summary yet.
+        """
+        if not ac and not attempts:
+            return True
+        result = get_session().execute(
+            update(ProblemSummary).where(ProblemSummary.problem_id == problem_id)
+            .values(ac_count=ProblemSummary.ac_count + ac, attempt_count=ProblemSummary.attempt_count + attempts))
+        return result.rowcount > 0
+
+
+class SearchPosting(db.Model):
+    """
+    Represents an entry of the inverted index used by the search module.
+
+    Attributes:
+        kind (str): The kind of the indexed document: "problem", "user" or "submission".
+        token (str): A token of the document.
+        doc_id (int): The ID of the document, i.e. of the problem, user or submission.
+    """
+    __tablename__ = 'search_postings'
+    __table_args__ = (db.Index('ix_search_postings_document', 'kind', 'doc_id'),)
+    kind = db.Column(db.String(16), primary_key=True)
+    token = db.Column(db.String(32), primary_key=True)
+    doc_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+
 class Announcement(db.Model):
     """
     Represents an announcement in the database.
@@ -586,6 +919,27 @@ def add(*objs):
         session.add(obj)
 
 
+def add_unique(obj) -> bool:
+    """
+    Insert a record in a savepoint, so a unique constraint violation does not abort the whole transaction.
+
+    Use it when a concurrent request may insert the same record, e.g. a double-submitted form.
+
+    Args:
+        obj: The record to insert.
+
+    Returns:
+        bool: False if a unique constraint rejected the record.
+    """
+    session = get_session()
+    try:
+        with session.begin_nested():
+            session.add(obj)
+    except IntegrityError:
+        return False
+    return True
+
+
 def delete(*objs):
     """
     Delete the given objects from the database session.
@@ -794,3 +1148,32 @@ def first_or_404(model_class: Type[T], msg: str | None = None, **kwargs) -> T:
         if res is None:
             server.custom_abort(404, msg)
         return res
+
+
+def lock_or_create(model_class: Type[T], create: Callable[[], T], **kwargs) -> T:
+    """
+    Retrieve the record that matches the given criteria, locked for update, creating it if it does not exist.
+
+    Creating runs in a savepoint, so if a concurrent transaction inserts the same record first, the unique
+    constraint rejects this insert and the record of the other transaction is locked instead. The lock is
+    held until the transaction ends, so read-modify-write updates of the record are not lost.
+
+    Args:
+        model_class (Type[T]): The model class to query.
+        create (Callable[[], T]): Build the new record if none matches.
+        **kwargs: Keyword arguments for filtering the query; they must cover a unique constraint.
+
+    Returns:
+        T: The locked record, added to the session.
+    """
+    session = get_session()
+    qry = session.query(model_class).filter_by(**kwargs).with_for_update().populate_existing()
+    obj = qry.first()
+    if obj is None:
+        try:
+            with session.begin_nested():
+                obj = create()
+                session.add(obj)
+        except IntegrityError:
+            obj = qry.one()
+    return obj
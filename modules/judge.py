@@ -166,6 +166,12 @@ def lazy_call(cmd: list[str]):
     lazy_queue.get().put(json.dumps(list(map(str, cmd))))
 
 
+@server.app.teardown_request
+def clear_lazy_queue(exception=None):
+    # a worker thread or greenlet serves many requests; don't send leftover commands with the next one
+    lazy_queue.set(None)
+
+
 def collect_lazy_queue() -> list[list[str]]:
     ret = []
     q = lazy_queue.get()
@@ -17,29 +17,69 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import fcntl
+import hashlib
 import os
+import sys
+import threading
 from multiprocessing import Lock, Manager, Value
 from multiprocessing.managers import SyncManager
 from pathlib import Path
-from time import sleep
 from typing import TypeVar
 
+from .constants import lock_path
+
 manager: SyncManager = Manager()
-_used_set = manager.dict()
-_used_lock = Lock()
+_held: dict[tuple[int, str], list] = {}  # (thread, name) -> [fd, depth, shared]
+_held_lock = threading.Lock()
 T = TypeVar('T')
 
 
+def _flock(fd: int, operation: int) -> None:
+    """
+    Take an flock(2) lock, without stalling other greenlets when running under gevent.
+
+    Args:
+        fd (int): The file descriptor of the lock file.
+        operation (int): ``fcntl.LOCK_SH`` or ``fcntl.LOCK_EX``.
+    """
+    try:
+        fcntl.flock(fd, operation | fcntl.LOCK_NB)
+        return
+    except BlockingIOError:
+        pass
+    if "gevent" in sys.modules:
+        from gevent import monkey, get_hub
+        if monkey.is_module_patched("threading"):
+            get_hub().threadpool.apply(fcntl.flock, (fd, operation))
+            return
+    fcntl.flock(fd, operation)
+
+
 class Locker:
-    def __init__(self, name: Path):
+    def __init__(self, name: Path, shared: bool = False):
         """
         Initializes a new Locker instance.
 
+        The lock is an flock(2) lock on a file under ``lock_path``, so waiting blocks in the kernel
+        instead of polling, and a lock held by a crashed process is released with it. Shared lockers
+        of a resource do not block each other; an exclusive locker blocks everyone else. The lock is
+        re-entrant within a thread (or a greenlet under gevent). A nested shared locker inside an
+        exclusive one keeps the exclusive lock; a nested exclusive locker inside a shared one raises
+        RuntimeError, since upgrading the lock in place could deadlock with another reader doing the same.
+
         Args:
             name (str): The name of the resource to be locked, typically a file path.
+            shared (bool, optional): Whether to take a shared (reader) lock. Defaults to False.
+
+        Raises:
+            RuntimeError: On entering, if the thread already holds a shared lock of the resource and
+                this locker is exclusive.
         """
         self.name = str(name.absolute())
+        self.shared = shared
         self.locked = False
+        self.key = (0, self.name)
 
     def __enter__(self):
         """
@@ -49,15 +89,28 @@ class Locker:
         Returns:
             Locker: The Locker instance itself.
         """
-        while True:
-            with _used_lock:
-                if self.name not in _used_set:
-                    _used_set[self.name] = os.getpid()
-                    self.locked = True
-                    break
-                elif _used_set[self.name] == os.getpid():
-                    break
-            sleep(1)
+        self.key = (threading.get_ident(), self.name)
+        with _held_lock:
+            if self.key in _held:
+                if _held[self.key][2] and not self.shared:
+                    raise RuntimeError(f"cannot lock {self.name!r} exclusively while holding a shared lock of it")
+                _held[self.key][1] += 1
+                self.locked = True
+                return self
+        lock_file = lock_path / hashlib.sha1(self.name.encode()).hexdigest()
+        try:
+            fd = os.open(lock_file, os.O_RDWR | os.O_CREAT, 0o600)
+        except FileNotFoundError:
+            lock_path.mkdir(parents=True, exist_ok=True)
+            fd = os.open(lock_file, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            _flock(fd, fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        except BaseException:
+            os.close(fd)
+            raise
+        with _held_lock:
+            _held[self.key] = [fd, 1, self.shared]
+        self.locked = True
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -70,9 +123,17 @@ class Locker:
             exc_val (Exception): The exception instance, if an exception was raised.
             exc_tb (traceback): The traceback object, if an exception was raised.
         """
-        if self.locked:
-            with _used_lock:
-                del _used_set[self.name]
+        if not self.locked:
+            return
+        self.locked = False
+        with _held_lock:
+            held = _held[self.key]
+            held[1] -= 1
+            if held[1]:
+                return
+            del _held[self.key]
+        fcntl.flock(held[0], fcntl.LOCK_UN)
+        os.close(held[0])
 
 
 class Counter:
@@ -129,4 +190,9 @@ class Counter:
 
 
 def init():
-    pass
+    # a lock file is created for every locked path and is not removed while the server runs, since
+    # unlinking it could let two processes lock different files of the same name; nothing holds them
+    # before the server starts, so the files of the previous run are dropped here
+    if lock_path.is_dir():
+        for f in lock_path.iterdir():
+            f.unlink(missing_ok=True)
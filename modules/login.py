@@ -18,17 +18,25 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import hashlib
+import itertools
+import json
 import os
 import smtplib
 from email.message import EmailMessage
+from typing import Callable
 
+import redis
 from flask_login import LoginManager, UserMixin, current_user
+from loguru import logger
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
 from werkzeug.utils import secure_filename
 
 from . import server, datas, config, constants
 from .objs import Permission
 
 smtp = smtplib.SMTP(config.smtp.host, config.smtp.port)
+user_cache_ttl = 60
 
 
 class User(UserMixin):
@@ -39,15 +47,39 @@ class User(UserMixin):
     including permission checking and data persistence.
     """
 
-    def __init__(self, name: str):
+    def __init__(self, name: str, info: dict | None = None, data: datas.User | None = None):
         """
         Initialize a User object.
 
+        The database row is only loaded when ``data`` is accessed, so a user built from cached
+        information costs no query.
+
         Args:
             name (str): The username of the user.
+            info (dict | None, optional): The cached information of the user, see ``user_info``.
+                Loaded from the database if not given. Defaults to None.
+            data (datas.User | None, optional): The database row, if already loaded. Defaults to None.
         """
         self.id = secure_filename(name.lower())
-        self.data: datas.User = datas.first(datas.User, username=name)
+        self._data = data
+        if info is None:
+            if data is None:
+                self._data = datas.first(datas.User, username=name)
+            info = None if self._data is None else user_info(self._data)
+        self.info = info
+        self.permissions: frozenset[str] = frozenset(info["permissions"]) if info is not None else frozenset()
+
+    @property
+    def data(self) -> datas.User:
+        """
+        Get the database row of the user.
+
+        Returns:
+            datas.User: The row, or None if the user does not exist.
+        """
+        if self._data is None and self.info is not None:
+            self._data = datas.first(datas.User, username=self.info["username"])
+        return self._data
 
     def save(self):
         """
@@ -72,7 +104,7 @@ class User(UserMixin):
         Returns:
             bool: True if the user data is valid, False otherwise.
         """
-        return self.data is not None and self.data.username == self.id
+        return self.info is not None and self.info["username"] == self.id
 
     def has_str(self, key: str) -> bool:
         """
@@ -96,7 +128,7 @@ class User(UserMixin):
         Returns:
             bool: True if the user has the permission, False otherwise.
         """
-        perms = self.data.permission_list()
+        perms = self.permissions
         if key.name in perms or Permission.root.name in perms:
             return True
         if key is not Permission.root:
@@ -128,6 +160,108 @@ def user_loader(name):
     return get_user(name)
 
 
+def user_info(data: datas.User) -> dict:
+    """
+    Extract the information kept in the user cache from a database row.
+
+    Args:
+        data (datas.User): The row.
+
+    Returns:
+        dict: The username and the permissions of the user.
+    """
+    return {"username": data.username, "permissions": [o for o in data.permission_list() if o]}
+
+
+def cached_user(key: str, load: Callable[[], datas.User | None]) -> User | None:
+    """
+    Look up a user through the Redis user cache.
+
+    Misses are cached too, so repeated lookups of an unknown name or API key cost no query either.
+    Entries expire after ``user_cache_ttl`` seconds and are deleted when a commit changes the user.
+
+    Args:
+        key (str): The cache key, ``name:<username or email>`` or ``api:<hashed API key>``.
+        load (Callable[[], datas.User | None]): Loads the row on a cache miss.
+
+    Returns:
+        User | None: The user, or None if not found.
+    """
+    name = "user_cache:" + key
+    try:
+        raw = server.redis_client.get(name)
+    except redis.RedisError as e:
+        logger.warning(f"user cache unavailable: {e}")
+        raw = None
+    if raw is not None:
+        info = json.loads(raw)
+        return None if info is None else User(info["username"], info)
+    data = load()
+    info = None if data is None else user_info(data)
+    try:
+        server.redis_client.set(name, json.dumps(info), ex=user_cache_ttl)
+    except redis.RedisError:
+        pass
+    return None if data is None else User(data.username, info, data)
+
+
+def user_cache_keys(data: datas.User) -> set[str]:
+    """
+    Get the user cache keys that refer to a user, using both the current and the previous values.
+
+    Args:
+        data (datas.User): The row, before its changes are committed.
+
+    Returns:
+        set[str]: The cache keys.
+    """
+    attrs = inspect(data).attrs
+    keys = set()
+    for attr, prefix in (("username", "name:"), ("email", "name:"), ("api_key", "api:")):
+        history = attrs[attr].history
+        for value in itertools.chain(history.added, history.deleted, history.unchanged):
+            if value:
+                keys.add(prefix + value)
+    return keys
+
+
+@event.listens_for(Session, "after_flush")
+def collect_changed_users(session: Session, flush_context):
+    stale = session.info.setdefault("stale_user_cache", set())
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, datas.User):
+            stale.update(user_cache_keys(obj))
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_changed_users(session: Session):
+    stale = session.info.pop("stale_user_cache", None)
+    if stale:
+        try:
+            server.redis_client.delete(*("user_cache:" + key for key in stale))
+        except redis.RedisError as e:
+            logger.warning(f"failed to invalidate the user cache: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_changed_users(session: Session):
+    session.info.pop("stale_user_cache", None)
+
+
+def get_api_key_user(key: str) -> User | None:
+    """
+    Find the user owning an API key.
+
+    Args:
+        key (str): The API key, unhashed.
+
+    Returns:
+        User | None: The user, or None if no user has this key.
+    """
+    hashed = try_hash(key)
+    return cached_user("api:" + hashed, lambda: datas.first(datas.User, api_key=hashed))
+
+
 def send_mail(msg: EmailMessage, target: str) -> bool:
     msg["From"] = email_sender
     msg["To"] = target
@@ -214,10 +348,10 @@ def try_login(user_id: str, password: str) -> tuple[None | User, str]:
         user_id = usr.first().username
     if usr.count() > 1:
         return None, "帳號資料異常"
-    pwd = usr.first().password_sha256_hex
-    if pwd != try_hash(password):
+    data = usr.first()
+    if data.password_sha256_hex != try_hash(password):
         return None, "帳號或密碼錯誤"
-    return User(user_id), "登入成功"
+    return User(user_id, data=data), "登入成功"
 
 
 def get_user(user_id: str) -> User | None:
@@ -225,8 +359,7 @@ def get_user(user_id: str) -> User | None:
     Retrieve a User object based on the provided user identifier.
 
     This function attempts to find a user by their username first. If no user is found,
-    it then tries to find the user by their email address. If a user is found by email,
-    the function updates the user_id to the corresponding username.
+    it then tries to find the user by their email address. Lookups go through the user cache.
 
     Args:
         user_id (str): The user's identifier, which can be either a username or an email address.
@@ -234,13 +367,13 @@ def get_user(user_id: str) -> User | None:
     Returns:
         User | None: A User object if the user is found, or None if no user is found.
     """
-    usr = datas.filter_by(datas.User, username=user_id)
-    if usr.count() == 0:
-        usr = datas.filter_by(datas.User, email=user_id)
-        if usr.count() == 0:
-            return None
-        user_id = usr.first().username
-    return User(user_id)
+    def load():
+        data = datas.first(datas.User, username=user_id)
+        if data is None:
+            data = datas.first(datas.User, email=user_id)
+        return data
+
+    return cached_user("name:" + user_id, load)
 
 
 def exist(user_id: str) -> bool:
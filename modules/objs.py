@@ -417,8 +417,6 @@ class ContestData(metaclass=DataMeta):
         standing (StandingsData): The standings data of the contest.
         pretest (PretestType): The type of pretest used in the contest.
         practice (PracticeType): The type of practice allowed in the contest.
-        participants (list[str]): A list of participants in the contest.
-        virtual_participants (dict[str, str]): A dictionary of virtual participants.
         penalty (int): The penalty time in minutes.
     """
     name: str = "unknown"
@@ -431,8 +429,6 @@ class ContestData(metaclass=DataMeta):
     standing: StandingsData = field(default_factory=StandingsData)
     pretest: PretestType = PretestType.no
     practice: PracticeType = PracticeType.no
-    participants: list[str] = field(default_factory=list)
-    virtual_participants: dict[str, int] = field(default_factory=dict)
     penalty: int = 20
 
 
@@ -823,3 +819,21 @@ class ContestStatus(Enum):
     practice = "practice"
     testing = "testing"
     guest = "guest"
+
+
+class JudgeClass(Enum):
+    """
+    An enumeration representing the scheduling class of a pending submission.
+
+    The value is the priority of the class, smaller values are judged first.
+
+    Attributes:
+        contest (int): Represents submissions made during a running contest period.
+        practice (int): Represents ordinary submissions.
+        test (int): Represents custom test runs.
+        rejudge (int): Represents rejudged submissions.
+    """
+    contest = 0
+    practice = 1
+    test = 2
+    rejudge = 3
@@ -0,0 +1,187 @@
+"""
+OrangeJudge, a competitive programming platform
+
+Copyright (C) 2024-2025 LittleOrange666 (orangeminecraft123@gmail.com)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import json
+import re
+import threading
+from pathlib import Path
+
+import redis
+from loguru import logger
+
+from . import tools, objs, server
+from .constants import problem_path
+
+local_cache: dict[str, tuple[str, dict]] = {}
+fill_locks: dict[str, threading.Lock] = {}
+shared_ttl = 3600
+
+
+def version_name(pid: str) -> str:
+    """
+    Get the name of the published version folder of a problem.
+
+    Args:
+        pid (str): The problem ID.
+
+    Returns:
+        str: The name of the folder, which differs between versions.
+    """
+    return (problem_path / pid).resolve().name
+
+
+def pin_file_links(html: str, pid: str, version: str) -> str:
+    """
+    Add the version to the links to public files in a statement, so they can be cached as immutable.
+
+    Args:
+        html (str): The statement.
+        pid (str): The problem ID.
+        version (str): The name of the published version folder.
+
+    Returns:
+        str: The statement with versioned links.
+    """
+    pattern = r'((?:src|href)="/problem_file/' + re.escape(pid) + r'/[^"?#]+)"'
+    return re.sub(pattern, lambda m: f'{m.group(1)}?v={version}"', html)
+
+
+def build_payload(dat: objs.ProblemInfo, path: Path, version: str | None = None) -> dict:
+    """
+    Read everything a problem page shows from the folder of a problem.
+
+    Args:
+        dat (objs.ProblemInfo): The problem information matching the folder.
+        path (Path): The folder of the problem.
+        version (str | None, optional): The name of the published version folder, used to pin the
+            links to public files. Defaults to None.
+
+    Returns:
+        dict: The statement, the samples and the default code of every language.
+    """
+    samples = [[o.in_txt, o.out_txt] for o in dat.manual_samples]
+    samples.extend([tools.read(path / "testcases" / o.in_file), tools.read(path / "testcases" / o.out_file)]
+                   for o in dat.testcases if o.sample)
+    samples.extend([tools.read(path / "testcases_gen" / o.in_file), tools.read(path / "testcases_gen" / o.out_file)]
+                   for o in dat.testcases_gen if o.sample)
+    files = {f for f in dat.default_code.values() if f and f.strip()}
+    content_map = {f: tools.read_default(path / "file" / f) for f in files}
+    statement_html = tools.read_default(path / "statement.html")
+    if version is not None:
+        statement_html = pin_file_links(statement_html, dat.pid, version)
+    return {
+        "statement_html": statement_html,
+        "statement_md": tools.read_default(path / "statement.md"),
+        "samples": samples,
+        "default_code": {k: content_map.get(v, "") for k, v in dat.default_code.items()},
+    }
+
+
+def version_key(dat: objs.ProblemInfo, path: Path) -> str:
+    """
+    Identify the published version of a problem.
+
+    Publishing replaces the folder with a new one, so the resolved folder identifies the files;
+    the number of versions identifies the information in the database, which is committed later.
+
+    Args:
+        dat (objs.ProblemInfo): The published problem information.
+        path (Path): The published folder of the problem.
+
+    Returns:
+        str: The key of the version.
+    """
+    folder = path.resolve()
+    return f"{folder.name}:{folder.stat().st_ino}:{len(dat.versions)}"
+
+
+def fill_shared(pid: str, key: str, dat: objs.ProblemInfo, path: Path) -> dict:
+    """
+    Get a payload from Redis, building and storing it under a Redis lock if it is missing.
+
+    Falls back to building the payload locally when Redis is unavailable.
+
+    Args:
+        pid (str): The problem ID.
+        key (str): The key of the published version.
+        dat (objs.ProblemInfo): The published problem information.
+        path (Path): The published folder of the problem.
+
+    Returns:
+        dict: The payload.
+    """
+    name = f"problem_payload:{pid}:{key}"
+    try:
+        raw = server.redis_client.get(name)
+        if raw is not None:
+            return json.loads(raw)
+        with server.redis_client.lock(name + ":lock", timeout=60, blocking_timeout=60):
+            raw = server.redis_client.get(name)
+            if raw is not None:
+                return json.loads(raw)
+            payload = build_payload(dat, path, path.resolve().name)
+            server.redis_client.set(name, json.dumps(payload), ex=shared_ttl)
+            return payload
+    except redis.RedisError as e:
+        logger.warning(f"problem payload cache unavailable: {e}")
+        return build_payload(dat, path, path.resolve().name)
+
+
+def problem_payload(pid: str, dat: objs.ProblemInfo) -> dict:
+    """
+    Get the assembled page payload of a published problem.
+
+    The payload is cached in this process and in Redis, keyed by the published version, so a new
+    version invalidates it. Only one request per process and one process overall reads the files
+    of a version; the others wait for it.
+
+    Args:
+        pid (str): The problem ID.
+        dat (objs.ProblemInfo): The published problem information.
+
+    Returns:
+        dict: The payload, see ``build_payload``.
+    """
+    path = problem_path / pid
+    if not path.exists():
+        return build_payload(dat, path)
+    key = version_key(dat, path)
+    cached = local_cache.get(pid)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    # threading.Lock is looked up here rather than at import, so gevent workers get a cooperative lock
+    with fill_locks.setdefault(pid, threading.Lock()):
+        cached = local_cache.get(pid)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        payload = fill_shared(pid, key, dat, path)
+        local_cache[pid] = (key, payload)
+        return payload
+
+
+def samples_of(payload: dict) -> list[objs.ManualSample]:
+    """
+    Convert the samples of a payload into fresh ``ManualSample`` objects.
+
+    Args:
+        payload (dict): The payload.
+
+    Returns:
+        list[objs.ManualSample]: The samples.
+    """
+    return [objs.ManualSample(in_txt=o[0], out_txt=o[1]) for o in payload["samples"]]
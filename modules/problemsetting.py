@@ -19,41 +19,54 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import dataclasses
 import datetime
+import hashlib
+import io
 import json
 import os
+import queue
 import shutil
+import threading
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import ContextVar, copy_context
 from graphlib import TopologicalSorter, CycleError
-from multiprocessing import Queue, Process
+from multiprocessing import Process, Condition
 from pathlib import Path
-from typing import Callable
+from typing import Callable, Iterator, TYPE_CHECKING
 from xml.etree import ElementTree
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED
 from xml.etree.ElementTree import Element
 
-from flask import Response, request, redirect
+from flask import Response, request, redirect, stream_with_context
 from loguru import logger
-from pyzipper import AESZipFile
-from pyzipper.zipfile_aes import AESZipInfo
 from sqlalchemy.orm.attributes import flag_modified
 from werkzeug.datastructures import ImmutableMultiDict, MultiDict
 from werkzeug.utils import secure_filename
 
-from . import executing, tools, constants, createhtml, datas, objs, judge, server
-from .constants import tmp_path, preparing_problem_path, testlib, problem_path
+from . import executing, tools, constants, createhtml, datas, objs, judge, server, locks, config, blobs, \
+    search
+from .constants import tmp_path, preparing_problem_path, testlib, problem_path, problem_versions_path
 from .judge import SandboxPath, SandboxUser
 from .objs import ProgramType, GenType
 from .routers.general import render_problem
 from .server import sending_file, custom_abort
 from .tools import TempFile
 
-worker_queue = Queue()
+if TYPE_CHECKING:
+    from pyzipper import AESZipFile
+    from pyzipper.zipfile_aes import AESZipInfo
+
+pending_actions = locks.manager.list()
+running_actions = locks.manager.dict()
+cancelled_actions = locks.manager.dict()
+actions_changed = Condition()
 
 root_folder = Path.cwd()
 background_actions = tools.Switcher()
 actions = tools.Switcher()
-current_pid = ""
-current_idx = 0
+current_action: ContextVar[tuple[str, int] | None] = ContextVar("current_action", default=None)
+publish_excluded = {"actions", "background_action_cnt", "publish_cache.json"}
 
 
 def make_important(func: Callable) -> Callable:
@@ -65,6 +78,10 @@ class StopActionException(Exception):
     pass
 
 
+class GenerateFailed(Exception):
+    pass
+
+
 def just_compile(path: Path, name: str, lang: executing.Language, env: executing.Environment) -> SandboxPath:
     log(f"compile {name} ({path.name})")
     file = env.send_file(path)
@@ -85,20 +102,24 @@ class Problem(objs.ProblemInfo):
         """
         Initialize the Problem class.
 
-        This method initializes the Problem instance with the given problem ID and editing status.
-        It retrieves the problem data from the database and sets the editing status if necessary.
+        This method takes the exclusive editing lock of the problem, which is held until the context
+        exits, and then retrieves the problem data from the database.
 
         Args:
             pid (str): The problem ID.
-            is_important_editing_now (bool, optional): Flag indicating if the problem is currently being edited. Defaults to True.
+            is_important_editing_now (bool, optional): Flag indicating if the edit time should be updated. Defaults to True.
         """
         self.pid = pid
         self.is_important_editing_now = is_important_editing_now
-        self.sql_data: datas.Problem = datas.first(datas.Problem, pid=pid)
-        if self.is_important_editing_now:
-            self.sql_data.editing = True
-            datas.add(self.sql_data)
-        super().__init__(**self.sql_data.new_data)
+        self.lock = locks.Locker(preparing_problem_path / pid)
+        self.lock.__enter__()
+        try:
+            self.sql_data: datas.Problem = datas.first(datas.Problem, pid=pid)
+            datas.get_session().refresh(self.sql_data)
+            super().__init__(**self.sql_data.new_data)
+        except BaseException:
+            self.lock.__exit__(None, None, None)
+            raise
 
     def __enter__(self):
         """
@@ -113,19 +134,24 @@ class Problem(objs.ProblemInfo):
         """
         Exit the runtime context related to this object.
 
-        This method updates the problem data in the database and resets the editing status if necessary.
+        This method updates the problem data in the database, commits it if no exception was raised
+        and releases the editing lock.
 
         Args:
             exc_type: The exception type.
             exc_val: The exception value.
             exc_tb: The traceback object.
         """
-        self.sql_data.new_datas = self
-        self.sql_data.name = self.name
-        if self.is_important_editing_now:
-            self.sql_data.editing = False
-            self.sql_data.edit_time = datetime.datetime.now()
-        datas.add(self.sql_data)
+        try:
+            self.sql_data.new_datas = self
+            self.sql_data.name = self.name
+            if self.is_important_editing_now:
+                self.sql_data.edit_time = datetime.datetime.now()
+            datas.add(self.sql_data)
+            if exc_type is None:
+                datas.get_session().commit()
+        finally:
+            self.lock.__exit__(exc_type, exc_val, exc_tb)
 
     def save(self):
         """
@@ -250,13 +276,13 @@ class Problem(objs.ProblemInfo):
         return preparing_problem_path / self.pid
 
 
-problem: Problem | None = None
-
-
 def init() -> None:
     global root_folder
     root_folder = Path.cwd().absolute()
-    Process(target=runner).start()
+    blobs.collect()
+    restore_background_actions()
+    for _ in range(max(config.judge.build_workers, 1)):
+        Process(target=runner).start()
 
 
 def create_problem(name: str, pid: str, user: datas.User) -> str:
@@ -286,102 +312,241 @@ def create_problem(name: str, pid: str, user: datas.User) -> str:
 
 
 def log(s: str, success: bool | None = None):
+    pid, idx = current_action.get()
     logger.info(s)
     if not s.endswith("\n"):
         s += "\n"
-    tools.append(s, preparing_problem_path / current_pid / "actions" / f"{current_idx}.log")
+    tools.append(s, preparing_problem_path / pid / "actions" / f"{idx}.log")
     if type(success) is bool:
         end(success)
+    if cancelled_actions.get(pid) == idx:
+        tools.append("cancelled\n", preparing_problem_path / pid / "actions" / f"{idx}.log")
+        end(False, cancelled=True)
 
 
-def end(success: bool):
-    with tools.Json(preparing_problem_path / current_pid / "actions" / f"{current_idx}.json") as dat:
+def end(success: bool, cancelled: bool = False):
+    pid, idx = current_action.get()
+    with tools.Json(preparing_problem_path / pid / "actions" / f"{idx}.json") as dat:
         dat["success"] = success
         dat["completed"] = True
+        if cancelled:
+            dat["cancelled"] = True
     raise StopActionException()
 
 
+def gen_environment(files: dict[str, SandboxPath], langs: dict[str, executing.Language]) \
+        -> tuple[executing.Environment, dict[str, list[str]]]:
+    """
+    Create a sandbox environment for a generation thread, holding a copy of the compiled programs.
+
+    Args:
+        files (dict[str, SandboxPath]): The compiled programs by source file name.
+        langs (dict[str, executing.Language]): The languages of the programs by source file name.
+
+    Returns:
+        tuple[executing.Environment, dict[str, list[str]]]: The environment and the commands of the programs in it.
+    """
+    env = executing.Environment()
+    env.send_file(testlib, env.executable)
+    cmds = {s: langs[s].get_execmd(env.send_file(file.full, env.executable)) for s, file in files.items()}
+    return env, cmds
+
+
+def generate_one(problem: Problem, envs: queue.Queue, gen_group: objs.GenGroup, name: str, cmd: str,
+                 stop: threading.Event) -> None:
+    """
+    Generate the input and answer of one generated testcase.
+
+    Runs in a generation thread, so it queues its own lazy sandbox commands, and takes a sandbox environment
+    from the pool for the time it runs, so programs writing scratch files never share a directory.
+
+    Args:
+        problem (Problem): The problem.
+        envs (queue.Queue): The pool of environments, see ``gen_environment``.
+        gen_group (objs.GenGroup): The generation group of the testcase.
+        name (str): The file name of the testcase without extension.
+        cmd (str): The arguments of the generator.
+        stop (threading.Event): Set when another testcase of the group has failed.
+
+    Raises:
+        GenerateFailed: If a program of the group failed, with the status to show.
+    """
+    if stop.is_set():
+        return
+    judge.lazy_queue.set(queue.Queue())
+    env, cmds = envs.get()
+    try:
+        generate_in(problem, env, gen_group, cmds[gen_group.file1], cmds[gen_group.file2],
+                    cmds.get(problem.interactor_source, []), name, cmd)
+    finally:
+        envs.put((env, cmds))
+
+
+def generate_in(problem: Problem, env: executing.Environment, gen_group: objs.GenGroup, gen_cmd: list[str],
+                ans_cmd: list[str], int_cmd: list[str], name: str, cmd: str) -> None:
+    """
+    Generate the input and answer of one generated testcase in the given environment.
+
+    Args:
+        problem (Problem): The problem.
+        env (executing.Environment): The environment holding the compiled programs.
+        gen_group (objs.GenGroup): The generation group of the testcase.
+        gen_cmd (list[str]): The command of the generator.
+        ans_cmd (list[str]): The command of the solution or answer generator.
+        int_cmd (list[str]): The command of the interactor, if any.
+        name (str): The file name of the testcase without extension.
+        cmd (str): The arguments of the generator.
+
+    Raises:
+        GenerateFailed: If a program failed, with the status to show.
+    """
+    testcase_path = problem.path / "testcases_gen"
+    in_file = testcase_path / f"{name}.in"
+    out_file = testcase_path / f"{name}.out"
+    log(f"generating testcase {name!r}")
+    gen_out = env.call(gen_cmd + cmd.split(), user=SandboxUser.judge)
+    if judge.is_tle(gen_out):
+        log(f"{name}: generator TLE")
+        raise GenerateFailed("生成失敗：生成器TLE")
+    if gen_out.return_code:
+        log(f"{name}: generator RE")
+        log(gen_out.stderr)
+        raise GenerateFailed("生成失敗：生成器RE")
+    blobs.write(gen_out.stdout.encode(), in_file)
+    if gen_group.type is GenType.sol:
+        in_path = env.send_file(in_file)
+        out_path = env.path(out_file.name)
+        if problem.is_interact:
+            env.readable(in_path, user=SandboxUser.judge)
+            env.writeable(out_path, user=SandboxUser.judge)
+            res = env.interact_run(ans_cmd, int_cmd, int(problem.timelimit), int(problem.memorylimit), in_path,
+                                   out_path, interact_user=SandboxUser.judge).result
+        else:
+            res = env.run(ans_cmd, int(problem.timelimit), int(problem.memorylimit), in_path, out_path)
+        if res.result != "AC":
+            log(f"{name}: solution {res.result}")
+            raise GenerateFailed(f"生成失敗：官解{res.result}")
+        tmp = blobs.incoming()
+        env.get_file(tmp, out_path)
+        blobs.store(tmp, out_file)
+    else:
+        ans_out = env.call(ans_cmd + cmd.split(), user=SandboxUser.judge)
+        if judge.is_tle(ans_out):
+            log(f"{name}: ans generator TLE")
+            raise GenerateFailed("生成失敗：答案生成器TLE")
+        if ans_out.return_code:
+            log(f"{name}: ans generator RE")
+            log(ans_out.stderr)
+            raise GenerateFailed("生成失敗：答案生成器RE")
+        blobs.write(ans_out.stdout.encode(), out_file)
+
+
 @background_actions.bind
-def generate_testcase(pid: str):
+def generate_testcase(problem: Problem, pid: str):
     log(f"generating testcase")
     env = executing.Environment()
     env.send_file(testlib, env.executable)
     gen_list: list[objs.Testcase] = []
-    int_cmd = []
-    run_cmds = {}
-
-    def get_cmd(s: str, title: str):
-        if s not in run_cmds:
-            run_cmds[s] = problem.compile_inner(s, title, env)
-        return run_cmds[s]
+    run_files: dict[str, SandboxPath] = {}
+    langs: dict[str, executing.Language] = {}
+    source_hashes = {}
+    testlib_hash = tools.file_hash(testlib)
+
+    def get_file(s: str, title: str):
+        if s not in run_files:
+            langs[s] = problem.lang(s)
+            run_files[s] = just_compile(problem.path / "file" / s, title, langs[s], env)
+        return run_files[s]
+
+    def source_hash(s: str) -> str:
+        if s not in source_hashes:
+            lang = problem.lang(s)
+            source_hashes[s] = f"{lang.name}:{lang.branch}:{tools.file_hash(problem.path / 'file' / s)}"
+        return source_hashes[s]
+
+    def case_key(gen_group: objs.GenGroup, cmd: str) -> dict:
+        key = {"generator": source_hash(gen_group.file1), "args": cmd, "type": gen_group.type.name,
+               "answer": source_hash(gen_group.file2), "testlib": testlib_hash}
+        if gen_group.type is GenType.sol:
+            key["timelimit"] = problem.timelimit
+            key["memorylimit"] = problem.memorylimit
+            if problem.is_interact:
+                key["interactor"] = source_hash(problem.interactor_source)
+        return key
 
-    if problem.is_interact:
-        int_cmd = get_cmd(problem.interactor_source, "interactor")
-    tl = int(problem.timelimit)
-    ml = int(problem.memorylimit)
-    log("clear folder")
     testcase_path = problem.path / "testcases_gen"
-    if testcase_path.is_dir():
-        shutil.rmtree(testcase_path)
     testcase_path.mkdir(parents=True, exist_ok=True)
-    log("complete clear folder")
+    manifest_file = problem.path / "gen_manifest.json"
+    manifest: dict[str, dict] = tools.read_json(manifest_file) if manifest_file.is_file() else {}
+    keys: dict[str, dict] = {}
+    stale: list[tuple[int, int]] = []
     for group_id, gen_group in enumerate(problem.gen_groups):
-        file1_cmd = get_cmd(gen_group.file1, "generator")
-        file2_cmd = get_cmd(gen_group.file2, "solution" if gen_group.type is GenType.sol else "ans_generator")
-        cur: list[objs.Testcase] = []
         for tcidx, cmd in enumerate(gen_group.cmds):
             name = f"{group_id}_{tcidx}"
-            in_file = testcase_path / f"{name}.in"
-            out_file = testcase_path / f"{name}.out"
-            log(f"generating testcase {name!r}")
-            gen_out = env.call(file1_cmd + cmd.split(), user=SandboxUser.judge)
-            if judge.is_tle(gen_out):
-                log("generator TLE")
-                gen_group.status = "生成失敗：生成器TLE"
-                break
-            if gen_out.return_code:
-                log("generator RE")
-                gen_group.status = "生成失敗：生成器RE"
-                log(gen_out.stderr)
-                break
-            tools.write(gen_out.stdout, in_file)
-            if gen_group.type is GenType.sol:
-                in_path = env.send_file(in_file)
-                out_path = env.path(out_file.name)
-                if problem.is_interact:
-                    env.readable(in_path, user=SandboxUser.judge)
-                    env.writeable(out_path, user=SandboxUser.judge)
-                    res = env.interact_run(file2_cmd, int_cmd, tl, ml, in_path, out_path,
-                                           interact_user=SandboxUser.judge).result
-                else:
-                    res = env.run(file2_cmd, tl, ml, in_path, out_path)
-                if res.result != "AC":
-                    logger.info(f"solution {res.result}")
-                    gen_group.status = f"生成失敗：官解{res.result}"
-                env.get_file(out_file, out_path)
-            else:
-                gen_out = env.call(file2_cmd + cmd.split(), user=SandboxUser.judge)
-                if judge.is_tle(gen_out):
-                    log("ans generator TLE")
-                    gen_group.status = "生成失敗：答案生成器TLE"
-                    break
-                if gen_out.return_code:
-                    log("ans generator RE")
-                    gen_group.status = "生成失敗：答案生成器RE"
-                    log(gen_out.stderr)
-                    break
-                tools.write(gen_out.stdout, in_file)
-            cur.append(objs.Testcase(in_file=name + ".in", out_file=name + ".out", sample=False, pretest=False,
-                                     group=gen_group.group))
-        else:
-            gen_group.status = "生成成功"
-            gen_list.extend(cur)
+            keys[name] = case_key(gen_group, cmd)
+            if (manifest.get(name) != keys[name] or not (testcase_path / f"{name}.in").is_file() or
+                    not (testcase_path / f"{name}.out").is_file()):
+                stale.append((group_id, tcidx))
+    for f in testcase_path.iterdir():
+        if f.stem not in keys:
+            f.unlink()
+    log(f"{len(stale)} of {len(keys)} testcases need to be generated")
+    # drop the stale entries before overwriting their files, so an interrupted run never leaves a key
+    # pointing at the output of different arguments or programs
+    pending_names = {f"{group_id}_{tcidx}" for group_id, tcidx in stale}
+    tools.write_json({k: v for k, v in keys.items() if k not in pending_names}, manifest_file)
+    if stale and problem.is_interact:
+        get_file(problem.interactor_source, "interactor")
+    for group_id in sorted({o[0] for o in stale}):
+        gen_group = problem.gen_groups[group_id]
+        get_file(gen_group.file1, "generator")
+        get_file(gen_group.file2, "solution" if gen_group.type is GenType.sol else "ans_generator")
+    workers = min(max(config.judge.gen_workers, 1), len(stale))
+    envs = queue.Queue()
+    for _ in range(workers):
+        envs.put(gen_environment(run_files, langs))
+    stops = [threading.Event() for _ in problem.gen_groups]
+    failures: dict[int, str] = {}
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        futures = {}
+        for group_id, tcidx in stale:
+            gen_group = problem.gen_groups[group_id]
+            future = pool.submit(copy_context().run, generate_one, problem, envs, gen_group,
+                                 f"{group_id}_{tcidx}", gen_group.cmds[tcidx], stops[group_id])
+            futures[future] = group_id
+        for future in as_completed(futures):
+            group_id = futures[future]
+            e = future.exception()
+            if e is None or group_id in failures:
+                continue
+            stops[group_id].set()
+            for other, other_group in futures.items():
+                if other_group == group_id:
+                    other.cancel()
+            if isinstance(e, StopActionException):
+                for stop in stops:
+                    stop.set()
+                for other in futures:
+                    other.cancel()
+                raise e
+            failures[group_id] = str(e) if isinstance(e, GenerateFailed) else f"生成失敗：{e}"
+            log(f"group {group_id} failed: {failures[group_id]}")
+    stale_names = {f"{group_id}_{tcidx}" for group_id, tcidx in stale if group_id in failures}
+    tools.write_json({k: v for k, v in keys.items() if k not in stale_names}, manifest_file)
+    for group_id, gen_group in enumerate(problem.gen_groups):
+        if group_id in failures:
+            gen_group.status = failures[group_id]
+            continue
+        gen_group.status = "生成成功"
+        gen_list.extend(objs.Testcase(in_file=f"{group_id}_{tcidx}.in", out_file=f"{group_id}_{tcidx}.out",
+                                      sample=False, pretest=False, group=gen_group.group)
+                        for tcidx in range(len(gen_group.cmds)))
     log(f"generate complete")
     problem.testcases_gen = gen_list
 
 
 @background_actions.bind
-def creating_version(pid: str, description: str):
+def creating_version(problem: Problem, pid: str, description: str):
     log(f"creating version {description!r}")
     env = executing.Environment()
     env.send_file(testlib, env.executable)
@@ -402,20 +567,112 @@ def creating_version(pid: str, description: str):
         env.get_file(problem.path / file.inner, file)
         problem.codechecker = objs.ExecPtr(name=str(file.inner), lang=problem.lang(problem.codechecker_source).branch)
     if problem.gen_groups:
-        generate_testcase(pid)
+        generate_testcase(problem, pid)
     problem.versions.append(objs.ProblemVersion(description=description, time=time.time()))
-    target = problem_path / pid
-    if target.is_dir():
-        log("remove old version")
-        shutil.rmtree(target)
     problem.save()  # 勿刪，此用於保證複製過去的文件完整
-    log("copy overall folder")
-    shutil.copytree(problem.path, target, dirs_exist_ok=True)
+    datas.ProblemSummary.of(problem.sql_data).update_info(problem.sql_data)
+    log("publish overall folder")
+    release = publish_version(problem, pid)
+    prune_versions(pid, release)
+    search.index_problem(problem.sql_data)
     log("complete")
 
 
+def publish_version(problem: Problem, pid: str) -> Path:
+    """
+    Publish the preparing folder of a problem as a new immutable version.
+
+    Every file is stored in the blob store and hardlinked into a staging folder, which is renamed
+    into place and then made visible by atomically replacing the ``problem_path / pid`` symlink.
+    Files whose size, mtime and inode are unchanged since the last publish reuse their recorded
+    digest instead of being hashed again.
+
+    Args:
+        problem (Problem): The problem being published.
+        pid (str): The problem ID.
+
+    Returns:
+        Path: The folder of the published version.
+    """
+    versions = problem_versions_path / pid
+    stage = versions / f".stage-{tools.random_string()}"
+    stage.mkdir(parents=True)
+    cache_file = problem.path / "publish_cache.json"
+    cache: dict[str, list] = tools.read_json(cache_file) if cache_file.is_file() else {}
+    new_cache: dict[str, list] = {}
+    reused = 0
+    for file in sorted(problem.path.rglob("*")):
+        rel = file.relative_to(problem.path)
+        if rel.parts[0] in publish_excluded or file.is_symlink():
+            continue
+        if file.is_dir():
+            (stage / rel).mkdir(parents=True, exist_ok=True)
+            continue
+        st = file.stat()
+        stamp = [st.st_size, st.st_mtime_ns, st.st_ino]
+        entry = cache.get(rel.as_posix())
+        if entry is not None and entry[0] == stamp and blobs.exists(entry[1]):
+            digest = entry[1]
+            reused += 1
+        else:
+            digest = blobs.put(file)
+        new_cache[rel.as_posix()] = [stamp, digest]
+        blobs.link(digest, stage / rel)
+    tools.write_json(new_cache, cache_file)
+    log(f"published {len(new_cache)} files, {reused} unchanged")
+    release = versions / f"{len(problem.versions)}-{tools.random_string()}"
+    stage.rename(release)
+    target = problem_path / pid
+    if target.is_dir() and not target.is_symlink():
+        raise RuntimeError(f"{target} was published before versioning and is not migrated yet")
+    tmp_link = problem_path / f".{pid}.{tools.random_string()}"
+    tmp_link.symlink_to(os.path.relpath(release, problem_path), target_is_directory=True)
+    os.replace(tmp_link, target)
+    return release
+
+
+def migrate_legacy_versions() -> None:
+    """
+    Move the problem folders published before versioning into the version store, behind a symlink.
+
+    This renames the folders, so it must run at startup before any submission is judged: a judge
+    resolves ``problem_path / pid`` once, and would lose its files if the folder moved mid-run.
+    """
+    if not problem_path.is_dir():
+        return
+    for target in problem_path.iterdir():
+        if target.name.startswith(".") or target.is_symlink() or not target.is_dir():
+            continue
+        versions = problem_versions_path / target.name
+        versions.mkdir(parents=True, exist_ok=True)
+        release = versions / f"legacy-{tools.random_string()}"
+        target.rename(release)
+        target.symlink_to(os.path.relpath(release, problem_path), target_is_directory=True)
+        logger.info(f"moved the published folder of problem {target.name!r} into {release}")
+
+
+def prune_versions(pid: str, current: Path) -> None:
+    """
+    Delete the old versions of a problem once no submission of it is being judged.
+
+    Judges resolve the version folder when they start, so versions are kept as long as any
+    submission of the problem is running; they are pruned by a later publish instead.
+
+    Args:
+        pid (str): The problem ID.
+        current (Path): The folder of the current version, which is always kept.
+    """
+    if datas.count(datas.Submission, pid=pid, running=True):
+        log("old versions are in use, keep them")
+        return
+    for folder in (problem_versions_path / pid).iterdir():
+        if folder != current:
+            shutil.rmtree(folder, ignore_errors=True)
+
+
 @background_actions.bind
-def do_import_polygon(pid: str, filename: str):
+def do_import_polygon(problem: Problem, pid: str, filename: str):
+    from pyzipper import AESZipFile
     zip_file = AESZipFile(filename, "r")
     filelist: list[AESZipInfo] = zip_file.filelist
     files: dict[str, AESZipInfo] = {o.filename: o for o in filelist if not o.is_dir()}
@@ -446,7 +703,8 @@ def do_import_polygon(pid: str, filename: str):
             if test.get("method") == "manual":
                 f = next(manual_tests)
                 fn = Path(f.filename).name
-                tools.write_binary(zip_file.read(f), path / "testcases" / fn)
+                with zip_file.open(f) as src:
+                    blobs.write_from(src, path / "testcases" / fn)
                 dat.testcases.append(objs.Testcase(in_file=fn, out_file=fn + ".out", group=group, uncompleted=True))
             else:
                 gen_cmds.append([test.get("cmd"), group])
@@ -524,22 +782,42 @@ def do_import_polygon(pid: str, filename: str):
     os.remove(filename)
 
 
+def take_background_action() -> dict:
+    """
+    Wait for the oldest pending action whose problem has no running action and mark it as running.
+
+    Returns:
+        dict: The action data.
+    """
+    with actions_changed:
+        while True:
+            for i, obj in enumerate(pending_actions[:]):
+                if obj["pid"] not in running_actions:
+                    del pending_actions[i]
+                    running_actions[obj["pid"]] = obj["idx"]
+                    return obj
+            actions_changed.wait(5)
+
+
+def release_background_action(pid: str):
+    with actions_changed:
+        running_actions.pop(pid, None)
+        cancelled_actions.pop(pid, None)
+        actions_changed.notify_all()
+
+
 def runner():
-    global current_pid, current_idx, problem
     while True:
-        action_data = worker_queue.get()
+        action_data = take_background_action()
+        pid = action_data["pid"]
+        token = current_action.set((pid, action_data.pop("idx")))
         try:
             logger.info(f"{action_data=}")
             action_name = action_data.pop("action")
-            current_idx = -1
-            if "idx" in action_data:
-                current_idx = action_data.pop("idx")
-            current_pid = action_data["pid"]
-            # time.sleep(1)
             log("start " + action_name)
             with datas.SessionContext():
-                with Problem(current_pid) as problem:
-                    background_actions.call(action_name, **action_data)
+                with Problem(pid) as problem:
+                    background_actions.call(action_name, problem, **action_data)
             end(True)
         except StopActionException:
             logger.debug("Stop Action")
@@ -549,6 +827,9 @@ def runner():
                 end(False)
             except StopActionException:
                 pass
+        finally:
+            current_action.reset(token)
+            release_background_action(pid)
         os.chdir(root_folder)
 
 
@@ -561,12 +842,48 @@ def add_background_action(obj: dict):
     idx = cnt + 1
     tools.write(str(idx), cntfile)
     obj["idx"] = idx
-    worker_queue.put(obj)
     cur = obj | {"completed": False}
     tools.write_json(cur, folder / f"{idx}.json")
+    with actions_changed:
+        pending_actions.append(obj)
+        actions_changed.notify_all()
+
+
+def restore_background_actions():
+    """
+    Queue again the background actions that were not completed before the last shutdown.
+    """
+    for cntfile in preparing_problem_path.glob("*/background_action_cnt"):
+        idx = tools.read(cntfile).strip()
+        path = cntfile.parent / "actions" / f"{idx}.json"
+        if idx == "0" or not path.is_file():
+            continue
+        dat = tools.read_json(path)
+        if not dat.get("completed", True):
+            dat.pop("completed")
+            logger.info(f"restore background action {dat!r}")
+            pending_actions.append(dat)
+
+
+def background_action_position(pid: str) -> int:
+    """
+    Get the queue position of the pending or running background action of a problem.
+
+    Args:
+        pid (str): The problem ID.
+
+    Returns:
+        int: 0 if the action is running, otherwise its 1-based position in the queue.
+    """
+    if pid in running_actions:
+        return 0
+    for i, obj in enumerate(pending_actions[:]):
+        if obj["pid"] == pid:
+            return i + 1
+    return 0
 
 
-def check_background_action(pid: str) -> tuple[str, str] | None:
+def check_background_action(pid: str) -> tuple[str, str, int] | None:
     cntfile = preparing_problem_path / pid / "background_action_cnt"
     idx = tools.read_default(cntfile, default="0")
     if idx == "0":
@@ -575,7 +892,40 @@ def check_background_action(pid: str) -> tuple[str, str] | None:
     dat = tools.read_json(path / f"{idx}.json")
     if dat["completed"]:
         return None
-    return tools.read(path / f"{idx}.log"), dat["action"]
+    return tools.read_default(path / f"{idx}.log", default=""), dat["action"], background_action_position(pid)
+
+
+def cancel_background_action(pid: str) -> bool:
+    """
+    Cancel the pending or running background action of a problem.
+
+    A pending action is removed from the queue at once, a running action stops at its next log line.
+
+    Args:
+        pid (str): The problem ID.
+
+    Returns:
+        bool: True if there was an action to cancel, False otherwise.
+    """
+    with actions_changed:
+        if pid in running_actions:
+            cancelled_actions[pid] = running_actions[pid]
+            return True
+        for i, obj in enumerate(pending_actions[:]):
+            if obj["pid"] == pid:
+                del pending_actions[i]
+                break
+        else:
+            return False
+    folder = preparing_problem_path / pid / "actions"
+    tools.append("cancelled\n", folder / f"{obj['idx']}.log")
+    with tools.Json(folder / f"{obj['idx']}.json") as dat:
+        dat["success"] = False
+        dat["completed"] = True
+        dat["cancelled"] = True
+    if "filename" in obj and os.path.isfile(obj["filename"]):
+        os.remove(obj["filename"])
+    return True
 
 
 @actions.default
@@ -631,7 +981,44 @@ def save_statement(form: ImmutableMultiDict[str, str], dat: Problem) -> str | Re
     return "statement"
 
 
-def render_statement(dat: Problem):
+def statement_key(dat: Problem) -> str:
+    """
+    Compute the key of the rendered statement of a problem.
+
+    The key covers the statement source, the renderer version and, for LaTeX statements, the
+    public files the LaTeX compiler can include.
+
+    Args:
+        dat (Problem): The problem.
+
+    Returns:
+        str: The hex digest of the key.
+    """
+    h = hashlib.sha256(f"{createhtml.renderer_version}\0{dat.pid}\0".encode())
+    h.update(json.dumps(objs.as_dict(dat.statement), sort_keys=True, default=str).encode())
+    if dat.statement.type == objs.StatementType.latex:
+        for f in sorted((dat.path / "public_file").iterdir()):
+            st = f.stat()
+            h.update(f"{f.name}:{st.st_size}:{st.st_mtime_ns}".encode())
+    return h.hexdigest()
+
+
+def render_statement(dat: Problem, force: bool = False) -> bool:
+    """
+    Render the statement of a problem unless it is already rendered from the same source and renderer.
+
+    Args:
+        dat (Problem): The problem.
+        force (bool, optional): Whether to render even if the statement is up to date. Defaults to False.
+
+    Returns:
+        bool: Whether the statement was rendered.
+    """
+    key = statement_key(dat)
+    key_file = dat.path / "statement.key"
+    if (not force and (dat.path / "statement.html").is_file() and
+            tools.read_default(key_file).strip() == key):
+        return False
     obj: objs.Statement = dataclasses.replace(dat.statement)
     if obj.type == objs.StatementType.latex:
         obj.main, obj.input, obj.output, obj.interaction, obj.scoring, obj.note = \
@@ -654,6 +1041,83 @@ def render_statement(dat: Problem):
     tools.write(full, dat.path / "statement.md")
     createhtml.parse.dirname = dat.pid
     tools.write(createhtml.run_markdown(full), dat.path / "statement.html")
+    tools.write(key, key_file)
+    return True
+
+
+def rerender_statements(force: bool = False) -> list[str]:
+    """
+    Render again the statements whose source or renderer changed since they were last rendered.
+
+    Args:
+        force (bool, optional): Whether to render every statement. Defaults to False.
+
+    Returns:
+        list[str]: The IDs of the problems whose statements were rendered.
+    """
+    rendered = []
+    for pid in [o.pid for o in datas.filter_by(datas.Problem).with_entities(datas.Problem.pid)]:
+        if pid == "test" or not (preparing_problem_path / pid).is_dir():
+            continue
+        with Problem(pid, False) as dat:
+            if render_statement(dat, force):
+                rendered.append(pid)
+    return rendered
+
+
+def check_zip_size(members: list["AESZipInfo"]) -> None:
+    """
+    Reject archives that would expand too much, before extracting anything.
+
+    The sizes in the central directory can be trusted because ``ZipFile.open`` never returns more
+    bytes than the declared size of a member.
+
+    Args:
+        members (list[AESZipInfo]): The members that will be extracted.
+    """
+    total = sum(o.file_size for o in members)
+    if total > config.judge.zip_max_size * 1024 * 1024:
+        server.custom_abort(400, f"Uncompressed size of the zip file exceeds {config.judge.zip_max_size} MB")
+    for o in members:
+        if o.file_size > 1024 * 1024 and o.file_size > o.compress_size * config.judge.zip_max_ratio:
+            server.custom_abort(400, f"Compression ratio of {o.filename!r} is too high")
+
+
+def zip_testcase_pairs(zip_file: "AESZipFile", input_ext: str,
+                       output_ext: str) -> list[tuple["AESZipInfo", "AESZipInfo"]]:
+    filelist = [o for o in zip_file.filelist if not o.is_dir()]
+    mp = {}
+    for o in filelist:
+        if o.filename.endswith(input_ext):
+            mp[o.filename[:-len(input_ext)] + output_ext] = o
+    ps = []
+    for o in filelist:
+        if o.filename in mp:
+            ps.append((mp[o.filename], o))
+    ps.sort(key=lambda x: x[0].filename)
+    return ps
+
+
+def save_upload(file) -> str:
+    """
+    Save an uploaded zip file for a background action and check it can be extracted safely.
+
+    Args:
+        file (FileStorage): The uploaded file.
+
+    Returns:
+        str: The path of the saved file, which the background action deletes.
+    """
+    from pyzipper import AESZipFile
+    filename = str(TempFile(".zip").path)
+    file.save(filename)
+    try:
+        with AESZipFile(filename, "r") as zip_file:
+            check_zip_size([o for o in zip_file.filelist if not o.is_dir()])
+    except Exception:
+        os.remove(filename)
+        raise
+    return filename
 
 
 @make_important
@@ -661,37 +1125,40 @@ def render_statement(dat: Problem):
 def upload_zip(form: ImmutableMultiDict[str, str], dat: Problem) -> str | Response:
     input_ext = form["input_ext"]
     output_ext = form["output_ext"]
-    file = request.files["zip_file"]
-    with TempFile(".zip") as tmpf:
-        filepath = tmpf.path
-        file.save(filepath)
-        zip_file = AESZipFile(filepath, "r")
-        files: list[AESZipInfo] = zip_file.filelist
-        filelist = [o for o in files if not o.is_dir()]
-        mp = {}
-        for o in filelist:
-            if o.filename.endswith(input_ext):
-                mp[o.filename[:-len(input_ext)] + output_ext] = o
-        ps = []
-        for o in filelist:
-            if o.filename in mp:
-                ps.append((mp[o.filename], o))
-        if len(ps) == 0:
+    from pyzipper import AESZipFile
+    filename = save_upload(request.files["zip_file"])
+    with AESZipFile(filename, "r") as zip_file:
+        if len(zip_testcase_pairs(zip_file, input_ext, output_ext)) == 0:
+            os.remove(filename)
             server.custom_abort(400, "No valid testcases found in the zip file")
-        fps = [(o.in_file, o.out_file) for o in dat.testcases]
-        testcases = dat.path / "testcases"
-        ps.sort(key=lambda x: x[0].filename)
-        for o in ps:
-            f0 = secure_filename(o[0].filename)
-            f1 = secure_filename(o[1].filename)
-            tools.write_binary(zip_file.read(o[0]), testcases / f0)
-            tools.write_binary(zip_file.read(o[1]), testcases / f1)
-            if (f0, f1) not in fps:
-                dat.testcases.append(objs.Testcase(in_file=f0, out_file=f1, sample="sample" in f0,
-                                                   pretest="pretest" in f0))
+    add_background_action({"action": "do_upload_zip", "pid": dat.pid, "filename": filename,
+                           "input_ext": input_ext, "output_ext": output_ext})
     return "tests"
 
 
+@background_actions.bind
+def do_upload_zip(problem: Problem, pid: str, filename: str, input_ext: str, output_ext: str):
+    from pyzipper import AESZipFile
+    try:
+        with AESZipFile(filename, "r") as zip_file:
+            ps = zip_testcase_pairs(zip_file, input_ext, output_ext)
+            fps = [(o.in_file, o.out_file) for o in problem.testcases]
+            testcases = problem.path / "testcases"
+            for i, o in enumerate(ps):
+                f0 = secure_filename(o[0].filename)
+                f1 = secure_filename(o[1].filename)
+                log(f"extracting testcase {i + 1}/{len(ps)}: {f0!r}")
+                with zip_file.open(o[0]) as src:
+                    blobs.write_from(src, testcases / f0)
+                with zip_file.open(o[1]) as src:
+                    blobs.write_from(src, testcases / f1)
+                if (f0, f1) not in fps:
+                    problem.testcases.append(objs.Testcase(in_file=f0, out_file=f1, sample="sample" in f0,
+                                                           pretest="pretest" in f0))
+    finally:
+        os.remove(filename)
+
+
 @actions.bind
 def upload_testcase(form: ImmutableMultiDict[str, str], dat: Problem) -> str | Response:
     input_name = secure_filename(form["input_name"])
@@ -704,10 +1171,8 @@ def upload_testcase(form: ImmutableMultiDict[str, str], dat: Problem) -> str | R
     output_content = form["output_content"]
     if input_path.exists() or output_path.exists():
         server.custom_abort(409, "Testcase file already exists")
-    with input_path.open("w") as f:
-        f.write(input_content)
-    with output_path.open("w") as f:
-        f.write(output_content)
+    blobs.write(input_content.encode(), input_path)
+    blobs.write(output_content.encode(), output_path)
     dat.testcases.append(objs.Testcase(in_file=input_name, out_file=output_name, sample=False, pretest=False))
     return "tests"
 
@@ -1027,6 +1492,7 @@ def protect_problem(form: ImmutableMultiDict[str, str], dat: Problem) -> str | R
     if not dat.sql_data.is_public:
         server.custom_abort(400, "Problem is already protected")
     dat.sql_data.is_public = False
+    datas.ProblemSummary.of(dat.sql_data).is_public = False
     return "general_info"
 
 
@@ -1037,6 +1503,7 @@ def public_problem(form: ImmutableMultiDict[str, str], dat: Problem) -> str | Re
     if len(dat.versions) == 0:
         server.custom_abort(409, "Cannot public problem without any version")
     dat.sql_data.is_public = True
+    datas.ProblemSummary.of(dat.sql_data).is_public = True
     return "general_info"
 
 
@@ -1103,21 +1570,26 @@ def remove_gen_group(form: ImmutableMultiDict[str, str], dat: Problem) -> str |
 
 @actions.bind
 def import_polygon(form: ImmutableMultiDict[str, str], dat: Problem) -> str | Response:
-    file = request.files["zip_file"]
-    filename = str(TempFile(".zip").path)
-    file.save(filename)
+    filename = save_upload(request.files["zip_file"])
     add_background_action({"action": "do_import_polygon", "pid": dat.pid, "filename": filename})
     return "import"
 
 
 @actions.bind
 def import_problem(form: ImmutableMultiDict[str, str], dat: Problem) -> str | Response:
-    zip_file = request.files["zip_file"]
-    with TempFile(".zip") as tmp:
-        zip_file.save(tmp.path)
+    filename = save_upload(request.files["zip_file"])
+    add_background_action({"action": "do_import_problem", "pid": dat.pid, "filename": filename})
+    return "import"
+
+
+@background_actions.bind
+def do_import_problem(problem: Problem, pid: str, filename: str):
+    from pyzipper import AESZipFile
+    dat = problem
+    try:
         dirs = ("file", "public_file", "testcases")
         files = ("statement.html", "statement.md")
-        with AESZipFile(tmp.path, "r") as zf:
+        with AESZipFile(filename, "r") as zf:
             for file in zf.filelist:
                 file: AESZipInfo
                 if file.filename == "info.json":
@@ -1127,38 +1599,123 @@ def import_problem(form: ImmutableMultiDict[str, str], dat: Problem) -> str | Re
                     try:
                         new_dat = objs.ProblemInfo(**json_data)
                     except ValueError:
-                        custom_abort(400, "Invalid JSON data in info.json")
+                        log("invalid JSON data in info.json")
+                        end(False)
                     dat.update(json_data)
                     dat.users = users
                     dat.public_testcase = public_testcase
-            for file in zf.filelist:
+            members = [o for o in zf.filelist if not o.is_dir()]
+            for i, file in enumerate(members):
                 file: AESZipInfo
+                log(f"extracting {i + 1}/{len(members)}: {file.filename!r}")
                 if file.filename in files:
                     zf.extract(file, dat.path)
                 elif file.filename == "info.json":
                     pass
                 else:
                     dir_name = Path(file.filename).parent.name
-                    if dir_name in dirs:
+                    if dir_name == "testcases":
+                        with zf.open(file) as src:
+                            blobs.write_from(src, dat.path / "testcases" / secure_filename(Path(file.filename).name))
+                    elif dir_name in dirs:
                         zf.extract(file, dat.path)
+    finally:
+        os.remove(filename)
     render_statement(dat)
-    return "import"
+
+
+class ZipStream(io.RawIOBase):
+    """
+    A write-only, unseekable stream that collects what a ZipFile writes until it is taken.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.buffer += b
+        return len(b)
+
+    def take(self) -> bytes:
+        out = bytes(self.buffer)
+        self.buffer.clear()
+        return out
+
+
+def stream_export(pid: str, entries: list[tuple[str, Path]], info: str, store_testcases: bool,
+                  cache_file: Path) -> Iterator[bytes]:
+    """
+    Generate a problem archive chunk by chunk, keeping a copy as the cached export once complete.
+
+    Args:
+        pid (str): The problem ID.
+        entries (list[tuple[str, Path]]): The archive names and paths of the files to include.
+        info (str): The content of info.json.
+        store_testcases (bool): Whether to store testcases without compression.
+        cache_file (Path): Where to keep the complete archive.
+
+    Yields:
+        bytes: The next part of the archive.
+    """
+    part = cache_file.with_name(f"{cache_file.stem}.{tools.random_string()}.part")
+    stream = ZipStream()
+    try:
+        with part.open("wb") as out:
+            with ZipFile(stream, "w", ZIP_DEFLATED) as zf:
+                for arcname, path in entries:
+                    zinfo = ZipInfo.from_file(path, arcname)
+                    stored = store_testcases and arcname.startswith("testcases/")
+                    zinfo.compress_type = ZIP_STORED if stored else ZIP_DEFLATED
+                    with path.open("rb") as src, zf.open(zinfo, "w") as dst:
+                        for chunk in iter(lambda: src.read(1 << 20), b""):
+                            dst.write(chunk)
+                            data = stream.take()
+                            out.write(data)
+                            yield data
+                zf.writestr("info.json", info)
+            data = stream.take()
+            out.write(data)
+            yield data
+    except BaseException:
+        part.unlink(missing_ok=True)
+        raise
+    part.rename(cache_file)
+    for old in cache_file.parent.glob(f"{pid}-*.zip"):
+        if old != cache_file:
+            old.unlink(missing_ok=True)
 
 
 @actions.bind
 def export_problem(form: ImmutableMultiDict[str, str], dat: Problem) -> str | Response:
-    filename = tmp_path / f"{tools.random_string()}.zip"
+    store_testcases = form.get("store_testcases", request.args.get("store_testcases", "off")) == "on"
     dirs = ("file", "public_file", "testcases")
     files = ("statement.html", "statement.md")
-    with AESZipFile(filename, "w") as zf:
-        for name in dirs:
-            f: Path
-            for f in (dat.path / name).iterdir():
-                zf.write(f, f.relative_to(dat.path))
-        for f in files:
-            zf.write(dat.path / f, f)
-        zf.writestr("info.json", json.dumps(objs.as_dict(dat), indent=4))
-    return sending_file(filename)
+    entries = []
+    for name in dirs:
+        f: Path
+        for f in sorted((dat.path / name).iterdir()):
+            if f.is_file():
+                entries.append((f.relative_to(dat.path).as_posix(), f))
+    for f in files:
+        entries.append((f, dat.path / f))
+    info = json.dumps(objs.as_dict(dat), indent=4)
+    key = hashlib.sha256(info.encode())
+    key.update(str(store_testcases).encode())
+    for arcname, f in entries:
+        st = f.stat()
+        key.update(f"{arcname}:{st.st_size}:{st.st_mtime_ns}".encode())
+    export_path = tmp_path / "exports"
+    export_path.mkdir(parents=True, exist_ok=True)
+    cache_file = export_path / f"{dat.pid}-{key.hexdigest()[:32]}.zip"
+    if cache_file.is_file():
+        return sending_file(cache_file)
+    return Response(stream_with_context(stream_export(dat.pid, entries, info, store_testcases, cache_file)),
+                    mimetype="application/zip",
+                    headers={"Content-Disposition": f"attachment; filename={dat.pid}.zip"})
 
 
 def action(form: ImmutableMultiDict[str, str]) -> Response:
@@ -28,9 +28,8 @@ from io import BytesIO, TextIOWrapper
 from flask import render_template, request, jsonify
 from flask_login import login_required, current_user
 from limits import parse
-from openpyxl import load_workbook
 
-from .. import tools, server, datas, login, config
+from .. import tools, server, datas, login, config, tasks
 from ..objs import Permission
 
 app = server.app
@@ -65,6 +64,7 @@ def parse_user():
     try:
         in_memory_file = BytesIO(file.stream.read())
         if ext == ".xlsx":
+            from openpyxl import load_workbook
             wb = load_workbook(in_memory_file, data_only=True)
             ws = wb.active
             arr = [[str(cell.value) for cell in row] for row in ws.iter_rows()]
@@ -226,7 +226,7 @@ def admin():
         users = datas.query(datas.User).all()
         config_fields = config.get_fields()
         return render_template("admin.html", users=users, config_fields=config_fields,
-                               enumerate=enumerate)
+                               queue_stats=tasks.queue_stats(), enumerate=enumerate)
     else:
         if request.form["action"] == "update_user":
             return update_user()
@@ -70,6 +70,8 @@ gen_key_output = ns.model("GenKeyOutput", {
 user_info_output = ns.model("UserInfoOutput", {
     "username": fields.String,
     "display_name": fields.String,
+    "solved": fields.List(fields.String, description="Public problems the user has solved"),
+    "attempted": fields.List(fields.String, description="Public problems the user has attempted but not solved"),
 })
 # endregion
 
@@ -153,7 +155,7 @@ class Signup(Resource):
 class GetCode(Resource):
     @ns.doc("get_verification_code")
     @ns.expect(get_code_input)
-    @server.limiter.limit(config.smtp.limit, override_defaults=False)
+    @server.route_limit(config.smtp.limit, override_defaults=False)
     def post(self):
         """Send an email verification code."""
         if not config.smtp.enabled:
@@ -288,5 +290,7 @@ class UserInfo(Resource):
         user_data = user.data
         return api_response({
             "username": username,
-            "display_name": user_data.display_name
+            "display_name": user_data.display_name,
+            "solved": user_data.public_problem_pids(True),
+            "attempted": user_data.public_problem_pids(False)
         })
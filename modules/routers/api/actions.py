@@ -21,7 +21,7 @@ from flask import request, Response
 from flask_restx import Resource
 from werkzeug.utils import secure_filename
 
-from .base import get_api_user, api_response, api, request_parser, Form, File, base_request_parser
+from .base import get_api_user, api_response, api, request_parser, Form, File, Args, base_request_parser
 from ... import problemsetting, datas, objs, executing, server
 from ...constants import problem_path
 
@@ -499,7 +499,10 @@ class ImportProblem(Resource):
 @ns.route("/export/standard")
 class ExportProblem(Resource):
     action_name = "export_problem"
-    action_input = base_request_parser
+    action_input = request_parser(
+        Args("store_testcases", "Store testcases without compression", str, required=False, default="off",
+             choices=["on", "off"])
+    )
 
     @ns.doc("problem_" + action_name)
     @ns.expect(action_input)
@@ -22,7 +22,7 @@ from flask_restx import Resource, fields
 from .base import get_api_user, api_response, api, marshal_with, base_request_parser, request_parser, Form, paging, \
     pagination, Args
 from .. import admin
-from ... import objs, server, config, datas
+from ... import objs, server, config, datas, tasks, search
 
 ns = api.namespace("admin", path="/admin", description="admin API endpoints")
 
@@ -47,6 +47,16 @@ config_save_input = request_parser(
     Form("config", type=str, required=True, help="Configuration data in JSON format")
 )
 
+judge_queue_output = ns.model("JudgeQueueOutput", {
+    "classes": fields.List(fields.Nested(ns.model("JudgeQueueClass", {
+        "name": fields.String(description="Judge class name"),
+        "pending": fields.Integer(description="Number of pending submissions"),
+        "running": fields.Integer(description="Number of running submissions"),
+        "reserved": fields.Integer(description="Number of workers reserved for this class"),
+        "max_wait": fields.Integer(description="Wait time of the oldest pending submission in seconds"),
+    })), description="Queue state of each judge class"),
+})
+
 get_user_input = request_parser(
     Args("username", type=str, required=False, help="Filter by username"),
     *paging()
@@ -109,6 +119,19 @@ class StopServer(Resource):
         })
 
 
+@ns.route("/judge_queue")
+class JudgeQueue(Resource):
+    @ns.doc("get_judge_queue")
+    @ns.expect(base_request_parser)
+    @marshal_with(ns, judge_queue_output)
+    def get(self):
+        """Get queue depth and wait time of each judge class"""
+        user = get_api_user(base_request_parser.parse_args())
+        if not user.has(objs.Permission.root):
+            server.custom_abort(403, "Forbidden: Root access required")
+        return api_response({"classes": tasks.queue_stats()})
+
+
 @ns.route("/users")
 class AdminUsers(Resource):
     @ns.doc("get_all_users")
@@ -121,7 +144,11 @@ class AdminUsers(Resource):
             server.custom_abort(403, "Forbidden: Root access required")
         qry = datas.query(datas.User)
         if args.get("username"):
-            qry = qry.filter(datas.User.username.like(f"%{args['username']}%"))
+            # the index narrows the candidates; the LIKE keeps the filter on the username only
+            tokens = search.name_query(args["username"])
+            if tokens:
+                qry = qry.filter(datas.User.id.in_(search.matches("user", tokens)))
+            qry = qry.filter(datas.User.username.like(search.like_pattern(args["username"]), escape="\\"))
         got_data, page_cnt, page_idx, show_pages = pagination(qry, args)
         out = []
         for obj in got_data:
@@ -16,23 +16,34 @@ GNU Affero General Public License for more details.
 You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
+import gzip
 import traceback
 from dataclasses import dataclass
 from functools import wraps
 from typing import Any
 
-from flask import Blueprint, request
+from flask import Blueprint, request, make_response, Response
 from flask_login import current_user, AnonymousUserMixin
 from flask_restx import Api, fields, Namespace, reqparse
+from flask_restx.representations import output_json
 from flask_restx.reqparse import ParseResult
 from flask_wtf.csrf import validate_csrf
 from loguru import logger
 from werkzeug.datastructures import FileStorage
 from werkzeug.exceptions import BadRequestKeyError, HTTPException
 
-from ... import server, login, objs, tools, constants, datas
+from ... import server, login, objs, tools, constants, config
 from ...constants import log_path
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 app = server.app
 
 blueprint = Blueprint("api", __name__, url_prefix="/api")
@@ -42,6 +53,62 @@ api = Api(blueprint, title="OrangeJudge API", description="API for OrangeJudge,
           doc="/api-docs")
 
 
+gzip_level = 5
+brotli_quality = 5
+
+
+def json_default(obj: Any) -> Any:
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+@api.representation("application/json")
+def output_fast_json(data: Any, code: int, headers: dict | None = None) -> Response:
+    """
+    Serialize an API response with orjson if it is enabled and installed, or with the flask-restx default.
+
+    Args:
+        data (Any): The response data.
+        code (int): The HTTP status code.
+        headers (dict | None): Extra response headers.
+
+    Returns:
+        Response: The response.
+    """
+    if orjson is None or not config.server.api_orjson:
+        return output_json(data, code, headers)
+    resp = make_response(orjson.dumps(data, default=json_default, option=orjson.OPT_NON_STR_KEYS), code)
+    resp.headers.extend(headers or {})
+    resp.mimetype = "application/json"
+    return resp
+
+
+@blueprint.after_request
+def compress_response(response: Response) -> Response:
+    """
+    Compress large JSON responses with brotli or gzip, whichever the client accepts.
+
+    Only responses of at least ``server.api_compress_size`` bytes are compressed; 0 disables compression.
+    """
+    threshold = config.server.api_compress_size
+    if (threshold <= 0 or response.is_streamed or response.mimetype != "application/json" or
+            "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) < threshold:
+        return response
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        response.set_data(brotli.compress(data, quality=brotli_quality))
+        response.headers["Content-Encoding"] = "br"
+    elif accepted["gzip"]:
+        response.set_data(gzip.compress(data, compresslevel=gzip_level, mtime=0))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
 @api.errorhandler(BadRequestKeyError)
 def handle_missing_param(e):
     missing_key = e.args[0] if e.args else "unknown"
@@ -151,11 +218,11 @@ def get_api_user(args: ParseResult, required: objs.Permission | None = None, req
                 server.custom_abort(403, "Missing API key")
             else:
                 key = "PLACEHOLDER_FOR_ANON_USER"
-        data_user = datas.first(datas.User, api_key=login.try_hash(key))
-        if data_user is None and require_login:
+        api_user = login.get_api_key_user(key)
+        if api_user is None and require_login:
             server.custom_abort(403, "API key not match")
-        if data_user:
-            user = login.User(data_user.username)
+        if api_user:
+            user = api_user
         else:
             user = anon_user
     if required is not None and not user.has(required):
@@ -177,7 +244,16 @@ def api_response(data: dict, status_code: int = 200) -> tuple[dict, int]:
     return {"status": "success", "data": data}, status_code
 
 
-def marshal_with(ns: Namespace, success_model):
+def marshal_with(ns: Namespace, success_model, shaped: bool = False):
+    """
+    Document the responses of an endpoint and marshal its successful responses with a model.
+
+    Args:
+        ns (Namespace): The namespace of the endpoint.
+        success_model: The model of the data of a successful response.
+        shaped (bool): Whether the endpoint already returns data of exactly the model's shape and types.
+            Such responses skip marshalling, which is costly for large lists; the model is only documented.
+    """
     def error_model(code, description):
         return code, description, ns.model("ErrorResponse" + str(code), {
             "status": fields.String(required=True, example="error"),
@@ -197,7 +273,10 @@ def marshal_with(ns: Namespace, success_model):
         f = ns.response(*error_model(409, "Conflict"))(f)
         f = ns.response(*error_model(500, "Internal Server Error"))(f)
         f = ns.response(*error_model(503, "Service Unavailable"))(f)
-        f = ns.marshal_with(true_success_model, code=200, description="Success")(f)
+        if shaped:
+            f = ns.response(200, "Success", true_success_model)(f)
+        else:
+            f = ns.marshal_with(true_success_model, code=200, description="Success")(f)
 
         @wraps(func)
         def wrapper(*args, **kwargs):
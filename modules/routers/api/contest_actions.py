@@ -16,7 +16,6 @@ GNU Affero General Public License for more details.
 You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
-from datetime import timedelta
 
 from flask import request, Response
 from flask_restx import Resource, fields
@@ -48,10 +47,8 @@ def do_action(cid: str, action_name: str, action_input):
     cdat.datas = dat
     datas.add(cdat)
     if action_name == "change_settings":
-        for the_per in cdat.periods:
-            the_per: datas.Period
-            the_per.end_time = the_per.start_time + timedelta(minutes=dat.elapsed)
-        datas.add(*cdat.periods)
+        datas.flush()
+        cdat.set_period_duration(dat.elapsed)
 
     if isinstance(result, str):
         return api_response({"message": "OK", "view_hint": result})
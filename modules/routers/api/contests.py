@@ -16,11 +16,9 @@ GNU Affero General Public License for more details.
 You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
-import time
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from flask_restx import Resource, fields
-from sqlalchemy.orm.attributes import flag_modified
 
 from .base import (
     api,
@@ -34,7 +32,7 @@ from .base import (
     pagination,
     base_request_parser
 )
-from ... import contests, datas, executing, objs, tools, constants, server
+from ... import contests, datas, executing, objs, tools, constants, server, problem_cache
 from ...objs import Permission
 
 ns = api.namespace("contests", path="/contest", description="Contest related API endpoints")
@@ -170,6 +168,11 @@ contest_status_input = request_parser(
 )
 virtual_register_input = request_parser(
     Form("start_time", "Start time for virtual contest (YYYY-MM-DD HH:MM)", required=True))
+standing_export_input = request_parser(
+    Args("format", "Export format", str, required=True, choices=list(contests.export_formats.keys())),
+    Args("official_only", "Only export rows of the main period", str, required=False, default="no",
+         choices=["no", "yes"])
+)
 question_input = request_parser(
     Form("title", "Title of the question", required=True),
     Form("content", "Content of the question", required=True)
@@ -199,9 +202,10 @@ class ContestList(Resource):
             contest: datas.Contest
             info: objs.ContestData = contest.datas
             status, _, _ = contests.check_status(contest, user)
-            can_vir = contest.can_virtual() and user.is_authenticated and user.id not in info.virtual_participants
+            can_vir = (contest.can_virtual() and user.is_authenticated and
+                       contest.virtual_period_of(user.data.id) is None)
             can_reg = info.can_register and user.is_authenticated
-            is_reg = user.is_authenticated and user.id in info.participants
+            is_reg = user.is_authenticated and contest.has_participant(user.data.id)
             contests_data.append({
                 "cid": contest.cid,
                 "name": contest.name,
@@ -286,8 +290,8 @@ class Contest(Resource):
             "problems": [{"pid": pid, "name": p.name} for pid, p in info.problems.items()],
             "announcements": announcements_data,
             "questions": questions_data,
-            "is_registered": user.is_authenticated and user.id in info.participants,
-            "is_virtual_participant": user.is_authenticated and user.id in info.virtual_participants,
+            "is_registered": user.is_authenticated and dat.has_participant(user.data.id),
+            "is_virtual_participant": user.is_authenticated and dat.virtual_period_of(user.data.id) is not None,
             "can_register": info.can_register and user.is_authenticated,
             "target": target
         })
@@ -381,13 +385,11 @@ class ContestRegister(Resource):
         info = dat.datas
         if not info.can_register or per.is_over():
             server.custom_abort(403, "Registration is not open")
-        if user.id in info.participants:
+        if (dat.has_participant(user.data.id) or
+                not datas.add_unique(datas.ContestParticipant(contest_id=dat.id, user_id=user.data.id,
+                                                              is_virtual=False))):
             server.custom_abort(409, "User already registered")
 
-        info.participants.append(user.id)
-        dat.datas = info
-        flag_modified(dat, "data")
-        datas.add(dat)
         return api_response({"message": "Successfully registered"})
 
 
@@ -410,13 +412,11 @@ class ContestUnregister(Resource):
         info = dat.datas
         if not info.can_register:
             server.custom_abort(403, "Cannot unregister from this contest")
-        if user.id not in info.participants:
+        obj = dat.participations.filter_by(user_id=user.data.id, is_virtual=False).first()
+        if obj is None:
             server.custom_abort(409, "User is not registered")
 
-        info.participants.remove(user.id)
-        dat.datas = info
-        flag_modified(dat, "data")
-        datas.add(dat)
+        datas.delete(obj)
         return api_response({"message": "Successfully unregistered"})
 
 
@@ -436,8 +436,7 @@ class ContestParticipants(Resource):
         dat: datas.Contest = datas.first(datas.Contest, cid=cid)
         if dat is None:
             server.custom_abort(404, "Contest not found")
-        info = dat.datas
-        return api_response({"participants": info.participants})
+        return api_response({"participants": dat.participant_names()})
 
 
 @ns.route("/<string:cid>/virtual")
@@ -456,30 +455,13 @@ class ContestVirtual(Resource):
         dat: datas.Contest = datas.first(datas.Contest, cid=cid)
         if dat is None:
             server.custom_abort(404, "Contest not found")
-        info = dat.datas
         if not dat.can_virtual():
             server.custom_abort(403, "This contest does not support virtual participation")
-        if user.id in info.virtual_participants:
+        if dat.virtual_period_of(user.data.id) is not None:
             server.custom_abort(409, "User already registered for a virtual contest")
 
         start_time: datetime = tools.to_datetime(args["start_time"], second=0, microsecond=0)
-        per = datas.Period.query.filter_by(start_time=start_time, contest=dat, is_virtual=True).first()
-        if per:
-            idx = per.id
-        else:
-            nw_per = datas.Period(
-                start_time=start_time,
-                end_time=start_time + timedelta(minutes=info.elapsed),
-                contest=dat,
-                is_virtual=True
-            )
-            datas.add(nw_per)
-            datas.flush()
-            idx = nw_per.id
-
-        info.virtual_participants[user.id] = idx
-        flag_modified(dat, "data")
-        datas.add(dat)
+        contests.add_virtual_participant(dat, user.data.id, start_time)
         return api_response({"message": "Successfully registered for virtual contest"})
 
 
@@ -488,7 +470,7 @@ class ContestVirtual(Resource):
 class ContestStanding(Resource):
     @ns.doc("get_contest_standing")
     @ns.expect(base_request_parser)
-    @marshal_with(ns, standing_output)
+    @marshal_with(ns, standing_output, shaped=True)
     def get(self, cid: str):
         """Get contest standings (scoreboard)"""
         args = base_request_parser.parse_args()
@@ -499,16 +481,34 @@ class ContestStanding(Resource):
         can_edit = contests.check_super_access(cdat, user)
         if not can_edit and cdat.hidden:
             server.custom_abort(404, "Contest not found")
-        info = cdat.datas
-        dt = time.time() - info.start
-        dt = dt / 60 - info.elapsed
-        can_see = (info.standing.public and (dt <= -info.standing.start_freeze or dt >= info.standing.end_freeze))
-        if not can_see and not contests.check_super_access(cdat, user):
+        if not contests.can_see_standing(cdat, user):
             server.custom_abort(403, "Standings are not public at this time")
         dat = contests.get_standing(cid)
         return api_response(dat)
 
 
+@ns.route("/<string:cid>/standing/export")
+@ns.param("cid", "The contest ID")
+class ContestStandingExport(Resource):
+    @ns.doc("export_contest_standing", description="Download the ranked standings as CSV, XLSX or NDJSON.")
+    @ns.expect(standing_export_input)
+    @ns.produces(["text/csv", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                  "application/x-ndjson"])
+    def get(self, cid: str):
+        """Export contest standings"""
+        args = standing_export_input.parse_args()
+        user = get_api_user(args)
+        cdat: datas.Contest = datas.first(datas.Contest, cid=cid)
+        if cdat is None:
+            server.custom_abort(404, "Contest not found")
+        can_edit = contests.check_super_access(cdat, user)
+        if not can_edit and cdat.hidden:
+            server.custom_abort(404, "Contest not found")
+        if not contests.can_see_standing(cdat, user):
+            server.custom_abort(403, "Standings are not public at this time")
+        return contests.export_standing(cdat, args["format"], args["official_only"] == "yes")
+
+
 @ns.route("/<string:cid>/questions")
 @ns.param("cid", "The contest ID")
 class ContestQuestion(Resource):
@@ -577,7 +577,7 @@ class RejectSubmission(Resource):
 @ns.param("pid", "The problem ID within the contest")
 class ContestProblem(Resource):
     @ns.doc("get_contest_problem")
-    @marshal_with(ns, contest_problem_detail_model)
+    @marshal_with(ns, contest_problem_detail_model, shaped=True)
     def get(self, cid: str, pid: str):
         """Get details of a specific problem in a contest"""
         args = base_request_parser.parse_args()
@@ -603,17 +603,7 @@ class ContestProblem(Resource):
         p_info = pdat.datas
 
         langs = [lang for lang in executing.langs.keys() if pdat.lang_allowed(lang)]
-        path = constants.problem_path / pdat.pid
-        statement = tools.read(path / "statement.md") if (path / "statement.md").is_file() else ""
-        statement_html = tools.read(path / "statement.html") if (path / "statement.html").is_file() else ""
-        dat = pdat.datas
-        samples = dat.manual_samples
-        samples.extend([objs.ManualSample(tools.read(path / "testcases" / o.in_file),
-                                          tools.read(path / "testcases" / o.out_file))
-                        for o in dat.testcases if o.sample])
-        samples.extend([objs.ManualSample(tools.read(path / "testcases_gen" / o.in_file),
-                                          tools.read(path / "testcases_gen" / o.out_file))
-                        for o in dat.testcases_gen if o.sample])
+        payload = problem_cache.problem_payload(pdat.pid, p_info)
 
         problem_data = {
             "pid": pid,
@@ -623,11 +613,11 @@ class ContestProblem(Resource):
             "allowed_languages": langs,
             "contest_cid": cid,
             "contest_name": cdat.name,
-            "time_limit": p_info.timelimit,
-            "memory_limit": p_info.memorylimit,
-            "statement": statement,
-            "statement_html": statement_html,
-            "samples": [{"input": o.in_txt, "output": o.out_txt} for o in samples],
+            "time_limit": float(p_info.timelimit),
+            "memory_limit": int(p_info.memorylimit),
+            "statement": payload["statement_md"],
+            "statement_html": payload["statement_html"],
+            "samples": [{"input": o[0], "output": o[1]} for o in payload["samples"]],
         }
 
         return api_response(problem_data)
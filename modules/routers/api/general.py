@@ -20,16 +20,14 @@ import os
 
 from flask_login import login_user, logout_user, current_user
 from flask_restx import Resource, fields
-from pygments import lexers
 
 from .base import get_api_user, api_response, api, marshal_with, request_parser, Args, Form, paging, pagination, \
     base_request_parser
-from ... import submitting, datas, objs, tools, executing, tasks, contests, server, constants, login, config
+from ... import submitting, datas, objs, tools, executing, tasks, contests, server, constants, login, config, \
+    search
 
 ns = api.namespace("general", path="/", description="General API endpoints")
 
-prepares = {k: lexers.get_lexer_by_name(k) for lexer in lexers.get_all_lexers() for k in lexer[1]}
-
 # region Models
 submission_post_input = request_parser(
     Form("lang", "Programming language used for submission"),
@@ -42,6 +40,18 @@ submission_post_output = ns.model("SubmissionOutput", {
     "submission_id": fields.String(description="ID of the submission created")
 })
 submission_get_input = request_parser(Args("submission_id", "Id of the submission to retrieve", int))
+submission_wait_input = request_parser(
+    Args("state", "State token from the previous call; returns as soon as the state differs from it", str,
+         required=False, default=""),
+    Args("timeout", "Maximum waiting time in seconds, capped by the server", int, required=False, default=25)
+)
+submission_wait_output = ns.model("SubmissionWaitOutput", {
+    "completed": fields.Boolean(description="Whether the submission is completed"),
+    "running": fields.Boolean(description="Whether the submission is being judged"),
+    "simple_result": fields.String(description="Simple result string"),
+    "pos": fields.Integer(description="Position in the judging queue, 0 if not queued"),
+    "state": fields.String(description="State token to pass to the next call")
+})
 submission_get_output = ns.model("SubmissionDetailsOutput", {
     "lang": fields.String(description="Programming language used for the submission"),
     "source_code": fields.String(description="Source code of the submission"),
@@ -203,6 +213,32 @@ class Submission(Resource):
         return api_response(ret)
 
 
+@ns.route("/submission/<int:submission_id>/wait")
+@ns.param("submission_id", "Id of the submission to wait for")
+class SubmissionWait(Resource):
+    @ns.doc("wait_submission")
+    @ns.expect(submission_wait_input)
+    @marshal_with(ns, submission_wait_output)
+    def get(self, submission_id: int):
+        """Wait until a submission changes state or moves in the judging queue.
+
+        With sync workers, every waiting request would hold a whole worker, so the current state is
+        returned at once instead.
+        """
+        args = submission_wait_input.parse_args()
+        user = get_api_user(args)
+        dat = datas.first(datas.Submission, id=submission_id)
+        if dat is None:
+            server.custom_abort(404, "Submission not found.")
+        if (not user.has(objs.Permission.admin) and dat.user_id != user.data.id and
+                user.id not in dat.problem.datas.users):
+            server.custom_abort(403, "You do not have permission to view this submission.")
+        timeout = min(max(args["timeout"], 0), config.server.wait_timeout)
+        if config.server.worker_class != "gevent":
+            timeout = 0
+        return api_response(tasks.wait_submission(dat.id, args["state"], timeout))
+
+
 @ns.route("/status")
 class Status(Resource):
     @ns.doc("get_global_status")
@@ -426,10 +462,9 @@ class Login(Resource):
         password = args.get("password")
 
         if api_key:
-            user_data = datas.first(datas.User, api_key=login.try_hash(api_key))
-            if user_data is None:
+            user = login.get_api_key_user(api_key)
+            if user is None:
                 server.custom_abort(401, "Invalid API key.")
-            user = login.User(user_data.username)
             login_user(user)
             return api_response({"logged_in": True, "username": user.id, "display_name": user.data.display_name,
                                  "permissions": [perm for perm in user.data.permission_list()]})
@@ -452,3 +487,59 @@ class Login(Resource):
             server.custom_abort(403, "User is not logged in.")
         logout_user()
         return api_response({"message": "Logged out successfully."})
+
+
+search_input = request_parser(
+    Args("q", "Words to search for", type=str),
+    Args("kind", "Kind of documents to search", type=str, required=False, default="problem",
+         choices=search.kinds),
+    Args("limit", "Maximum number of results", type=int, required=False, default=50)
+)
+search_item = ns.model("SearchItem", {
+    "id": fields.String(description="Problem ID, username or submission ID"),
+    "title": fields.String(description="Problem name, display name or problem ID of the submission"),
+})
+search_output = ns.model("SearchOutput", {
+    "data": fields.List(fields.Nested(search_item), description="Matching documents, newest first"),
+})
+
+
+@ns.route("/search")
+class Search(Resource):
+    @ns.doc("search")
+    @ns.expect(search_input)
+    @marshal_with(ns, search_output)
+    def get(self):
+        """Search problems by statement, users by name or, for admins, submissions by source code."""
+        args = search_input.parse_args()
+        user = get_api_user(args, require_login=False)
+        is_admin = user.is_authenticated and user.has(objs.Permission.admin)
+        limit = min(max(args["limit"], 1), 200)
+        out = []
+        match args["kind"]:
+            case "problem":
+                qry = datas.query(datas.ProblemSummary).filter(
+                    datas.ProblemSummary.problem_id.in_(search.matches("problem", search.text_query(args["q"]))))
+                if not is_admin:
+                    qry = qry.filter(datas.ProblemSummary.is_public)
+                for obj in qry.order_by(datas.ProblemSummary.problem_id.desc()).limit(limit):
+                    out.append({"id": obj.pid, "title": obj.name})
+            case "user":
+                tokens = search.name_query(args["q"])
+                qry = datas.query(datas.User)
+                if tokens:
+                    qry = qry.filter(datas.User.id.in_(search.matches("user", tokens)))
+                else:
+                    qry = qry.filter(datas.User.username.like(search.like_pattern(args["q"]), escape="\\"))
+                for obj in qry.order_by(datas.User.id.desc()).limit(limit):
+                    out.append({"id": obj.username, "title": obj.display_name})
+            case "submission":
+                if not is_admin:
+                    server.custom_abort(403, "Forbidden: Admin access required")
+                if not config.server.search_submissions:
+                    server.custom_abort(409, "Searching submissions is disabled")
+                ids = search.search_submissions(args["q"], limit)
+                qry = datas.query(datas.Submission).filter(datas.Submission.id.in_(ids))
+                for obj in qry.order_by(datas.Submission.id.desc()):
+                    out.append({"id": str(obj.id), "title": obj.pid})
+        return api_response({"data": out})
@@ -24,7 +24,7 @@ from werkzeug.utils import secure_filename
 
 from .base import (get_api_user, api_response, api, marshal_with, request_parser, Form, paging, pagination, Args, File,
                    base_request_parser)
-from ... import objs, problemsetting, datas, executing, constants, tools, config, server, contests
+from ... import objs, problemsetting, datas, executing, constants, tools, config, server, contests, problem_cache
 from ...constants import preparing_problem_path, problem_path
 
 ns = api.namespace("problem", path="/problem", description="Problem related API endpoints")
@@ -35,7 +35,15 @@ problem_post_output = ns.model("CreateProblemOutput", {
 })
 problem_list_result_item = ns.model("ProblemOutput", {
     "pid": fields.String(description="Problem ID"),
-    "name": fields.String(description="Problem name")
+    "name": fields.String(description="Problem name"),
+    "status": fields.String(description="'solved' or 'attempted' for the current user, absent if never submitted",
+                            required=False),
+    "ac_count": fields.Integer(description="Number of users who solved the problem, public problems only",
+                               required=False),
+    "attempt_count": fields.Integer(description="Number of users who submitted to the problem, public problems only",
+                                    required=False),
+    "time_limit": fields.Integer(description="Time limit in milliseconds, public problems only", required=False),
+    "memory_limit": fields.Integer(description="Memory limit in MB, public problems only", required=False)
 })
 problem_get_output = ns.model("ProblemListOutput", {
     "page_count": fields.Integer(description="Total number of pages"),
@@ -87,7 +95,9 @@ problem_post_input = request_parser(
 problem_get_input = request_parser(
     *paging(),
     Args("manageable", "List problems the user can manage", type=str, required=False, default="false",
-         choices=["true", "false"])
+         choices=["true", "false"]),
+    Args("sort", "Order of public problems", type=str, required=False, default="id",
+         choices=["id", "ac", "attempts"])
 )
 problem_detail_get_input = request_parser()
 
@@ -133,12 +143,26 @@ class ProblemIndex(Resource):
             elif user.has(objs.Permission.make_problems):
                 problem_obj = user.data.problems.filter(datas.Problem.pid != "test")
             else:
-                problem_obj = datas.Problem.query.filter_by(is_public=True)
-        else:
-            problem_obj = datas.Problem.query.filter_by(is_public=True)
-
-        got_data, page_cnt, page_idx, show_pages = pagination(problem_obj, args)
-        results = [{"pid": p.pid, "name": p.name} for p in got_data]
+                problem_obj = None
+            if problem_obj is not None:
+                got_data, page_cnt, page_idx, show_pages = pagination(problem_obj, args)
+                statuses = user.data.problem_status_map([p.id for p in got_data])
+                results = [{"pid": p.pid, "name": p.name} | ({"status": statuses[p.id].mark} if p.id in statuses else {})
+                           for p in got_data]
+                return api_response({"page_count": page_cnt,
+                                     "page": page_idx,
+                                     "data": results,
+                                     "show_pages": show_pages
+                                     })
+
+        # by id, the newest problems come first as before
+        got_data, page_cnt, page_idx, show_pages = pagination(datas.ProblemSummary.public(args["sort"]), args,
+                                                              args["sort"] == "id")
+        statuses = user.data.problem_status_map([p.problem_id for p in got_data]) if user.is_authenticated else {}
+        results = [{"pid": p.pid, "name": p.name, "ac_count": p.ac_count, "attempt_count": p.attempt_count,
+                    "time_limit": p.timelimit, "memory_limit": p.memorylimit} |
+                   ({"status": statuses[p.problem_id].mark} if p.problem_id in statuses else {})
+                   for p in got_data]
         return api_response({"page_count": page_cnt,
                              "page": page_idx,
                              "data": results,
@@ -150,7 +174,7 @@ class ProblemIndex(Resource):
 class ProblemDetail(Resource):
     @ns.doc("get_problem")
     @ns.expect(problem_detail_get_input)
-    @marshal_with(ns, problem_detail_get_output)
+    @marshal_with(ns, problem_detail_get_output, shaped=True)
     def get(self, pid):
         """Gets the public details of a problem for viewing/solving."""
         args = problem_detail_get_input.parse_args()
@@ -163,30 +187,17 @@ class ProblemDetail(Resource):
                                    (not user.has(objs.Permission.admin) and user.id not in dat.users)):
             server.custom_abort(403, "You do not have permission to view this problem.")
         langs = [lang for lang in executing.langs.keys() if pdat.lang_allowed(lang)]
-        path = constants.problem_path / pid
-        statement = tools.read(path / "statement.md") if (path / "statement.md").is_file() else ""
-        statement_html = tools.read(path / "statement.html") if (path / "statement.html").is_file() else ""
-        samples = dat.manual_samples
-        default_code = dat.default_code
-        files = {f for f in default_code.values() if f and f.strip()}
-        content_map = {f: (path / "file" / f).open(encoding="utf-8").read() for f in files}
-        default_code = {k: content_map.get(v, "") for k, v in default_code.items()}
-        samples.extend([objs.ManualSample(tools.read(path / "testcases" / o.in_file),
-                                          tools.read(path / "testcases" / o.out_file))
-                        for o in dat.testcases if o.sample])
-        samples.extend([objs.ManualSample(tools.read(path / "testcases_gen" / o.in_file),
-                                          tools.read(path / "testcases_gen" / o.out_file))
-                        for o in dat.testcases_gen if o.sample])
+        payload = problem_cache.problem_payload(pid, dat)
         res = {
             "pid": pid,
             "title": dat.name,
-            "statement": statement,
-            "statement_html": statement_html,
+            "statement": payload["statement_md"],
+            "statement_html": payload["statement_html"],
             "langs": langs,
-            "samples": [{"input": o.in_txt, "output": o.out_txt} for o in samples],
-            "default_code": default_code,
-            "time_limit": dat.timelimit,
-            "memory_limit": dat.memorylimit
+            "samples": [{"input": o[0], "output": o[1]} for o in payload["samples"]],
+            "default_code": payload["default_code"],
+            "time_limit": int(dat.timelimit),
+            "memory_limit": int(dat.memorylimit)
         }
         return api_response(res)
 
@@ -212,7 +223,7 @@ class ProblemManage(Resource):
         if bg_action is not None:
             return api_response({
                 "pid": pid,
-                "background_action": {"log": bg_action[0], "action_name": bg_action[1]}
+                "background_action": {"log": bg_action[0], "action_name": bg_action[1], "position": bg_action[2]}
             })
 
         p_path = preparing_problem_path / pid
@@ -238,6 +249,26 @@ class ProblemManage(Resource):
         })
 
 
+@ns.route("/<string:pid>/manage/background_action")
+class ProblemBackgroundAction(Resource):
+    @ns.doc("cancel_problem_background_action")
+    @ns.expect(base_request_parser)
+    def delete(self, pid: str):
+        """Cancels the pending or running background action of a problem."""
+        args = base_request_parser.parse_args()
+        user = get_api_user(args)
+        pid = secure_filename(pid)
+        pdat: datas.Problem = datas.first(datas.Problem, pid=pid)
+        if pdat is None:
+            server.custom_abort(404, f"Problem {pid!r} not found.")
+        dat = pdat.new_datas
+        if not user.has(objs.Permission.admin) and user.data.username not in dat.users:
+            server.custom_abort(403, "You do not have permission to manage this problem.")
+        if not problemsetting.cancel_background_action(pid):
+            server.custom_abort(409, "No background action is in progress.")
+        return api_response({"message": "Background action cancelled."})
+
+
 problem_preview_input = request_parser(
     Args("type", "Content Type", type=str, required=True,
          choices=["statement", "public_file", "file", "testcases", "testcases_gen"]),
@@ -249,7 +280,7 @@ problem_preview_input = request_parser(
 class ProblemPreview(Resource):
     @ns.doc(description="Previews a problem component (e.g., statement HTML). Returns raw content.")
     @ns.expect(problem_preview_input)
-    @server.limiter.limit(config.server.file_limit)
+    @server.route_limit(config.server.file_limit)
     def get(self, pid: str):
         """Previews a problem component."""
         auth_args = problem_preview_input.parse_args()
@@ -274,7 +305,9 @@ class ProblemPreview(Resource):
 
 
 problem_file_input = request_parser(
-    Args("cid", "Contest ID if applicable", type=str, required=False)
+    Args("cid", "Contest ID if applicable", type=str, required=False),
+    Args("v", "Published version of the problem; a matching version makes the file cacheable as immutable",
+         type=str, required=False)
 )
 
 
@@ -314,4 +347,5 @@ class ProblemFile(Resource):
         target = constants.problem_path / idx / "public_file" / filename
         if not target.is_file():
             server.custom_abort(404, "File not found.")
-        return server.sending_file(target)
+        immutable = args.get("v") == problem_cache.version_name(idx)
+        return server.sending_file(target, immutable=immutable, public=not args.get("cid") and pdat.is_public)
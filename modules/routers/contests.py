@@ -18,11 +18,10 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import time
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from flask import render_template, request, jsonify
 from flask_login import login_required, current_user
-from sqlalchemy.orm.attributes import flag_modified
 
 from .general import render_problem
 from .. import server, login, contests, datas, tools, executing, objs, constants
@@ -37,7 +36,11 @@ def contests_list():
     if not login.has_permission(Permission.admin):
         public_contests = public_contests.filter_by(hidden=False)
     got_data, page_cnt, page_idx, show_pages = tools.pagination(public_contests)
-    contests_data = [(contest.cid, contest.name, contest.datas, contest.can_virtual()) for contest in got_data]
+    user_id = current_user.data.id if current_user.is_authenticated else None
+    contests_data = [(contest.cid, contest.name, contest.datas, contest.can_virtual(),
+                      user_id is not None and contest.has_participant(user_id),
+                      user_id is not None and contest.virtual_period_of(user_id) is not None)
+                     for contest in got_data]
     return render_template("contests.html", contests=contests_data, page_cnt=page_cnt, page_idx=page_idx,
                            show_pages=show_pages, cur_time=time.time())
 
@@ -71,10 +74,15 @@ def contest_page(idx):
         user_data = current_user.data if current_user.is_authenticated else None
         questions = reversed(dat.announcements.filter_by(question=True, user=user_data).all())
     displayed = not dat.hidden
+    statuses = {}
+    if can_see and current_user.is_authenticated:
+        statuses = contests.problem_statuses(info, current_user.data)
     return render_template("contest.html", cid=idx, data=info, can_edit=can_edit, can_see=can_see, target=target,
                            status=status.name, announcements=announcements, questions=questions, cur_time=time.time(),
                            languages=sorted(executing.langs.keys()), can_filter_results=constants.can_filter_results,
-                           displayed=displayed)
+                           displayed=displayed, participants=dat.participant_names(),
+                           is_registered=current_user.is_authenticated and dat.has_participant(current_user.data.id),
+                           statuses=statuses)
 
 
 @app.route("/contest/<cid>/problem/<pid>", methods=["GET"])
@@ -168,12 +176,10 @@ def contest_register(cid):
     info = dat.datas
     if not info.can_register or per.is_over():
         server.custom_abort(403, "此比賽不允許註冊")
-    if current_user.id in info.participants:
+    if (dat.has_participant(current_user.data.id) or
+            not datas.add_unique(datas.ContestParticipant(contest_id=dat.id, user_id=current_user.data.id,
+                                                          is_virtual=False))):
         server.custom_abort(409, "您已經註冊此比賽，無法重複註冊")
-    info.participants.append(current_user.id)
-    dat.datas = info
-    flag_modified(dat, "data")
-    datas.add(dat)
     return "OK", 200
 
 
@@ -184,12 +190,10 @@ def contest_unregister(cid):
     info = dat.datas
     if not info.can_register:
         server.custom_abort(403, "此比賽不允許取消註冊")
-    if current_user.id not in info.participants:
+    obj = dat.participations.filter_by(user_id=current_user.data.id, is_virtual=False).first()
+    if obj is None:
         server.custom_abort(409, "您尚未註冊此比賽，無法取消註冊")
-    info.participants.remove(current_user.id)
-    dat.datas = info
-    flag_modified(dat, "data")
-    datas.add(dat)
+    datas.delete(obj)
     return "OK", 200
 
 
@@ -197,46 +201,39 @@ def contest_unregister(cid):
 @login_required
 def virtual_register(cid):
     dat: datas.Contest = datas.first_or_404(datas.Contest, cid=cid)
-    info = dat.datas
     if not dat.can_virtual():
         server.custom_abort(403, "此比賽不允許虛擬參賽")
-    if current_user.id in info.virtual_participants:
+    if dat.virtual_period_of(current_user.data.id) is not None:
         server.custom_abort(409, "您已經註冊為虛擬參賽者，無法重複註冊")
     if request.method == "GET":
         return render_template("virtual_register.html", cid=cid, name=dat.name)
     else:
         start_time: datetime = tools.to_datetime(request.form["start_time"], second=0, microsecond=0)
-        per = datas.filter_by(datas.Period, start_time=start_time, contest=dat, is_virtual=True)
-        if per.count() > 0:
-            idx = per.first().id
-        else:
-            nw_per = datas.Period(start_time=start_time,
-                                  end_time=start_time + timedelta(minutes=info.elapsed),
-                                  contest=dat,
-                                  is_virtual=True)
-            datas.add(nw_per)
-            datas.flush()
-            idx = nw_per.id
-        info.virtual_participants[current_user.id] = idx
-        flag_modified(dat, "data")
-        datas.add(dat)
+        contests.add_virtual_participant(dat, current_user.data.id, start_time)
         return "OK", 200
 
 
 @app.route("/contest/<cid>/standing", methods=['POST'])
 def contest_standing(cid):
     cdat: datas.Contest = datas.first_or_404(datas.Contest, cid=cid)
-    info = cdat.datas
-    dt = time.time() - info.start
-    dt = dt / 60 - info.elapsed
-    can_see = (info.standing.public and
-               (dt <= -info.standing.start_freeze or dt >= info.standing.end_freeze))
-    if not can_see and not contests.check_super_access(cdat):
+    if not contests.can_see_standing(cdat):
         server.custom_abort(403, "您無權查看此比賽的榜單")
     dat = contests.get_standing(cid)
     return jsonify(dat)
 
 
+@app.route("/contest/<cid>/standing/export/<fmt>", methods=['GET'])
+@login_required
+def contest_standing_export(cid, fmt):
+    cdat: datas.Contest = datas.first_or_404(datas.Contest, cid=cid)
+    if not contests.check_super_access(cdat) and cdat.hidden:
+        server.custom_abort(404, "未找到比賽")
+    if not contests.can_see_standing(cdat):
+        server.custom_abort(403, "您無權查看此比賽的榜單")
+    official_only = request.args.get("official_only", "no") == "yes"
+    return contests.export_standing(cdat, fmt, official_only)
+
+
 @app.route("/contest/<cid>/question", methods=['POST'])
 def contest_question(cid):
     cdat: datas.Contest = datas.first_or_404(datas.Contest, cid=cid)
@@ -16,24 +16,21 @@ GNU Affero General Public License for more details.
 You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
+import hashlib
 import json
 
-from flask import render_template, redirect, request, jsonify
+from flask import render_template, redirect, request, jsonify, make_response
 from flask_login import login_required, current_user
-from pygments import highlight, lexers
-from pygments.formatters import HtmlFormatter
 from werkzeug.utils import secure_filename
 
-from .. import tools, server, constants, executing, tasks, datas, contests, config, objs, submitting, login
+from .. import tools, server, constants, executing, tasks, datas, contests, config, objs, submitting, login, problem_cache
 from ..constants import problem_path, preparing_problem_path
 from ..objs import Permission
 from ..server import sending_file
 
 app = server.app
 
-prepares = {k: lexers.get_lexer_by_name(k) for lexer in lexers.get_all_lexers() for k in lexer[1]}
-
-submit_limit = server.limiter.shared_limit(config.judge.limit, "submit_limit")
+submit_limit = server.route_limit(config.judge.limit, "submit_limit")
 
 
 @app.route("/", methods=["GET"])
@@ -43,10 +40,13 @@ def index():
 
 @app.route('/problems', methods=['GET'])
 def problems():
-    public_problems = datas.filter_by(datas.Problem, is_public=True)
+    public_problems = datas.ProblemSummary.public(request.args.get("sort", "id"))
     got_data, page_cnt, page_idx, show_pages = tools.pagination(public_problems, False)
+    statuses = {}
+    if current_user.is_authenticated:
+        statuses = current_user.data.problem_status_map([problem.problem_id for problem in got_data])
     return render_template("problems.html", problems=got_data, page_cnt=page_cnt, page_idx=page_idx,
-                           show_pages=show_pages)
+                           show_pages=show_pages, statuses=statuses)
 
 
 @app.route('/test', methods=['GET'])
@@ -86,37 +86,50 @@ def submission(idx: str):
     int_idx = tools.to_int(idx)
     dat: datas.Submission = datas.get_or_404(datas.Submission, int_idx)
     lang = dat.language
-    source = tools.read(dat.path / dat.source)
-    lang_name = executing.langs[lang].name if lang in executing.langs else "text"
-    source = highlight(source, prepares[lang_name], HtmlFormatter())
+    pos = tasks.get_queue_position(dat)
+    wait_state = ""
+    if config.server.worker_class == "gevent" and not dat.completed:
+        wait_state = tasks.submission_state(dat, pos)["state"]
+    pdat: datas.Problem = dat.problem
+    problem_info = pdat.datas
+    is_owner = current_user.has(Permission.admin) or dat.user_id == current_user.data.id
+    super_access = current_user.has(Permission.admin) or current_user.id in problem_info.users
+    if not is_owner and (pdat.pid == "test" or not super_access):
+        server.custom_abort(403, "無權限查看此提交結果")
+    view_file = dat.path / "view.json.gz"
+    view_stamp = view_file.stat().st_mtime_ns if view_file.is_file() else 0
+    version = problem_cache.version_name(pdat.pid) if pdat.pid != "test" else ""
+    page_settings = (problem_info.public_testcase, problem_info.public_checker, problem_info.codechecker_mode.name,
+                     problem_info.ac_info, problem_info.name, dat.contest_id, dat.period_id)
+    etag = hashlib.sha256(f"{dat.id}:{current_user.id}:{current_user.has(Permission.admin)}:{super_access}:"
+                          f"{dat.completed}:{pos}:{dat.simple_result}:{view_stamp}:{wait_state}:{version}:"
+                          f"{pdat.edit_time}:{page_settings}".encode()).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        resp = make_response("", 304)
+        resp.set_etag(etag, weak=True)
+        return resp
+    view = tasks.submission_view(dat)
+    source = view["source"]
     completed = dat.completed
     ce_msg = dat.ce_msg
-    pdat: datas.Problem = dat.problem
     submit_info = dat.datas
     if pdat.pid == "test":
-        if not current_user.has(Permission.admin) and dat.user_id != current_user.data.id:
-            server.custom_abort(403, "無權限查看此提交結果")
         info = dat.datas
-        inp = tools.read_default(dat.path / info.infile)
-        out = tools.read_default(dat.path / info.outfile)
+        inp = view["inp"]
+        out = view["out"]
         result = dat.simple_result or "unknown"
-        err = tools.read_default(dat.path / constants.error_filename)
+        err = view["err"]
         ret = render_template("submission/test.html", lang=lang, source=source, inp=inp,
-                              out=out, completed=completed, result=result, pos=tasks.get_queue_position(dat),
+                              out=out, completed=completed, result=result, pos=pos, idx=dat.id,
+                              wait_state=wait_state,
                               ce_msg=ce_msg, je=info.JE, logid=info.log_uuid, err=err)
     else:
         group_results = {}
         protected = True
         checker_protected = True
-        problem_info = pdat.datas
-        if not current_user.has(Permission.admin) and dat.user_id != current_user.data.id and current_user.id not in \
-                problem_info.users:
-            server.custom_abort(403, "無權限查看此提交結果")
         ac_info = ""
-        super_access = current_user.has(Permission.admin) or current_user.id in problem_info.users
         result = {}
         see_cc = False
-        testcase_path = dat.path / "testcases"
         result_data = dat.results
         results = result_data.results
         if ("AC" in dat.simple_result and dat.completed and result_data.total_score >= problem_info.top_score and
@@ -129,15 +142,17 @@ def submission(idx: str):
             checker_protected = ((not problem_info.public_checker or bool(dat.period_id))
                                  and not super_access)
             result["checker_protected"] = checker_protected
+            previews = view.get("previews", [])
             for i in range(len(results)):
+                preview = previews[i] if i < len(previews) else {"in": "", "ans": "", "out": ""}
                 if (results[i].result not in (objs.TaskResult.SKIP, objs.TaskResult.PASS)
                         and (not protected or super_access or results[i].sample)):
-                    results[i].in_txt = tools.read_default(testcase_path / f"{i}.in")
-                    results[i].ans_txt = tools.read_default(testcase_path / f"{i}.ans")
+                    results[i].in_txt = preview["in"]
+                    results[i].ans_txt = preview["ans"]
                 else:
                     results[i].in_txt = results[i].ans_txt = ""
                 if results[i].has_output:
-                    results[i].out_txt = tools.read_default(testcase_path / f"{i}.out")
+                    results[i].out_txt = preview["out"]
             gpr = result_data.group_results
             if len(gpr) > 0 and type(next(iter(gpr.values()))) is objs.GroupResult:
                 group_results = gpr
@@ -146,7 +161,7 @@ def submission(idx: str):
             see_cc = cc_mode == objs.CodecheckerMode.public or cc_mode == objs.CodecheckerMode.private and super_access
         cc = ""
         if see_cc:
-            cc = tools.read_default(dat.path / "codechecker_result.txt", default="INFO NOT FOUND")
+            cc = view.get("codechecker", "INFO NOT FOUND")
         link = f"/problem/{pdat.pid}"
         contest = None
         cid = None
@@ -160,12 +175,16 @@ def submission(idx: str):
                     break
         ret = render_template("submission/problem.html", lang=lang, source=source, completed=completed,
                               pname=problem_info.name, result=result, enumerate=enumerate,
-                              group_results=group_results, link=link, pos=tasks.get_queue_position(dat),
+                              group_results=group_results, link=link, pos=pos, idx=dat.id,
+                              wait_state=wait_state,
                               ce_msg=ce_msg, je=submit_info.JE, logid=submit_info.log_uuid,
                               super_access=super_access, contest=contest, cid=cid, protected=protected,
                               checker_protected=checker_protected, see_cc=see_cc, cc=cc, results=results,
                               ac_info=ac_info)
-    return ret
+    resp = make_response(ret)
+    resp.set_etag(etag, weak=True)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
 
 
 @app.route("/problem/<idx>", methods=['GET'])
@@ -185,34 +204,22 @@ def problem_page(idx):
 
 
 def render_problem(dat: objs.ProblemInfo, idx: str, langs: list[str], preview: bool = False, **kwargs):
-    if preview:
-        path = preparing_problem_path / idx
-    else:
-        path = problem_path / idx
+    path = (preparing_problem_path if preview else problem_path) / idx
     if not (path / "statement.html").exists():
         server.custom_abort(404, "Problem statement not found")
-    statement = tools.read(path / "statement.html")
+    if preview:
+        payload = problem_cache.build_payload(dat, path)
+    else:
+        payload = problem_cache.problem_payload(idx, dat)
     lang_exts = json.dumps({k: v.source_ext for k, v in executing.langs.items()})
-    samples = dat.manual_samples
-    samples.extend([objs.ManualSample(tools.read(path / "testcases" / o.in_file),
-                                      tools.read(path / "testcases" / o.out_file))
-                    for o in dat.testcases if o.sample])
-    samples.extend([objs.ManualSample(tools.read(path / "testcases_gen" / o.in_file),
-                                      tools.read(path / "testcases_gen" / o.out_file))
-                    for o in dat.testcases_gen if o.sample])
-    default_code = dat.default_code
-    files = {f for f in default_code.values() if f and f.strip()}
-    content_map = {}
-    for f in files:
-        content_map[f] = (path / "file" / f).open(encoding="utf-8").read()
-    default_code = {k: content_map.get(v, "") for k, v in default_code.items()}
-    return render_template("problem.html", dat=dat, statement=statement,
-                           langs=langs, lang_exts=lang_exts, pid=idx,
-                           preview=preview, samples=enumerate(samples), **kwargs, default_code=default_code)
+    samples = problem_cache.samples_of(payload)
+    return render_template("problem.html", dat=dat, statement=payload["statement_html"],
+                           langs=langs, lang_exts=lang_exts, pid=idx, preview=preview,
+                           samples=enumerate(samples), **kwargs, default_code=payload["default_code"])
 
 
 @app.route("/problem_file/<idx>/<filename>", methods=['GET'])
-@server.limiter.limit(config.server.file_limit)
+@server.route_limit(config.server.file_limit)
 def problem_file(idx, filename):
     idx = secure_filename(idx)
     filename = secure_filename(filename)
@@ -233,7 +240,8 @@ def problem_file(idx, filename):
             if not current_user.has(Permission.admin) and current_user.id not in dat.users:
                 server.custom_abort(403, "無權限查看此檔案")
     target = problem_path / idx / "public_file" / filename
-    return sending_file(target)
+    immutable = request.args.get("v") == problem_cache.version_name(idx)
+    return sending_file(target, immutable=immutable, public="cid" not in request.args and pdat.is_public)
 
 
 @app.route("/status", methods=["GET"])
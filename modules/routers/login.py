@@ -119,7 +119,7 @@ verify_codes = locks.manager.dict()
 
 
 @app.route('/get_code', methods=['POST'])
-@server.limiter.limit(config.smtp.limit, override_defaults=False)
+@server.route_limit(config.smtp.limit, override_defaults=False)
 def get_code():
     email = request.form["email"]
     if constants.email_reg.match(email) is None:
@@ -160,7 +160,9 @@ def user_page(name):
     name = name.lower()
     if not login.exist(name):
         server.custom_abort(404, "使用者不存在")
-    return render_template("user.html", name=name, data=login.get_user(name).data)
+    data = login.get_user(name).data
+    return render_template("user.html", name=name, data=data, solved=data.public_problem_pids(True),
+                           attempted=data.public_problem_pids(False))
 
 
 @app.route("/settings", methods=["GET", "POST"])
@@ -79,7 +79,7 @@ def my_problem_page(idx):
     user = login.check_user(Permission.make_problems, dat.users)
     o = problemsetting.check_background_action(idx)
     if o is not None:
-        return render_template("pleasewaitlog.html", action=o[1], log=o[0])
+        return render_template("pleasewaitlog.html", action=o[1], log=o[0], position=o[2], pid=idx)
     p_path = preparing_problem_path / idx
     public_files: list[str] = [f.name for f in (p_path / "public_file").iterdir() if f.name != ".gitkeep"]
     default_checkers = [s for s in os.listdir("testlib/checkers") if s.endswith(".cpp")]
@@ -114,8 +114,19 @@ def problem_action():
     return problemsetting.action(request.form)
 
 
+@app.route("/problemsetting_cancel", methods=['POST'])
+@login_required
+def problem_cancel_action():
+    idx = secure_filename(request.form["pid"])
+    pdat = datas.first_or_404(datas.Problem, pid=idx)
+    login.check_user(Permission.make_problems, pdat.new_datas.users)
+    if not problemsetting.cancel_background_action(idx):
+        server.custom_abort(409, "目前沒有進行中的背景操作")
+    return "OK", 200
+
+
 @app.route("/problemsetting_preview", methods=["GET"])
-@server.limiter.limit(config.server.file_limit)
+@server.route_limit(config.server.file_limit)
 @login_required
 def problem_preview():
     idx = request.args["pid"]
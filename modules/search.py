@@ -0,0 +1,284 @@
+"""
+OrangeJudge, a competitive programming platform
+
+Copyright (C) 2024-2025 LittleOrange666 (orangeminecraft123@gmail.com)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import itertools
+import re
+import unicodedata
+
+from loguru import logger
+from sqlalchemy import delete, event, func, insert, inspect
+from sqlalchemy.orm import Query, Session
+
+from . import datas, tools, config
+from .constants import problem_path
+
+kinds = ("problem", "user", "submission")
+max_token_length = 32
+word_re = re.compile(r"[0-9a-z_]+")
+cjk_re = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]+")
+
+
+def normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def text_tokens(text: str) -> set[str]:
+    """
+    Split text into the tokens used to index it.
+
+    Latin text is split into words; CJK text, which has no spaces, is indexed by single characters
+    and by pairs of adjacent characters.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        set[str]: The tokens.
+    """
+    text = normalize(text)
+    tokens = {word[:max_token_length] for word in word_re.findall(text)}
+    for run in cjk_re.findall(text):
+        tokens.update(run)
+        tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def text_query(text: str) -> set[str]:
+    """
+    Get the tokens a text document must contain to match a query.
+
+    Args:
+        text (str): The query.
+
+    Returns:
+        set[str]: The tokens.
+    """
+    text = normalize(text)
+    tokens = {word[:max_token_length] for word in word_re.findall(text)}
+    for run in cjk_re.findall(text):
+        if len(run) == 1:
+            tokens.add(run)
+        else:
+            tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def name_tokens(text: str) -> set[str]:
+    """
+    Split a short name into tokens that allow searching any part of it.
+
+    Besides the tokens of ``text_tokens``, every word is indexed by its substrings of three characters.
+
+    Args:
+        text (str): The name.
+
+    Returns:
+        set[str]: The tokens.
+    """
+    tokens = text_tokens(text)
+    for word in word_re.findall(normalize(text)):
+        tokens.update(word[i:i + 3] for i in range(len(word) - 2))
+    return tokens
+
+
+def name_query(text: str) -> set[str]:
+    """
+    Get the tokens a name must contain to match a query, which may be any part of the name.
+
+    Args:
+        text (str): The query.
+
+    Returns:
+        set[str]: The tokens, empty if a word of the query is too short to be searched this way.
+    """
+    text = normalize(text)
+    tokens = set()
+    for word in word_re.findall(text):
+        if len(word) < 3:
+            return set()
+        tokens.update(word[i:i + 3] for i in range(len(word) - 2))
+    return tokens | text_query(" ".join(cjk_re.findall(text)))
+
+
+def write_document(session: Session, kind: str, doc_id: int, tokens: set[str]) -> None:
+    """
+    Replace the tokens of a document in the index.
+
+    Args:
+        session (Session): The session whose transaction the change joins.
+        kind (str): The kind of the document.
+        doc_id (int): The ID of the document.
+        tokens (set[str]): The tokens of the document.
+    """
+    session.execute(delete(datas.SearchPosting).where(datas.SearchPosting.kind == kind,
+                                                      datas.SearchPosting.doc_id == doc_id))
+    if tokens:
+        session.execute(insert(datas.SearchPosting),
+                        [{"kind": kind, "token": token, "doc_id": doc_id} for token in tokens])
+
+
+def index_problem(problem: datas.Problem) -> None:
+    """
+    Index the published name and statement of a problem.
+
+    Args:
+        problem (datas.Problem): The problem.
+    """
+    statement = tools.read_default(problem_path / problem.pid / "statement.md")
+    tokens = name_tokens(problem.pid) | name_tokens(problem.datas.name) | text_tokens(statement)
+    write_document(datas.get_session(), "problem", problem.id, tokens)
+
+
+def user_tokens(username: str, display_name: str) -> set[str]:
+    return name_tokens(username) | name_tokens(display_name or "")
+
+
+def index_submission(submission: datas.Submission) -> None:
+    """
+    Index the identifiers in the source code of a submission, if submissions are searchable.
+
+    Args:
+        submission (datas.Submission): The submission, whose source is already saved.
+    """
+    if not config.server.search_submissions:
+        return
+    source = tools.read_default(submission.path / submission.source)
+    write_document(datas.get_session(), "submission", submission.id, text_tokens(source))
+
+
+def names_changed(user: datas.User) -> bool:
+    attrs = inspect(user).attrs
+    return attrs.username.history.has_changes() or attrs.display_name.history.has_changes()
+
+
+@event.listens_for(Session, "after_flush")
+def index_changed_users(session: Session, flush_context):
+    for obj in itertools.chain(session.new, session.dirty):
+        if isinstance(obj, datas.User) and obj.id is not None and names_changed(obj):
+            write_document(session, "user", obj.id, user_tokens(obj.username, obj.display_name))
+    for obj in session.deleted:
+        if isinstance(obj, datas.User):
+            write_document(session, "user", obj.id, set())
+
+
+def matches(kind: str, tokens: set[str]) -> Query:
+    """
+    Build a query of the IDs of the documents containing all the given tokens.
+
+    The query can be used as a subquery, e.g. ``datas.User.id.in_(matches("user", tokens))``.
+
+    Args:
+        kind (str): The kind of the documents.
+        tokens (set[str]): The tokens, see ``text_query`` and ``name_query``.
+
+    Returns:
+        Query: The query.
+    """
+    posting = datas.SearchPosting
+    return (datas.query(posting).with_entities(posting.doc_id)
+            .filter(posting.kind == kind, posting.token.in_(tokens))
+            .group_by(posting.doc_id)
+            .having(func.count(posting.token) == len(tokens)))
+
+
+def like_pattern(text: str) -> str:
+    """
+    Build a LIKE pattern matching the values that contain the given text, used where a query is too short for the index.
+
+    The wildcards ``%`` and ``_`` in the text are escaped with a backslash, so pass ``escape="\\"`` to ``like``.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        str: The pattern.
+    """
+    return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def search(kind: str, tokens: set[str], limit: int = 50) -> list[int]:
+    """
+    Find the documents containing all the given tokens, newest first.
+
+    Args:
+        kind (str): The kind of the documents.
+        tokens (set[str]): The tokens, see ``text_query`` and ``name_query``.
+        limit (int, optional): The maximum number of results. Defaults to 50.
+
+    Returns:
+        list[int]: The IDs of the documents.
+    """
+    if not tokens:
+        return []
+    rows = matches(kind, tokens).order_by(datas.SearchPosting.doc_id.desc()).limit(limit).all()
+    return [row[0] for row in rows]
+
+
+def search_submissions(text: str, limit: int = 50) -> list[int]:
+    """
+    Search submissions by the identifiers in their source code.
+
+    Args:
+        text (str): The query.
+        limit (int, optional): The maximum number of results. Defaults to 50.
+
+    Returns:
+        list[int]: The IDs of the submissions.
+    """
+    return search("submission", text_query(text), limit)
+
+
+def rebuild(kind: str) -> int:
+    """
+    Index again every document of a kind.
+
+    Args:
+        kind (str): The kind of the documents.
+
+    Returns:
+        int: The number of documents indexed.
+    """
+    session = datas.get_session()
+    session.execute(delete(datas.SearchPosting).where(datas.SearchPosting.kind == kind))
+    cnt = 0
+    match kind:
+        case "problem":
+            for problem in datas.query(datas.Problem).filter(datas.Problem.pid != "test").all():
+                if problem.datas.versions:
+                    index_problem(problem)
+                    cnt += 1
+        case "user":
+            rows = datas.query(datas.User).with_entities(datas.User.id, datas.User.username,
+                                                          datas.User.display_name).all()
+            for user_id, username, display_name in rows:
+                write_document(session, "user", user_id, user_tokens(username, display_name))
+                cnt += 1
+        case "submission":
+            if config.server.search_submissions:
+                for submission in datas.filter_by(datas.Submission).filter(datas.Submission.pid != "test").all():
+                    index_submission(submission)
+                    cnt += 1
+    logger.info(f"indexed {cnt} documents of kind {kind!r}")
+    return cnt
+
+
+def init():
+    with datas.SessionContext():
+        for kind in ("problem", "user"):
+            if datas.filter_by(datas.SearchPosting, kind=kind).first() is None:
+                rebuild(kind)
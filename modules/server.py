@@ -17,25 +17,32 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import mimetypes
 import os
 import secrets
 import socket
 import traceback
-from datetime import timedelta
+from datetime import timedelta, datetime, timezone
 from pathlib import Path
+from typing import Callable
+from urllib.parse import quote
 
+import limits
 import redis
-from flask import Flask, render_template, request, Response, send_file
+from flask import Flask, render_template, request, Response, send_file, g
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_login import current_user
-from flask_session import Session
 from flask_wtf import CSRFProtect
+from itsdangerous import Signer, BadSignature
 from loguru import logger
+from werkzeug.datastructures import CallbackDict
 from werkzeug.exceptions import HTTPException
 
 from . import tools, config, objs
-from .constants import log_path
+from .constants import log_path, data_path
 
 app = Flask(__name__, static_url_path='/static', static_folder="../static/", template_folder="../templates/")
 if config.debug.single_secret:
@@ -45,32 +52,217 @@ elif "FLASK_SECRET_KEY" in os.environ:
 else:
     app.config['SECRET_KEY'] = secrets.token_urlsafe(33)
 redis_host = os.environ.get("REDIS_HOST", "localhost")
-app.config['SESSION_TYPE'] = "redis"
+# one pool for sessions, rate limits and caches
+redis_pool = redis.ConnectionPool(host=redis_host, port=6379, socket_connect_timeout=30)
+redis_client = redis.StrictRedis(connection_pool=redis_pool)
 app.config["SESSION_COOKIE_NAME"] = "OrangeJudgeSession"
-app.config['SESSION_USE_SIGNER'] = True
-app.config['SESSION_REDIS'] = redis.StrictRedis(host=redis_host)
-app.config['SESSION_KEY_PREFIX'] = 'session:'
-app.config['SESSION_PERMANENT'] = True
 app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(hours=12)
 app.config['WTF_CSRF_TIME_LIMIT'] = 43200
 app.config['WTF_CSRF_ENABLED'] = not config.debug.disable_csrf
-Session(app)
+session_key_prefix = "session:"
+default_limits = [limits.parse(o) for o in config.server.limits]
+own_limit_views: set[Callable] = set()
+# count a hit in a fixed window; the expiry is set atomically with the first hit, and also repairs a
+# counter left without one, so a window can never outlive its length. Sent with EVAL rather than
+# EVALSHA, since a pipeline with registered scripts checks them in an extra round-trip.
+incr_window_script = """
+local current = redis.call('INCR', KEYS[1])
+if current == 1 or redis.call('TTL', KEYS[1]) < 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return current
+"""
+
+
+class RedisSession(CallbackDict, SessionMixin):
+    """
+    A session stored in Redis under ``session_key_prefix`` and its id.
+    """
+
+    def __init__(self, initial: dict | None = None, sid: str | None = None, new: bool = False):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.accessed = False
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+    @property
+    def permanent(self) -> bool:
+        # every session lives for PERMANENT_SESSION_LIFETIME
+        return True
+
+    @permanent.setter
+    def permanent(self, value: bool) -> None:
+        pass
+
+
+class RedisSessionInterface(SessionInterface):
+    """
+    Server-side sessions in Redis, loaded in the same round-trip as the default rate limit checks.
+
+    The session id in the cookie is signed with the secret key. Opening a session pipelines the
+    session read, the refresh of its expiry and the fixed-window counters of the default limits, so
+    a request with an unchanged session costs one Redis round-trip; the session is only written back
+    when it changed.
+    """
+    serializer = TaggedJSONSerializer()
+
+    def signer(self, app: Flask) -> Signer:
+        return Signer(app.secret_key, salt="orangejudge-session", key_derivation="hmac")
+
+    def open_session(self, app: Flask, request) -> RedisSession:
+        sid = None
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self.signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+        lifetime = int(app.permanent_session_lifetime.total_seconds())
+        pipe = redis_client.pipeline(transaction=False)
+        if sid is not None:
+            pipe.get(session_key_prefix + sid)
+            pipe.expire(session_key_prefix + sid, lifetime)
+        limit_items = queue_default_limits(app, request, pipe)
+        results = pipe.execute() if len(pipe) else []
+        if limit_items:
+            offset = 2 if sid is not None else 0
+            g.default_limit_hits = list(zip(limit_items, results[offset:]))
+        if sid is not None and results[0] is not None:
+            try:
+                return RedisSession(self.serializer.loads(results[0].decode()), sid=sid)
+            except ValueError:
+                pass
+        return RedisSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app: Flask, session: RedisSession, response: Response) -> None:
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add("Cookie")
+        if not session:
+            if session.modified and not session.new:
+                redis_client.delete(session_key_prefix + session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        lifetime = int(app.permanent_session_lifetime.total_seconds())
+        if session.modified:
+            redis_client.set(session_key_prefix + session.sid, self.serializer.dumps(dict(session)), ex=lifetime)
+        if session.modified or self.should_set_cookie(app, session):
+            response.set_cookie(name, self.signer(app).sign(session.sid.encode()).decode(),
+                                expires=self.get_expiration_time(app, session), httponly=self.get_cookie_httponly(app),
+                                domain=domain, path=path, secure=self.get_cookie_secure(app),
+                                samesite=self.get_cookie_samesite(app))
+
+
+def queue_default_limits(app: Flask, request, pipe: redis.client.Pipeline) -> list[limits.RateLimitItem]:
+    """
+    Queue the fixed-window counters of the default rate limits that apply to a request.
+
+    Like flask-limiter, the default limits count per endpoint and client address, skip static files
+    and do not apply to views with limits of their own.
+
+    Args:
+        app (Flask): The application.
+        request: The request, whose URL is not matched yet.
+        pipe (redis.client.Pipeline): The pipeline to add the commands to.
+
+    Returns:
+        list[limits.RateLimitItem]: The limits whose counters were queued.
+    """
+    try:
+        endpoint = app.create_url_adapter(request).match()[0]
+    except HTTPException:
+        return []
+    if endpoint == "static" or endpoint not in app.view_functions:
+        return []
+    view = app.view_functions[endpoint]
+    method = getattr(getattr(view, "view_class", None), request.method.lower(), None)
+    if has_own_limits(view) or has_own_limits(method):
+        return []
+    address = get_remote_address()
+    for item in default_limits:
+        key = "limiter:" + item.key_for("default", address, endpoint)
+        pipe.eval(incr_window_script, 1, key, item.get_expiry())
+    return default_limits
+
+
+app.session_interface = RedisSessionInterface()
 csrf = CSRFProtect(app)
 limiter = Limiter(
     get_remote_address,
     app=app,
-    default_limits=config.server.limits,
     storage_uri=f"redis://{redis_host}:6379",
-    storage_options={"socket_connect_timeout": 30},
+    storage_options={"connection_pool": redis_pool},
     strategy="fixed-window",
     key_prefix="limiter:"
 )
+
+
+def has_own_limits(func: Callable | None) -> bool:
+    while func is not None:
+        if func in own_limit_views:
+            return True
+        func = getattr(func, "__wrapped__", None)
+    return False
+
+
+def route_limit(limit_value: str, scope: str | None = None, override_defaults: bool = True):
+    """
+    Give a view a rate limit of its own, checked by flask-limiter.
+
+    Args:
+        limit_value (str): The limit, e.g. ``"30 per 5 second"``.
+        scope (str | None, optional): Share the limit between all views with this scope. Defaults to None.
+        override_defaults (bool, optional): Whether the view is exempt from the default limits. Defaults to True.
+
+    Returns:
+        Callable: The decorator.
+    """
+    decorator = limiter.limit(limit_value) if scope is None else limiter.shared_limit(limit_value, scope)
+
+    def wrapper(f):
+        limited = decorator(f)
+        if override_defaults:
+            own_limit_views.update((f, limited))
+        return limited
+
+    return wrapper
+
+
 if config.server.admin_fast:
     @limiter.request_filter
     def admin_fast():
         return current_user.is_authenticated and current_user.has(objs.Permission.admin)
 
 
+@app.before_request
+def check_default_limits():
+    hits = g.pop("default_limit_hits", None)
+    if not hits or all(count <= item.amount for item, count in hits):
+        return
+    if config.server.admin_fast and admin_fast():
+        return
+    custom_abort(429, "請求過於頻繁")
+
+
 @app.context_processor
 def inject_global_variables():
     version_info = ""
@@ -187,10 +379,57 @@ def check_port(ip, port):
         sock.close()
 
 
-def sending_file(file: Path) -> Response:
+offload_root = data_path.parent
+immutable_max_age = 365 * 24 * 3600
+
+
+def sending_file(file: Path, immutable: bool = False, public: bool = False) -> Response:
+    """
+    Send a file, or let the front proxy send it when file offloading is enabled.
+
+    The response has a strong ETag built from the inode, size and modification time; files are
+    replaced rather than rewritten, so these change whenever the content does. Range and
+    conditional requests are answered by werkzeug, or by the proxy when offloading.
+
+    Args:
+        file (Path): The file to send.
+        immutable (bool, optional): Whether the URL always refers to this exact content, e.g. a file
+            of a published problem version. Defaults to False.
+        public (bool, optional): Whether shared caches may store the file. Defaults to False.
+
+    Returns:
+        Response: The response.
+    """
     if not file.is_file():
         custom_abort(404, "File not found")
-    return send_file(file.absolute())
+    file = file.resolve()
+    st = file.stat()
+    etag = f"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"
+    mode = config.server.file_offload
+    if mode == "nginx" and not file.is_relative_to(offload_root):
+        mode = "none"
+    if mode in ("nginx", "apache"):
+        rv = Response(mimetype=mimetypes.guess_type(file.name)[0] or "application/octet-stream")
+        rv.set_etag(etag)
+        rv.last_modified = datetime.fromtimestamp(st.st_mtime, timezone.utc)
+        rv.make_conditional(request)
+        if rv.status_code != 304:
+            if mode == "nginx":
+                rv.headers["X-Accel-Redirect"] = (config.server.file_offload_prefix.rstrip("/") + "/" +
+                                                  quote(file.relative_to(offload_root).as_posix()))
+            else:
+                rv.headers["X-Sendfile"] = str(file)
+    else:
+        rv = send_file(file, etag=etag, conditional=True)
+    rv.cache_control.public = public
+    rv.cache_control.private = not public
+    if immutable:
+        rv.cache_control.no_cache = None
+        rv.cache_control.max_age = immutable_max_age
+        rv.cache_control.immutable = True
+    else:
+        rv.cache_control.no_cache = True
+    return rv
 
 
 def csrf_exempt(f):
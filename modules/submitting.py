@@ -20,7 +20,7 @@ import datetime
 
 from flask_login import current_user
 
-from . import datas, executing, tasks, contests, config, objs, tools, constants, login, server
+from . import datas, executing, tasks, contests, config, objs, tools, constants, login, server, search
 
 
 def test_submit(lang: str, code: str, inp: str, user: login.User | None = None) -> str:
@@ -39,7 +39,7 @@ def test_submit(lang: str, code: str, inp: str, user: login.User | None = None)
     idx = str(dat.id)
     tools.write(code, dat.path / fn)
     tools.write(inp, dat.path / "in.txt")
-    dat.queue_position = tasks.enqueue(dat.id)
+    tasks.enqueue(dat, objs.JudgeClass.test)
     datas.add(dat)
     return idx
 
@@ -74,6 +74,7 @@ def submit(lang: str, pid: str, code: str, cid: str | None = None, user: login.U
     datas.flush()
     idx = str(dat.id)
     tools.write(code, dat.path / fn)
-    dat.queue_position = tasks.enqueue(dat.id)
+    search.index_submission(dat)
+    tasks.enqueue(dat, objs.JudgeClass.contest if dat.period_id else objs.JudgeClass.practice)
     datas.add(dat)
     return idx
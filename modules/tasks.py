@@ -17,7 +17,11 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import datetime
+import gzip
+import json
 import math
+import os
 import queue
 import threading
 import time
@@ -26,19 +30,34 @@ from concurrent.futures import ThreadPoolExecutor
 from dataclasses import replace
 from pathlib import Path
 
+import redis
 from loguru import logger
+from pygments import highlight
+from pygments.formatters import HtmlFormatter
+from sqlalchemy import func, or_, and_
+from sqlalchemy.exc import OperationalError
 
-from . import executing, constants, tools, locks, datas, config, judge, objs
+from . import executing, constants, tools, datas, config, judge, objs, createhtml, server
 from .constants import log_path
 from .judge import SandboxUser
 from .objs import TaskResult
 from .server import app
 
-last_judged = locks.Counter()
+workers = config.judge.workers
 
-queue_position = locks.Counter()
+executor = ThreadPoolExecutor(max_workers=workers)
 
-executor = ThreadPoolExecutor(max_workers=config.judge.workers)
+running_count: dict[objs.JudgeClass, int] = {judge_class: 0 for judge_class in objs.JudgeClass}
+
+running_lock = threading.Lock()
+
+slot_freed = threading.Event()
+
+status_update_attempts = 3
+
+submission_channel_prefix = "submission_events:"
+queue_channel = "judge_queue_events"
+submission_version_prefix = "submission_version:"
 
 
 def run(lang: executing.Language, file: Path, env: executing.Environment, stdin: Path, stdout: Path,
@@ -134,13 +153,13 @@ def run_problem(pid: str, dat_id: int) -> None:
         dat_path = dat.path
         source = dat_path / dat.source
         just_pretest: bool = dat.just_pretest
-        p_path = pdat.path
+        p_path = pdat.path.resolve()
         problem_info = pdat.datas
         protected = ((not problem_info.public_testcase or bool(dat.period_id))
                      and dat.user.username not in problem_info.users)
         language = dat.language
     for fn in problem_info.library:
-        env.send_file(pdat.path / "file" / fn, env.executable)
+        env.send_file(p_path / "file" / fn, env.executable)
     sent_source = env.send_file(source)
     if problem_info.runner_enabled:
         judge_runner = env.send_file(p_path / "file" / problem_info.runner_source.get(language))
@@ -167,7 +186,7 @@ def run_problem(pid: str, dat_id: int) -> None:
             dat.simple_result_flag = objs.TaskResult.CE.name
             dat.completed = True
             datas.add(dat)
-            return
+        return
     tl = int(problem_info.timelimit) * problem_info.language_multipliers.get(language, 1)
     ml = int(problem_info.memorylimit)
     int_exec = []
@@ -243,6 +262,8 @@ def run_problem(pid: str, dat_id: int) -> None:
             dat.simple_result_flag = simple_result_flag
             dat.completed = completed
             datas.add(dat)
+        if not completed:  # the completion is announced by runner, once the view is saved
+            notify_submission(dat_id)
 
     unsaved_count = 0
     save_period = config.judge.save_period
@@ -373,8 +394,399 @@ def run_problem(pid: str, dat_id: int) -> None:
     save_result(True)
 
 
+def update_problem_status(dat_id: int) -> None:
+    """
+    Fold a completed submission into the materialized status of its user on its problem.
+
+    A rejudge may lower an earlier result, so for rejudged submissions the status is rebuilt
+    from all judged submissions of the user to the problem instead.
+
+    The status row is locked for update, so concurrent judges of the same user and problem are serialized.
+    The counts of the problem summary are changed by the difference the submission made to the status, so
+    judges of different users never wait for each other; only rejudges count them again.
+    Deadlocks and serialization failures are retried a few times.
+
+    Args:
+        dat_id (int): The ID of the completed submission.
+    """
+    for attempt in range(status_update_attempts):
+        try:
+            with datas.SessionContext():
+                update_problem_status_once(dat_id)
+            return
+        except OperationalError as e:
+            if attempt + 1 == status_update_attempts:
+                raise
+            logger.info(f"retry updating the problem status of submission {dat_id}: {e}")
+            time.sleep(0.1 * (attempt + 1))
+
+
+def update_problem_status_once(dat_id: int) -> None:
+    dat = datas.get_by_id(datas.Submission, dat_id)
+
+    def create():
+        status = datas.UserProblemStatus(user_id=dat.user_id, problem_id=dat.problem_id)
+        status.reset()
+        return status
+
+    status = datas.lock_or_create(datas.UserProblemStatus, create, user_id=dat.user_id, problem_id=dat.problem_id)
+    if dat.priority == objs.JudgeClass.rejudge.value:
+        status.reset()
+        for sub in datas.filter_by(datas.Submission, user_id=dat.user_id, problem_id=dat.problem_id,
+                                   completed=True).all():
+            status.record(sub.simple_result_flag, sub.just_pretest, sub.results.total_score, sub.time)
+        datas.add(status)
+        datas.flush()
+        datas.ProblemSummary.of(dat.problem).update_counts()
+        return
+    was_accepted, was_attempted = bool(status.accepted), bool(status.attempts)
+    status.record(dat.simple_result_flag, dat.just_pretest, dat.results.total_score, dat.time)
+    datas.add(status)
+    datas.flush()
+    if not datas.ProblemSummary.add_counts(dat.problem_id, int(bool(status.accepted)) - int(was_accepted),
+                                           int(bool(status.attempts)) - int(was_attempted)):
+        datas.ProblemSummary.of(dat.problem).update_counts()
+
+
+def rebuild_problem_status() -> None:
+    """
+    Build the user_problem_status table from existing submissions if it is still empty.
+    """
+    with datas.SessionContext() as session:
+        if datas.count(datas.UserProblemStatus) > 0:
+            return
+        statuses: dict[tuple[int, int], datas.UserProblemStatus] = {}
+        rows = (datas.filter_by(datas.Submission, completed=True).filter(datas.Submission.pid != "test")
+                .with_entities(datas.Submission.user_id, datas.Submission.problem_id,
+                               datas.Submission.simple_result_flag, datas.Submission.just_pretest,
+                               datas.Submission.result, datas.Submission.time)
+                .order_by(datas.Submission.id).yield_per(500))
+        for user_id, problem_id, flag, just_pretest, result, submit_time in rows:
+            key = (user_id, problem_id)
+            if key not in statuses:
+                statuses[key] = datas.UserProblemStatus(user_id=user_id, problem_id=problem_id)
+                statuses[key].reset()
+            statuses[key].record(flag, bool(just_pretest), (result or {}).get("total_score", 0), submit_time)
+        session.add_all(statuses.values())
+        if statuses:
+            logger.info(f"built {len(statuses)} user problem statuses")
+
+
+def rebuild_problem_summaries() -> None:
+    """
+    Create the summaries of the problems that have none yet, e.g. right after upgrading.
+    """
+    with datas.SessionContext():
+        missing = (datas.query(datas.Problem)
+                   .outerjoin(datas.ProblemSummary, datas.ProblemSummary.problem_id == datas.Problem.id)
+                   .filter(datas.ProblemSummary.problem_id.is_(None)).all())
+        for problem in missing:
+            datas.ProblemSummary.of(problem).update_counts()
+        if missing:
+            logger.info(f"built {len(missing)} problem summaries")
+
+
+def build_submission_view(dat: datas.Submission) -> dict:
+    """
+    Assemble everything the submission page reads from disk.
+
+    Args:
+        dat (datas.Submission): The submission.
+
+    Returns:
+        dict: The highlighted source and, once the submission is completed, the previews of every testcase.
+    """
+    lang = dat.language
+    lang_name = executing.langs[lang].name if lang in executing.langs else "text"
+    source = tools.read(dat.path / dat.source)
+    view = {"completed": bool(dat.completed),
+            "source": highlight(source, createhtml.get_lexer(lang_name) or createhtml.get_lexer("text"),
+                                HtmlFormatter())}
+    if dat.pid == "test":
+        info = dat.datas
+        view["inp"] = tools.read_default(dat.path / info.infile)
+        view["out"] = tools.read_default(dat.path / info.outfile)
+        view["err"] = tools.read_default(dat.path / constants.error_filename)
+    elif dat.completed:
+        testcase_path = dat.path / "testcases"
+        view["previews"] = [{"in": tools.read_default(testcase_path / f"{i}.in"),
+                             "ans": tools.read_default(testcase_path / f"{i}.ans"),
+                             "out": tools.read_default(testcase_path / f"{i}.out") if res.has_output else ""}
+                            for i, res in enumerate(dat.results.results)]
+        view["codechecker"] = tools.read_default(dat.path / "codechecker_result.txt", default="INFO NOT FOUND")
+    return view
+
+
+def save_submission_view(dat: datas.Submission) -> dict:
+    """
+    Build the view artifact of a submission and store it compressed next to the submission.
+
+    Args:
+        dat (datas.Submission): The submission.
+
+    Returns:
+        dict: The view.
+    """
+    view = build_submission_view(dat)
+    target = dat.path / "view.json.gz"
+    tmp = target.with_name(f".view.{tools.random_string()}")
+    tmp.write_bytes(gzip.compress(json.dumps(view).encode(), 6))
+    os.replace(tmp, target)
+    return view
+
+
+def submission_view(dat: datas.Submission) -> dict:
+    """
+    Get the view artifact of a submission, building it if it is missing or stale.
+
+    Args:
+        dat (datas.Submission): The submission.
+
+    Returns:
+        dict: The view.
+    """
+    target = dat.path / "view.json.gz"
+    if target.is_file():
+        try:
+            view = json.loads(gzip.decompress(target.read_bytes()))
+        except (OSError, ValueError):
+            view = None
+        if view is not None and view["completed"] == bool(dat.completed):
+            return view
+    return save_submission_view(dat)
+
+
 def get_queue_position(dat: datas.Submission) -> int:
-    return max((dat.queue_position or 0) - queue_position.value, 0)
+    """
+    Count the pending submissions of the same judge class that will be picked before the given one,
+    including itself.
+
+    The position is per class: reserved workers let the classes run alongside each other, so submissions
+    of other classes do not necessarily go first. Within a class, submissions are picked by
+    ``(queued_at, id)``, like ``queue_receiver`` does.
+
+    Args:
+        dat (datas.Submission): The submission to locate.
+
+    Returns:
+        int: 0 if the submission is running or completed, otherwise its 1-based position in its class.
+    """
+    if dat.completed or dat.running:
+        return 0
+    ahead = datas.Submission.id < dat.id
+    if dat.queued_at is not None:
+        ahead = or_(datas.Submission.queued_at < dat.queued_at,
+                    and_(datas.Submission.queued_at == dat.queued_at, ahead))
+    return (datas.filter_by(datas.Submission, completed=False, running=False, priority=dat.priority)
+            .filter(ahead).count() + 1)
+
+
+def notify_submission(dat_id: int) -> None:
+    """
+    Wake up the clients waiting for a submission. Call it after the change is committed.
+
+    Args:
+        dat_id (int): The ID of the submission whose state changed.
+    """
+    try:
+        pipe = server.redis_client.pipeline(transaction=False)
+        pipe.incr(submission_version_prefix + str(dat_id))
+        pipe.expire(submission_version_prefix + str(dat_id), 86400)
+        pipe.publish(submission_channel_prefix + str(dat_id), "1")
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"failed to notify the waiters of submission {dat_id}: {e}")
+
+
+def queue_key(dat: datas.Submission) -> tuple[int, float, int]:
+    """
+    Get the order of a submission in the judging queue, as published by ``notify_queue``.
+
+    Args:
+        dat (datas.Submission): The submission.
+
+    Returns:
+        tuple[int, float, int]: Its judge class, the timestamp it was queued at and its ID.
+    """
+    return dat.priority, dat.queued_at.timestamp() if dat.queued_at is not None else 0.0, dat.id
+
+
+def notify_queue(picked: tuple[int, float, int]) -> None:
+    """
+    Wake up the clients waiting for pending submissions, since the judging queue moved.
+
+    The picked submission is published with the event, so a waiter can tell whether it was ahead of its own
+    submission without querying the database.
+
+    Args:
+        picked (tuple[int, float, int]): The ``queue_key`` of the submission just picked.
+    """
+    try:
+        server.redis_client.publish(queue_channel, json.dumps(picked))
+    except redis.RedisError as e:
+        logger.warning(f"failed to notify the waiters of the judging queue: {e}")
+
+
+def submission_state(dat: datas.Submission, pos: int | None = None) -> dict:
+    """
+    Describe the progress of a submission, as returned by the wait API.
+
+    Args:
+        dat (datas.Submission): The submission.
+        pos (int | None): Its queue position, if already known.
+
+    Returns:
+        dict: Whether it is completed or running, its simple result, its queue position, and a state
+        token which changes whenever any of these or its testcase results change.
+    """
+    if pos is None:
+        pos = get_queue_position(dat)
+    try:
+        version = int(server.redis_client.get(submission_version_prefix + str(dat.id)) or 0)
+    except redis.RedisError:
+        version = 0
+    return {"completed": bool(dat.completed), "running": bool(dat.running),
+            "simple_result": dat.simple_result or "unknown", "pos": pos,
+            "state": f"{version}.{pos}.{int(bool(dat.completed))}{int(bool(dat.running))}"}
+
+
+def wait_submission(dat_id: int, state: str, timeout: float) -> dict:
+    """
+    Wait until the state of a submission differs from the given one, or until the timeout.
+
+    Returns at once if the submission is completed. The waiting listens to the Redis channels published by
+    ``notify_submission`` and ``notify_queue``; if Redis is unavailable, the database is polled instead.
+    A pick from the queue only moves the queue position, which is worked out from the published submission,
+    so the database is read again only when the submission itself changed.
+
+    Args:
+        dat_id (int): The ID of the submission.
+        state (str): The state token the client already has.
+        timeout (float): The maximum waiting time in seconds.
+
+    Returns:
+        dict: The state of the submission, see ``submission_state``.
+    """
+    deadline = time.monotonic() + timeout
+    pubsub = server.redis_client.pubsub(ignore_subscribe_messages=True)
+    try:
+        pubsub.subscribe(submission_channel_prefix + str(dat_id), queue_channel)
+    except redis.RedisError as e:
+        logger.warning(f"failed to subscribe to the events of submission {dat_id}: {e}")
+        pubsub.close()
+        pubsub = None
+    try:
+        datas.get_session().rollback()  # read after subscribing, so no event is missed in between
+        dat = datas.get_by_id(datas.Submission, dat_id)
+        cur = submission_state(dat)
+        while True:
+            remain = deadline - time.monotonic()
+            if cur["state"] != state or cur["completed"] or remain <= 0:
+                return cur
+            if pubsub is not None:
+                try:
+                    message = pubsub.get_message(timeout=remain)
+                except redis.RedisError as e:
+                    logger.warning(f"lost the events of submission {dat_id}: {e}")
+                    pubsub.close()
+                    pubsub = None
+                    continue
+                if message is None:
+                    continue
+                if message["channel"] == queue_channel.encode():
+                    picked = tuple(json.loads(message["data"]))
+                    mine = queue_key(dat)
+                    if cur["pos"] > 1 and picked[0] == mine[0] and picked[1:] < mine[1:]:
+                        cur = submission_state(dat, cur["pos"] - 1)
+                    continue
+            else:
+                time.sleep(min(remain, config.judge.period))
+            datas.get_session().rollback()  # start a new snapshot, so the judge's later commits are visible
+            dat = datas.get_by_id(datas.Submission, dat_id)
+            cur = submission_state(dat)
+    finally:
+        if pubsub is not None:
+            pubsub.close()
+
+
+def reserved_workers() -> dict[objs.JudgeClass, int]:
+    """
+    Split the judge workers into the amount reserved for each judge class.
+
+    Shares are rounded down and granted in priority order until the workers run out.
+
+    Returns:
+        dict[objs.JudgeClass, int]: The number of reserved workers of each class.
+    """
+    remain = workers
+    out = {}
+    for judge_class in objs.JudgeClass:
+        share = max(getattr(config.judge, judge_class.name + "_reserved"), 0)
+        out[judge_class] = min(remain, workers * share // 100)
+        remain -= out[judge_class]
+    return out
+
+
+def pick_class(pending: set[objs.JudgeClass]) -> objs.JudgeClass | None:
+    """
+    Choose the class of the next submission to judge.
+
+    A class may take a free worker unless that worker is needed to honor the reservation
+    of another class which has pending submissions.
+
+    Args:
+        pending (set[objs.JudgeClass]): The classes which have pending submissions.
+
+    Returns:
+        objs.JudgeClass | None: The chosen class, or None if no worker can be used now.
+    """
+    with running_lock:
+        running = dict(running_count)
+    total = sum(running.values())
+    reserved = reserved_workers()
+    for judge_class in objs.JudgeClass:
+        if judge_class not in pending:
+            continue
+        held = sum(max(0, reserved[o] - running[o]) for o in pending if o is not judge_class)
+        if total + held < workers:
+            return judge_class
+    return None
+
+
+def finish(judge_class: objs.JudgeClass) -> None:
+    with running_lock:
+        running_count[judge_class] -= 1
+    slot_freed.set()
+
+
+def queue_stats() -> list[dict]:
+    """
+    Collect the state of the judge queue for each judge class.
+
+    Returns:
+        list[dict]: One entry per class with its pending count, running count,
+        reserved workers and the wait time of its oldest pending submission in seconds.
+    """
+    now = datetime.datetime.now()
+    reserved = reserved_workers()
+    pending = {o[0]: (o[1], o[2]) for o in datas.filter_by(datas.Submission, completed=False, running=False)
+               .with_entities(datas.Submission.priority, func.count(datas.Submission.id),
+                              func.min(datas.Submission.queued_at))
+               .group_by(datas.Submission.priority).all()}
+    running = {o[0]: o[1] for o in datas.filter_by(datas.Submission, completed=False, running=True)
+               .with_entities(datas.Submission.priority, func.count(datas.Submission.id))
+               .group_by(datas.Submission.priority).all()}
+    out = []
+    for judge_class in objs.JudgeClass:
+        cnt, oldest = pending.get(judge_class.value, (0, None))
+        out.append({
+            "name": judge_class.name,
+            "pending": cnt,
+            "running": running.get(judge_class.value, 0),
+            "reserved": reserved[judge_class],
+            "max_wait": int((now - oldest).total_seconds()) if oldest is not None else 0,
+        })
+    return out
 
 
 def runner(dat_id: int, pid: str):
@@ -399,49 +811,83 @@ def runner(dat_id: int, pid: str):
                 dat.completed = True
                 dat.running = False
                 datas.add(dat)
+        else:
+            if pid != "test":
+                # the verdict is already saved, a failure here must not turn it into JE
+                try:
+                    update_problem_status(dat_id)
+                except Exception as e:
+                    logger.error(f"failed to update the problem status of submission {dat_id}: {e}")
+                    logger.debug(traceback.format_exc())
+        try:
+            with datas.SessionContext():
+                save_submission_view(datas.get_by_id(datas.Submission, dat_id))
+        except Exception as e:
+            logger.warning(f"failed to save the view of submission {dat_id}: {e}")
+        notify_submission(dat_id)
 
 
 def queue_receiver():
     with app.app_context():
         while True:
             try:
-                dat_id = None
-                pid = None
+                slot_freed.clear()
+                picked = None
                 with datas.SessionContext():
-                    dat = datas.first(datas.Submission, completed=False, running=False)
-                    if dat is not None:
+                    heads = {}
+                    for judge_class in objs.JudgeClass:
+                        dat = (datas.filter_by(datas.Submission, completed=False, running=False,
+                                               priority=judge_class.value)
+                               .order_by(datas.Submission.queued_at, datas.Submission.id).first())
+                        if dat is not None:
+                            heads[judge_class] = dat
+                    judge_class = pick_class(set(heads))
+                    if judge_class is not None:
+                        dat = heads[judge_class]
                         dat.running = True
-                        dat_id = dat.id
-                        pid = dat.pid
+                        picked = (dat.id, dat.pid, judge_class, queue_key(dat))
                         datas.add(dat)
-                        last_judged.inc()
-                if dat_id is None:
-                    time.sleep(config.judge.period)
+                if picked is None:
+                    slot_freed.wait(config.judge.period)
                 else:
-                    executor.submit(runner, dat_id, pid)
+                    dat_id, pid, judge_class, key = picked
+                    notify_submission(dat_id)
+                    notify_queue(key)
+                    with running_lock:
+                        running_count[judge_class] += 1
+                    future = executor.submit(runner, dat_id, pid)
+                    future.add_done_callback(lambda _, c=judge_class: finish(c))
             except Exception as e:
                 logger.error(f"Error in queue receiver: {e}")
                 logger.debug(traceback.format_exc())
                 time.sleep(30)
 
 
-def enqueue(idx: int) -> int:
-    logger.info(f"enqueue {idx}")
-    return queue_position.inc()
+def enqueue(dat: datas.Submission, judge_class: objs.JudgeClass) -> None:
+    logger.info(f"enqueue {dat.id} as {judge_class.name}")
+    dat.priority = judge_class.value
+    dat.queued_at = datetime.datetime.now()
 
 
-def rejudge(dat: datas.Submission, msg: str = "wait system test"):
+def rejudge(dat: datas.Submission, msg: str = "wait system test",
+            judge_class: objs.JudgeClass = objs.JudgeClass.rejudge):
     dat.simple_result = msg
     dat.simple_result_flag = objs.TaskResult.PENDING.name
     dat.completed = False
     dat.running = False
-    dat.queue_position = enqueue(dat.id)
+    enqueue(dat, judge_class)
 
 
 def init():
     with datas.SessionContext():
         for submission in datas.get_all(datas.Submission, completed=False, running=True):
+            # interrupted mid-run: put it back in the queue at the place it already had
+            logger.info(f"requeue {submission.id}")
             submission.running = False
             datas.add(submission)
-            enqueue(submission.id)
+        for submission in datas.get_all(datas.Submission, completed=False, queued_at=None):
+            submission.queued_at = submission.time
+            datas.add(submission)
+    rebuild_problem_status()
+    rebuild_problem_summaries()
     threading.Thread(target=queue_receiver, daemon=True).start()
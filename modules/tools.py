@@ -17,6 +17,7 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import hashlib
 import io
 import json
 import os
@@ -130,7 +131,7 @@ def get_content(filename: str) -> str:
 
 
 def read(filepath: Path, n: int = -1) -> str:
-    with locks.Locker(filepath):
+    with locks.Locker(filepath, shared=True):
         with filepath.open() as f:
             return f.read(n)
 
@@ -138,7 +139,7 @@ def read(filepath: Path, n: int = -1) -> str:
 def read_default(filepath: Path, *, default: str = "") -> str:
     if not filepath.is_file():
         return default
-    with locks.Locker(filepath):
+    with locks.Locker(filepath, shared=True):
         return filepath.read_text()
 
 
@@ -166,7 +167,7 @@ def append(content: str, filename: Path) -> str:
 
 
 def read_json(filename: Path) -> dict:
-    with locks.Locker(filename):
+    with locks.Locker(filename, shared=True):
         with filename.open() as f:
             return json.load(f)
 
@@ -431,5 +432,22 @@ def delete(target: Path):
     target.unlink()
 
 
+def file_hash(filepath: Path) -> str:
+    """
+    Compute the SHA-256 hex digest of a file without loading it into memory.
+
+    Args:
+        filepath (Path): The path of the file.
+
+    Returns:
+        str: The hex digest.
+    """
+    h = hashlib.sha256()
+    with filepath.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
 def stop_server():
     os.killpg(os.getpgid(os.getpid()), signal.SIGTERM)
@@ -200,6 +200,31 @@ $(".countdown-timer").each(function () {
         }
     }, 500);
 });
+$(".submission-waiter").each(function () {
+    let idx = $(this).data("idx");
+    let state = "" + $(this).data("state");
+    let queued = +$(this).data("pos") > 0;
+    let loaded = (new Date()).getTime();
+    function reload_later() {
+        // reload at most once every 5 seconds, like the meta refresh this replaces
+        window.setTimeout(function () {
+            location.reload();
+        }, Math.max(0, loaded + 5000 - (new Date()).getTime()));
+    }
+    function wait() {
+        $.get("/api/submission/" + idx + "/wait", {"state": state}).done(function (res) {
+            let data = res.data;
+            if (!data.completed && queued && data.pos > 0) {
+                // only the queue moved: show the new position without reloading
+                if (data.state !== state) $(".submission-pos").text("In queue (" + data.pos + ")");
+                state = data.state;
+                window.setTimeout(wait, 1000);
+            } else if (data.state === state && !data.completed) wait();
+            else reload_later();
+        }).fail(reload_later);
+    }
+    wait();
+});
 $("select[data-value]").each(function () {
     let val = $(this).data("value");
     let vals = $(this).find('option').toArray().map(item => item.value)
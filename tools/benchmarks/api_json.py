@@ -0,0 +1,103 @@
+#!/bin/python3
+"""
+Benchmark serializing and compressing a large contest standings API response.
+
+Builds standings shaped like contests.get_standing, then compares marshalling with the flask-restx
+model plus stdlib json against skipping marshal and serializing with orjson, and prints the payload
+size and CPU time of gzip and brotli at the levels used by routers/api/base.compress_response.
+
+Usage: python3 tools/benchmarks/api_json.py [users] [problems] [submissions per user]
+"""
+import gzip
+import json
+import random
+import sys
+import time
+
+gzip_level = 5
+brotli_quality = 5
+
+
+def standings(users: int, problems: int, per_user: int) -> dict:
+    rng = random.Random(0)
+    pids = [chr(ord("A") + i % 26) + (str(i // 26) if i >= 26 else "") for i in range(problems)]
+    submissions = []
+    for u in range(users):
+        for _ in range(per_user):
+            scores = {f"group{g}": float(rng.choice((0, 10, 20))) for g in range(5)}
+            submissions.append({"user": f"user{u}", "pid": rng.choice(pids), "scores": scores,
+                                "total_score": sum(scores.values()), "time": 1.7e9 + rng.random() * 18000,
+                                "pretest": False, "per": 1})
+    return {"submissions": submissions, "rule": "icpc", "pids": pids, "penalty": 20,
+            "pers": [{"start_time": 1.7e9, "judging": False, "idx": 1}], "main_per": 1,
+            "participants": [f"user{u}" for u in range(users)], "virtual_participants": {}}
+
+
+def timed(func, repeat: int = 5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = func()
+        best = min(best, time.perf_counter() - start)
+    return out, best
+
+
+def marshal_model():
+    from flask_restx import Model, fields
+    return Model("Full", {
+        "status": fields.String,
+        "data": fields.Nested(Model("StandingOutput", {
+            "submissions": fields.List(fields.Nested(Model("StandingSubmission", {
+                "user": fields.String, "pid": fields.String, "time": fields.Float, "scores": fields.Raw,
+                "total_score": fields.Float, "pretest": fields.Boolean, "per": fields.Integer,
+            }))),
+            "rule": fields.String, "pids": fields.List(fields.String), "penalty": fields.Integer,
+            "pers": fields.List(fields.Nested(Model("StandingPeriod", {
+                "start_time": fields.Float, "judging": fields.Boolean, "idx": fields.Integer,
+            }))),
+            "main_per": fields.Integer, "participants": fields.List(fields.String),
+            "virtual_participants": fields.Raw,
+        })),
+    })
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    problems = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    per_user = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    data = {"status": "success", "data": standings(users, problems, per_user)}
+    print(f"{users} users, {problems} problems, {users * per_user} submissions")
+
+    try:
+        from flask_restx import marshal
+    except ImportError as e:
+        print(f"{'marshal + json':<24} skipped: {e}")
+    else:
+        model = marshal_model()
+        body, cost = timed(lambda: json.dumps(marshal(data, model)).encode())
+        print(f"{'marshal + json':<24} {cost * 1000:10.2f} ms {len(body):12d} bytes")
+    body, cost = timed(lambda: json.dumps(data).encode())
+    print(f"{'json':<24} {cost * 1000:10.2f} ms {len(body):12d} bytes")
+    try:
+        import orjson
+    except ImportError as e:
+        print(f"{'orjson':<24} skipped: {e}")
+    else:
+        body, cost = timed(lambda: orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS))
+        print(f"{'orjson':<24} {cost * 1000:10.2f} ms {len(body):12d} bytes")
+
+    packed, cost = timed(lambda: gzip.compress(body, compresslevel=gzip_level, mtime=0))
+    print(f"{'gzip ' + str(gzip_level):<24} {cost * 1000:10.2f} ms {len(packed):12d} bytes "
+          f"({len(packed) / len(body):.1%})")
+    try:
+        import brotli
+    except ImportError as e:
+        print(f"{'brotli':<24} skipped: {e}")
+    else:
+        packed, cost = timed(lambda: brotli.compress(body, quality=brotli_quality))
+        print(f"{'brotli ' + str(brotli_quality):<24} {cost * 1000:10.2f} ms {len(packed):12d} bytes "
+              f"({len(packed) / len(body):.1%})")
+
+
+if __name__ == '__main__':
+    main()
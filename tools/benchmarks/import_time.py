@@ -0,0 +1,67 @@
+#!/bin/python3
+"""
+Benchmark the startup work of importing main.py.
+
+Runs ``python -X importtime -c "import main"`` in a fresh interpreter, prints the total import
+time, the slowest modules by cumulative and self time, and whether the modules that should be
+deferred were imported. Then compares building the full pygments lexer table against the lazy
+lexer lookup used by createhtml.
+
+Usage: python3 tools/benchmarks/import_time.py [top]
+"""
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+root = Path(__file__).absolute().parent.parent.parent
+deferred = ("openpyxl", "pyzipper", "mistune", "markdown", "mdx_math")
+
+
+def import_times() -> list[tuple[int, int, str]]:
+    res = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=root,
+                         capture_output=True, text=True, env=os.environ | {"PYTHONDONTWRITEBYTECODE": "1"})
+    out = []
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        out.append((int(self_us), int(cumulative_us), name.rstrip()))
+    if res.returncode:
+        print(res.stderr.splitlines()[-1] if res.stderr else f"exit code {res.returncode}")
+    return out
+
+
+def main():
+    top = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    times = import_times()
+    total = sum(o[0] for o in times)
+    print(f"{len(times)} modules imported, {total / 1000:.1f} ms in total")
+    print("slowest by cumulative time:")
+    for self_us, cumulative_us, name in sorted(times, key=lambda o: -o[1])[:top]:
+        print(f"  {cumulative_us / 1000:10.1f} ms {name}")
+    print("slowest by self time:")
+    for self_us, cumulative_us, name in sorted(times, key=lambda o: -o[0])[:top]:
+        print(f"  {self_us / 1000:10.1f} ms {name.strip()}")
+    loaded = {o[2].strip() for o in times}
+    for name in deferred:
+        print(f"{name:<10} {'imported' if name in loaded else 'deferred'}")
+
+    from pygments import lexers
+    start = time.perf_counter()
+    table = {k: lexers.get_lexer_by_name(k) for lexer in lexers.get_all_lexers() for k in lexer[1]}
+    cost = time.perf_counter() - start
+    print(f"{'full lexer table (' + str(len(table)) + ' aliases)':<40} {cost * 1000:10.2f} ms")
+    sys.path.insert(0, str(root))
+    os.chdir(root)
+    from modules import createhtml
+    start = time.perf_counter()
+    createhtml.get_lexer("cpp")
+    createhtml.get_lexer("python")
+    cost = time.perf_counter() - start
+    print(f"{'lazy lookup of 2 lexers':<40} {cost * 1000:10.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/bin/python3
+"""
+Benchmark contest membership checks with 10k participants.
+
+Compares the legacy JSON list (deserialize ContestData + linear scan) against the
+indexed contest_participants table, and per-user lookups against one bulk query
+when importing participants.
+
+Usage: python3 tools/benchmarks/participants.py [participants] [lookups]
+"""
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+root = Path(__file__).absolute().parent.parent.parent
+sys.path.insert(0, str(root))
+os.chdir(tempfile.mkdtemp(prefix="orangejudge-bench-"))
+Path("data").mkdir()
+
+from modules import datas, objs  # noqa: E402
+
+
+def timeit(name: str, func, repeat: int):
+    start = time.perf_counter()
+    for i in range(repeat):
+        func(i)
+    cost = time.perf_counter() - start
+    print(f"{name:<40} {cost * 1000:10.2f} ms total, {cost / repeat * 1e6:10.2f} us/op")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    with datas.app.app_context():
+        datas.db.create_all()
+        with datas.SessionContext() as session:
+            users = [datas.User(username=f"user{i}", display_name=f"user{i}", email=f"user{i}@example.com",
+                                password_sha256_hex="0" * 64) for i in range(n)]
+            session.add_all(users)
+            session.flush()
+            legacy = objs.ContestData(name="bench")
+            legacy_data = objs.as_dict(legacy) | {"participants": [u.username for u in users]}
+            cdat = datas.Contest(cid="1", name="bench", user_id=users[0].id, data=legacy_data)
+            session.add(cdat)
+            session.flush()
+            session.add_all([datas.ContestParticipant(contest_id=cdat.id, user_id=u.id, is_virtual=False)
+                             for u in users])
+            session.flush()
+            targets = [users[(i * 7919) % n] for i in range(lookups)]
+
+            def legacy_check(i):
+                data = cdat.data
+                names = data["participants"]
+                info = objs.ContestData(**data)
+                return info.name and targets[i].username in names
+
+            def table_check(i):
+                return cdat.has_participant(targets[i].id)
+
+            timeit("legacy JSON list membership", legacy_check, lookups)
+            timeit("indexed table membership", table_check, lookups)
+            names = [u.username for u in users]
+
+            def per_user_import(_):
+                for name in names:
+                    datas.first(datas.User, username=name)
+
+            def bulk_import(_):
+                for i in range(0, len(names), 500):
+                    chunk = names[i:i + 500]
+                    datas.do_filter(datas.User, datas.User.username.in_(chunk)).with_entities(
+                        datas.User.username, datas.User.id).all()
+
+            timeit(f"import {n} users, per-user queries", per_user_import, 1)
+            timeit(f"import {n} users, bulk queries", bulk_import, 1)
+            session.rollback()
+
+
+if __name__ == '__main__':
+    main()
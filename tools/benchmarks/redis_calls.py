@@ -0,0 +1,100 @@
+#!/bin/python3
+"""
+Count the Redis round-trips of a request with a logged-in session.
+
+Compares the previous setup (flask_session with a separate client, flask-limiter checking the
+default limits on its own connection pool) against the pipelined session interface of
+modules.server, by counting the packets redis-py sends. Needs a Redis server at REDIS_HOST.
+
+Usage: python3 tools/benchmarks/redis_calls.py [requests]
+"""
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import redis
+
+root = Path(__file__).absolute().parent.parent.parent
+sys.path.insert(0, str(root))
+os.chdir(tempfile.mkdtemp(prefix="orangejudge-bench-"))
+Path("data").mkdir()
+
+sends = 0
+original_send = redis.connection.Connection.send_packed_command
+
+
+def counting_send(self, command, check_health=True):
+    global sends
+    sends += 1
+    return original_send(self, command, check_health)
+
+
+def legacy_app():
+    from datetime import timedelta
+
+    from flask import Flask
+    from flask_limiter import Limiter
+    from flask_limiter.util import get_remote_address
+    from flask_session import Session
+
+    redis_host = os.environ.get("REDIS_HOST", "localhost")
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = "bench"
+    app.config['SESSION_TYPE'] = "redis"
+    app.config['SESSION_USE_SIGNER'] = True
+    app.config['SESSION_REDIS'] = redis.StrictRedis(host=redis_host)
+    app.config['SESSION_KEY_PREFIX'] = 'session:'
+    app.config['SESSION_PERMANENT'] = True
+    app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(hours=12)
+    Session(app)
+    Limiter(get_remote_address, app=app, default_limits=["100000 per 30 second", "100000 per 1 second"],
+            storage_uri=f"redis://{redis_host}:6379", strategy="fixed-window", key_prefix="limiter:")
+    return app
+
+
+def pipelined_app():
+    from modules import server
+    server.default_limits = [server.limits.parse("100000 per 30 second"), server.limits.parse("100000 per 1 second")]
+    return server.app
+
+
+def measure(name: str, app, n: int):
+    global sends
+    from flask import session
+
+    @app.route("/bench_login")
+    def bench_login():
+        session["_user_id"] = "root"
+        return "ok"
+
+    @app.route("/bench")
+    def bench():
+        return session.get("_user_id", "")
+
+    client = app.test_client()
+    client.get("/bench_login")
+    client.get("/bench")
+    sends = 0
+    start = time.perf_counter()
+    for _ in range(n):
+        assert client.get("/bench").data == b"root"
+    cost = time.perf_counter() - start
+    print(f"{name:<12} {sends / n:6.2f} round-trips/request {cost / n * 1e6:10.1f} us/request")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    redis.connection.Connection.send_packed_command = counting_send
+    try:
+        app = legacy_app()
+    except ImportError as e:
+        print(f"legacy       skipped: {e}")
+    else:
+        measure("legacy", app, n)
+    measure("pipelined", pipelined_app(), n)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/bin/python3
+"""
+Load-test sync and gevent gunicorn workers with an I/O-bound endpoint.
+
+By default, starts gunicorn twice on a tiny WSGI app whose requests wait for ``delay`` ms, like a
+request waiting for the judger, Redis or a long-poll, once with sync workers and once with gevent
+workers, and prints requests/sec and latency percentiles of each. With ``--url``, load-tests a
+running server instead; restart it with the other ``server.worker_class`` to compare.
+
+Usage: python3 tools/benchmarks/worker_load.py [--url URL] [--workers 4] [--concurrency 64]
+                                               [--requests 2000] [--delay 50]
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+delay = int(os.environ.get("BENCH_DELAY_MS", "50")) / 1000
+
+
+def app(environ, start_response):
+    time.sleep(delay)
+    start_response("200 OK", [("Content-Type", "text/plain"), ("Content-Length", "2")])
+    return [b"ok"]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url: str, proc: subprocess.Popen, timeout: float = 30):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end and proc.poll() is None:
+        try:
+            urllib.request.urlopen(url, timeout=5).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server at {url} did not start")
+
+
+def load(url: str, concurrency: int, requests: int) -> tuple[float, list[float], int]:
+    def one(_):
+        start = time.perf_counter()
+        try:
+            urllib.request.urlopen(url, timeout=120).read()
+        except OSError:
+            return None
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    cost = time.perf_counter() - start
+    latencies = sorted(o for o in results if o is not None)
+    return cost, latencies, len(results) - len(latencies)
+
+
+def report(name: str, cost: float, latencies: list[float], errors: int):
+    if not latencies:
+        print(f"{name:<8} all requests failed")
+        return
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:<8} {len(latencies) / cost:10.1f} req/s  p50 {p50 * 1000:8.1f} ms  p99 {p99 * 1000:8.1f} ms  "
+          f"mean {statistics.fmean(latencies) * 1000:8.1f} ms  errors {errors}")
+
+
+def run_local(worker_class: str, args) -> None:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/"
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "-k", worker_class, "-w", str(args.workers),
+                             "--worker-connections", "1000", "-b", f"127.0.0.1:{port}",
+                             "--chdir", str(Path(__file__).absolute().parent), "worker_load:app"],
+                            env=os.environ | {"BENCH_DELAY_MS": str(args.delay)},
+                            stdout=subprocess.DEVNULL)
+    try:
+        wait_ready(url, proc)
+        report(worker_class, *load(url, args.concurrency, args.requests))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--delay", type=int, default=50)
+    args = parser.parse_args()
+    print(f"{args.requests} requests, concurrency {args.concurrency}")
+    if args.url:
+        report("server", *load(args.url, args.concurrency, args.requests))
+        return
+    print(f"{args.workers} workers, {args.delay} ms of I/O per request")
+    for worker_class in ("sync", "gevent"):
+        run_local(worker_class, args)
+
+
+if __name__ == '__main__':
+    main()
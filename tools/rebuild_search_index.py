@@ -0,0 +1,31 @@
+#!/bin/python3
+"""
+Rebuild the search index of problems, users and, if server.search_submissions is enabled, submissions.
+
+Usage: python3 tools/rebuild_search_index.py [problem|user|submission ...]
+"""
+import os
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+os.chdir(root)
+
+from modules import datas, search  # noqa: E402
+
+
+def main():
+    kinds = sys.argv[1:] or search.kinds
+    for kind in kinds:
+        if kind not in search.kinds:
+            print(f"unknown kind {kind!r}, expected one of {', '.join(search.kinds)}")
+            return
+    with datas.app.app_context():
+        for kind in kinds:
+            with datas.SessionContext():
+                cnt = search.rebuild(kind)
+            print(f"indexed {cnt} documents of kind {kind}")
+
+
+if __name__ == '__main__':
+    main()
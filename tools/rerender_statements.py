@@ -0,0 +1,30 @@
+#!/bin/python3
+"""
+Render again the problem statements whose source or renderer changed.
+
+Statements are rendered into the preparing folders; create a new version of a problem to publish them.
+
+Usage: python3 tools/rerender_statements.py [--force]
+"""
+import os
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+os.chdir(root)
+
+from modules import datas, problemsetting  # noqa: E402
+
+
+def main():
+    force = "--force" in sys.argv[1:]
+    with datas.app.app_context():
+        with datas.SessionContext():
+            rendered = problemsetting.rerender_statements(force)
+    for pid in rendered:
+        print(f"rendered {pid}")
+    print(f"{len(rendered)} statements rendered")
+
+
+if __name__ == '__main__':
+    main()